@@ -0,0 +1,242 @@
+import json
+import os
+import zlib
+
+import numpy as np
+import pandas as pd
+
+
+"""
+分钟线/日线列式存储
+- 按时间周期(默认按日)和代码分桶分区: date=YYYYMMDD/bucket=NN/part-XXXXX/
+- 每列一个文件: compression=None 时为 .npy (读取时内存映射), 'zlib' 时为压缩的 data.npz
+- index.json 记录每个分片的时间范围、代码和行数, 范围读取只打开相关分片
+"""
+
+
+INDEX_FILE = 'index.json'
+
+
+def code_bucket(code, n_buckets):
+    """Stable bucket number of a code"""
+    return zlib.crc32(str(code).encode('utf-8')) % n_buckets
+
+
+class BarStore:
+    """
+    行情列式存储
+    Partitioned columnar store of bars with fast (codes, start, end) range reads
+    """
+    def __init__(self, root, n_buckets=16, partition='D', compression='zlib', time_col=None):
+        """
+        root: store directory
+        n_buckets: number of code buckets per time partition
+        partition: pandas period frequency of time partitions ('D' for minute bars, 'M'/'Y' for daily bars)
+        compression: 'zlib' (compressed .npz per part) or None (.npy per column, memory-mapped on read).
+                     zlib parts are several times smaller, but every read decompresses each requested
+                     column of a touched part in full; uncompressed parts only page in the selected rows
+        time_col: timestamp column of written frames (default: 'time', 'datetime' or 'date', whichever exists)
+
+        An existing store keeps the settings recorded in its index.
+        """
+        self.root = root
+        self.index = self._load_index()
+        if self.index is None:
+            self.index = {
+                'n_buckets': n_buckets,
+                'partition': partition,
+                'compression': compression,
+                'time_col': time_col,
+                'columns': {},
+                'codes': [],
+                'parts': [],
+            }
+        self._code_ids = {code: i for i, code in enumerate(self.index['codes'])}
+
+    # ------------------------------------------------------------ index
+
+    def _load_index(self):
+        path = os.path.join(self.root, INDEX_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def _save_index(self):
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, INDEX_FILE)
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.index, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def _encode_codes(self, codes):
+        for code in pd.unique(codes):
+            if code not in self._code_ids:
+                self._code_ids[code] = len(self.index['codes'])
+                self.index['codes'].append(code)
+        return np.array([self._code_ids[c] for c in codes], dtype=np.int32)
+
+    def _time_col(self, df):
+        if self.index['time_col'] is None:
+            for col in ('time', 'datetime', 'date'):
+                if col in df.columns:
+                    self.index['time_col'] = col
+                    break
+            else:
+                raise KeyError("No time column found, pass time_col")
+        return self.index['time_col']
+
+    # ------------------------------------------------------------ write
+
+    def write(self, df):
+        """
+        Append bars to the store
+        df: frame with 'code', the time column and numeric columns
+        """
+        time_col = self._time_col(df)
+        df = df.reset_index(drop=True)
+        times = pd.to_datetime(df[time_col])
+        columns = [col for col in df.columns if col not in ('code', time_col)]
+        for col in columns:
+            dtype = np.asarray(df[col]).dtype
+            if dtype.kind not in 'biuf':
+                raise TypeError(f"Column {col} has non-numeric dtype {dtype}, drop or encode it before writing")
+            dtype = str(dtype)
+            if self.index['columns'].setdefault(col, dtype) != dtype:
+                raise TypeError(f"Column {col} is {dtype}, store has {self.index['columns'][col]}")
+
+        code_ids = self._encode_codes(df['code'].values)
+        periods = times.dt.to_period(self.index['partition']).astype(str).values
+        buckets = np.array([code_bucket(c, self.index['n_buckets']) for c in self.index['codes']])[code_ids]
+        keys = pd.DataFrame({'period': periods, 'bucket': buckets})
+
+        for (period, bucket), rows in keys.groupby(['period', 'bucket'], sort=True).indices.items():
+            # 分片内按 (代码, 时间) 排序, 读取时可以二分查找
+            part_time = times.values[rows].astype('datetime64[ns]').view(np.int64)
+            part_codes = code_ids[rows]
+            order = np.lexsort((part_time, part_codes))
+            rows = rows[order]
+            arrays = {'time': part_time[order], 'code': part_codes[order]}
+            for col in columns:
+                arrays[col] = np.asarray(df[col].values[rows])
+            self._write_part(period, int(bucket), arrays)
+        self._save_index()
+
+    def _write_part(self, period, bucket, arrays):
+        part_dir = os.path.join(f"date={period.replace('-', '')}", f'bucket={bucket:02d}')
+        existing = sum(1 for p in self.index['parts'] if os.path.dirname(p['path']) == part_dir)
+        rel_path = os.path.join(part_dir, f'part-{existing:05d}')
+        path = os.path.join(self.root, rel_path)
+        os.makedirs(path, exist_ok=True)
+        if self.index['compression'] == 'zlib':
+            np.savez_compressed(os.path.join(path, 'data.npz'), **arrays)
+        else:
+            for col, values in arrays.items():
+                np.save(os.path.join(path, f'{col}.npy'), values)
+        self.index['parts'].append({
+            'path': rel_path,
+            'period': period,
+            'bucket': bucket,
+            'rows': int(len(arrays['time'])),
+            'start': int(arrays['time'].min()),
+            'end': int(arrays['time'].max()),
+            'codes': sorted(int(c) for c in np.unique(arrays['code'])),
+        })
+
+    # ------------------------------------------------------------ read
+
+    def _load_part(self, part, columns):
+        path = os.path.join(self.root, part['path'])
+        if self.index['compression'] == 'zlib':
+            with np.load(os.path.join(path, 'data.npz')) as data:
+                return {col: data[col] for col in columns}
+        return {col: np.load(os.path.join(path, f'{col}.npy'), mmap_mode='r') for col in columns}
+
+    @staticmethod
+    def _part_rows(part, codes, times, wanted, start_ns, end_ns):
+        """Row positions of the wanted codes within [start_ns, end_ns], by binary search on the part's (code, time) order"""
+        present = np.array(part['codes'], dtype=codes.dtype)
+        if wanted is not None:
+            present = present[np.isin(present, wanted)]
+        lo = np.searchsorted(codes, present, side='left')
+        hi = np.searchsorted(codes, present, side='right')
+        if start_ns is not None or end_ns is not None:
+            # 每只代码的一段内时间有序, 再二分出时间范围
+            for i in range(len(present)):
+                run = times[lo[i]:hi[i]]
+                first = np.searchsorted(run, start_ns, side='left') if start_ns is not None else 0
+                last = np.searchsorted(run, end_ns, side='right') if end_ns is not None else len(run)
+                lo[i], hi[i] = lo[i] + first, lo[i] + max(last, first)
+        lengths = hi - lo
+        offsets = np.cumsum(lengths) - lengths
+        return np.arange(lengths.sum()) - np.repeat(offsets - lo, lengths)
+
+    def read(self, codes=None, start=None, end=None, columns=None):
+        """
+        Bars of the given codes in [start, end]
+        codes: code or list of codes (default: all)
+        start / end: inclusive time bounds (default: unbounded)
+        columns: value columns to load (default: all)
+        """
+        time_col = self.index['time_col'] or 'time'
+        columns = list(self.index['columns']) if columns is None else list(columns)
+        start_ns = pd.Timestamp(start).value if start is not None else None
+        end_ns = pd.Timestamp(end).value if end is not None else None
+
+        wanted = None
+        if codes is not None:
+            codes = [codes] if isinstance(codes, str) else list(codes)
+            wanted = np.array([self._code_ids[c] for c in codes if c in self._code_ids], dtype=np.int32)
+
+        pieces = []
+        for part in self.index['parts']:
+            if start_ns is not None and part['end'] < start_ns:
+                continue
+            if end_ns is not None and part['start'] > end_ns:
+                continue
+            if wanted is not None and not np.isin(wanted, part['codes']).any():
+                continue
+
+            data = self._load_part(part, ['time', 'code'] + columns)
+            rows = self._part_rows(part, data['code'], data['time'], wanted, start_ns, end_ns)
+            if len(rows):
+                pieces.append({col: np.asarray(values[rows]) for col, values in data.items()})
+
+        all_codes = np.array(self.index['codes'], dtype=object)
+        if not pieces:
+            empty = {'code': [], time_col: pd.to_datetime([])}
+            empty.update({col: np.array([], dtype=self.index['columns'][col]) for col in columns})
+            return pd.DataFrame(empty)
+
+        merged = {col: np.concatenate([p[col] for p in pieces]) for col in pieces[0]}
+        order = np.lexsort((merged['time'], merged['code']))
+        result = {'code': all_codes[merged['code'][order]], time_col: merged['time'][order].astype('datetime64[ns]')}
+        for col in columns:
+            result[col] = merged[col][order]
+        return pd.DataFrame(result)
+
+    def read_resampled(self, codes, start, end, time_frequency):
+        """
+        Read a range and aggregate it to a coarser bar frequency per code (e.g. 1m -> 30min)
+        Uses the same OHLC rules as transfer_price_frequency.
+        """
+        time_col = self.index['time_col'] or 'time'
+        bars = self.read(codes, start, end)
+        agg = {'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last'}
+        for col in ('volume', 'money', 'amount'):
+            if col in bars.columns:
+                agg[col] = 'sum'
+        agg = {col: how for col, how in agg.items() if col in bars.columns}
+        resampled = bars.set_index(time_col).groupby('code').resample(time_frequency).agg(agg)
+        return resampled.dropna(subset=['close']).reset_index()
+
+    def summary(self):
+        """Rows, codes and time range per partition"""
+        parts = pd.DataFrame(self.index['parts'])
+        if parts.empty:
+            return parts
+        parts['start'] = pd.to_datetime(parts['start'])
+        parts['end'] = pd.to_datetime(parts['end'])
+        parts['n_codes'] = parts['codes'].apply(len)
+        return parts.drop(columns=['codes'])
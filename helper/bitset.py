@@ -0,0 +1,328 @@
+import json
+import os
+import struct
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from .trading_calendar import TradingCalendar
+
+
+"""
+信号事件位图
+- 每条规则 (如 j_turns_negative、above_ma20、D1) 存为 代码 x 交易日 的位图, 每个交易日1位, 按 uint64 字打包
+- 规则组合 (&, |, ^, ~) 是整字的按位运算; shift(k) 把事件向后平移k个交易日 (前一日的事件对齐到当日),
+  within(k) 表示最近k个交易日内发生过, 都不需要回到 DataFrame
+- 同一批位图共享代码表和交易日历, BitmapStore 中每个位图单独 zlib 压缩保存
+  (事件稀疏, 压缩后通常只有几百字节), 上千个参数变体的事件集合可以同时留在内存中
+- 位按交易日序号排列: 停牌日没有K线, 对应位始终为0; shift 按交易日而不是按行平移
+"""
+
+
+_MAGIC = b'QTBITS1\n'
+
+
+def _popcount(words):
+    if hasattr(np, 'bitwise_count'):
+        return int(np.bitwise_count(words).sum())
+    return int(np.unpackbits(words.view(np.uint8)).sum())
+
+
+class SignalBitmap:
+    """
+    信号位图
+    Set of (code, trading day) events packed into uint64 words, one row of words per code
+    """
+    def __init__(self, words, codes, calendar):
+        """
+        words: uint64 array of shape (len(codes), ceil(len(calendar) / 64)), bit t%64 of word t//64 is day t
+        codes: pd.Index of codes (row order)
+        calendar: TradingCalendar (bit order)
+        """
+        self.words = words
+        self.codes = codes
+        self.calendar = calendar
+
+    @property
+    def n_days(self):
+        return len(self.calendar)
+
+    @classmethod
+    def empty(cls, codes, calendar):
+        n_words = (len(calendar) + 63) // 64
+        return cls(np.zeros((len(codes), n_words), dtype=np.uint64), pd.Index(codes), calendar)
+
+    @classmethod
+    def from_mask(cls, df, mask, codes=None, calendar=None, date_col='date'):
+        """
+        Bitmap of the rows where mask is True
+        df: long frame with 'code' and date_col
+        mask: boolean array aligned with df
+        codes, calendar: share them with other bitmaps (default: built from df)
+        """
+        codes = pd.Index(np.sort(pd.unique(df['code'].values))) if codes is None else pd.Index(codes)
+        calendar = TradingCalendar.from_data(df, date_col) if calendar is None else calendar
+        mask = np.asarray(mask, dtype=bool)
+        code_ids = codes.get_indexer(df['code'].values[mask])
+        ordinals = calendar.ordinal(df[date_col].values[mask])
+        keep = (code_ids >= 0) & (ordinals >= 0)
+        n_words = (len(calendar) + 63) // 64
+        grid = np.zeros((len(codes), n_words * 64), dtype=bool)
+        grid[code_ids[keep], ordinals[keep]] = True
+        return cls._from_grid(grid, codes, calendar)
+
+    @classmethod
+    def _from_grid(cls, grid, codes, calendar):
+        packed = np.packbits(grid, axis=1, bitorder='little')
+        return cls(np.ascontiguousarray(packed).view('<u8').astype(np.uint64, copy=False), codes, calendar)
+
+    def to_grid(self):
+        """Dense (code x trading day) boolean array"""
+        grid = np.unpackbits(self.words.astype('<u8').view(np.uint8), axis=1, bitorder='little')
+        return grid[:, :self.n_days].astype(bool)
+
+    def _tail_mask(self):
+        """Valid-bit mask of the last word (bits beyond the calendar are always 0)"""
+        bits = self.n_days - 64 * (self.words.shape[1] - 1)
+        return np.uint64(0xFFFFFFFFFFFFFFFF) if bits == 64 else np.uint64((1 << bits) - 1)
+
+    def _like(self, words):
+        return SignalBitmap(words, self.codes, self.calendar)
+
+    def _check(self, other):
+        if other.codes is not self.codes and not (len(other.codes) == len(self.codes) and other.codes.equals(self.codes)):
+            raise ValueError("Bitmaps have different code tables")
+        if other.calendar is not self.calendar and other.n_days != self.n_days:
+            raise ValueError("Bitmaps have different calendars")
+
+    # ------------------------------------------------------------ algebra
+
+    def __and__(self, other):
+        self._check(other)
+        return self._like(self.words & other.words)
+
+    def __or__(self, other):
+        self._check(other)
+        return self._like(self.words | other.words)
+
+    def __xor__(self, other):
+        self._check(other)
+        return self._like(self.words ^ other.words)
+
+    def __invert__(self):
+        words = ~self.words
+        if words.shape[1]:
+            words[:, -1] &= self._tail_mask()
+        return self._like(words)
+
+    def andnot(self, other):
+        """Events of self that are not in other"""
+        self._check(other)
+        return self._like(self.words & ~other.words)
+
+    def shift(self, k):
+        """
+        Move every event k trading days later (k < 0: earlier)
+        shift(1) & x: x today and the event yesterday
+        """
+        if k == 0:
+            return self._like(self.words.copy())
+        n_words = self.words.shape[1]
+        whole, part = divmod(abs(k), 64)
+        out = np.zeros_like(self.words)
+        if whole >= n_words:
+            return self._like(out)
+        part = np.uint64(part)
+        if k > 0:
+            src = self.words[:, :n_words - whole]
+            out[:, whole:] = src << part
+            if part:
+                out[:, whole + 1:] |= src[:, :-1] >> (np.uint64(64) - part)
+            out[:, -1] &= self._tail_mask()
+        else:
+            src = self.words[:, whole:]
+            out[:, :n_words - whole] = src >> part
+            if part:
+                out[:, :n_words - whole - 1] |= src[:, 1:] << (np.uint64(64) - part)
+        return self._like(out)
+
+    def within(self, k):
+        """Days on which the event happened in the last k+1 trading days (today included)"""
+        result, cover = self, 1
+        # 倍增: 每次 OR 上平移后的自身, 覆盖的窗口翻倍
+        while cover < k + 1:
+            step = min(cover, k + 1 - cover)
+            result = result | result.shift(step)
+            cover += step
+        return result
+
+    # ------------------------------------------------------------ queries
+
+    def count(self):
+        """Number of events"""
+        return _popcount(self.words)
+
+    def counts_by_date(self):
+        """Events per trading day"""
+        return pd.Series(self.to_grid().sum(axis=0), index=self.calendar.dates)
+
+    def counts_by_code(self):
+        """Events per code"""
+        if hasattr(np, 'bitwise_count'):
+            counts = np.bitwise_count(self.words).sum(axis=1)
+        else:
+            counts = self.to_grid().sum(axis=1)
+        return pd.Series(counts, index=self.codes)
+
+    def contains(self, codes, dates):
+        """Boolean array: is there an event at each (code, date)"""
+        code_ids = self.codes.get_indexer(np.asarray(codes, dtype=object))
+        ordinals = self.calendar.ordinal(dates)
+        ok = (code_ids >= 0) & (ordinals >= 0)
+        safe_ord = np.where(ok, ordinals, 0)
+        words = self.words[np.where(ok, code_ids, 0), safe_ord >> 6]
+        bits = (words >> (safe_ord & 63).astype(np.uint64)) & np.uint64(1)
+        return ok & (bits == 1)
+
+    def to_mask(self, df, date_col='date'):
+        """Boolean mask aligned with the rows of df"""
+        return self.contains(df['code'].values, df[date_col].values)
+
+    def to_frame(self):
+        """(code, date) of every event, sorted by code and date"""
+        code_ids, ordinals = np.nonzero(self.to_grid())
+        return pd.DataFrame({'code': self.codes.values[code_ids], 'date': self.calendar.date(ordinals)})
+
+    @property
+    def nbytes(self):
+        return self.words.nbytes
+
+    # ------------------------------------------------------------ serialization
+
+    def compress(self, level=6):
+        """zlib-compressed words (codes and calendar are stored by the owner, see BitmapStore)"""
+        return zlib.compress(self.words.astype('<u8').tobytes(), level)
+
+    @classmethod
+    def decompress(cls, blob, codes, calendar):
+        n_words = (len(calendar) + 63) // 64
+        words = np.frombuffer(zlib.decompress(blob), dtype='<u8').astype(np.uint64).reshape(len(codes), n_words)
+        return cls(words, codes, calendar)
+
+
+class BitmapStore:
+    """
+    位图集合
+    Named SignalBitmaps over one code table and calendar, kept zlib-compressed in memory and on disk
+    """
+    def __init__(self, codes, calendar, level=6):
+        """
+        codes: code table shared by every bitmap
+        calendar: TradingCalendar shared by every bitmap
+        level: zlib compression level
+        """
+        self.codes = pd.Index(codes)
+        self.calendar = calendar
+        self.level = level
+        self._blobs = {}
+
+    @classmethod
+    def from_data(cls, df, date_col='date', level=6):
+        """Empty store over the codes and trading days of a frame"""
+        codes = np.sort(pd.unique(df['code'].values))
+        return cls(codes, TradingCalendar.from_data(df, date_col), level)
+
+    def add_mask(self, name, df, mask, date_col='date'):
+        """Store the rows of df where mask is True as bitmap `name`"""
+        bitmap = SignalBitmap.from_mask(df, mask, self.codes, self.calendar, date_col)
+        self[name] = bitmap
+        return bitmap
+
+    def __setitem__(self, name, bitmap):
+        if bitmap.codes is not self.codes and not bitmap.codes.equals(self.codes):
+            raise ValueError("Bitmap code table differs from the store")
+        if bitmap.n_days != len(self.calendar):
+            raise ValueError("Bitmap calendar differs from the store")
+        self._blobs[name] = bitmap.compress(self.level)
+
+    def __getitem__(self, name):
+        return SignalBitmap.decompress(self._blobs[name], self.codes, self.calendar)
+
+    def __contains__(self, name):
+        return name in self._blobs
+
+    def __len__(self):
+        return len(self._blobs)
+
+    def __iter__(self):
+        return iter(self._blobs)
+
+    def __delitem__(self, name):
+        del self._blobs[name]
+
+    @property
+    def nbytes(self):
+        """Compressed size of all bitmaps"""
+        return sum(len(blob) for blob in self._blobs.values())
+
+    def counts(self):
+        """Event count of every bitmap"""
+        return pd.Series({name: self[name].count() for name in self._blobs}, dtype=np.int64)
+
+    def save(self, path):
+        """
+        Single-file layout: magic, header length, JSON header (codes, trading days, blob sizes), blobs
+        """
+        names = list(self._blobs)
+        header = json.dumps({
+            'codes': [str(code) for code in self.codes],
+            'days': self.calendar.dates.strftime('%Y-%m-%d').tolist(),
+            'names': names,
+            'sizes': [len(self._blobs[name]) for name in names],
+            'level': self.level,
+        }, ensure_ascii=False).encode('utf-8')
+        tmp = f'{path}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(_MAGIC)
+            f.write(struct.pack('<Q', len(header)))
+            f.write(header)
+            for name in names:
+                f.write(self._blobs[name])
+        # 先写临时文件再替换, 中断不会留下半个文件
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            if f.read(len(_MAGIC)) != _MAGIC:
+                raise ValueError(f"Not a bitmap store: {path}")
+            (length,) = struct.unpack('<Q', f.read(8))
+            header = json.loads(f.read(length).decode('utf-8'))
+            store = cls(header['codes'], TradingCalendar(header['days']), header['level'])
+            for name, size in zip(header['names'], header['sizes']):
+                store._blobs[name] = f.read(size)
+        return store
+
+
+def event_bitmaps(df, ma_types=('ma5', 'ma20', 'ma60'), store=None):
+    """
+    Bitmaps of the strategy events of a prepared frame
+    - above_<ma>: close above the MA
+    - j_turns_negative / j_turns_positive
+    - D1_<ma>: above_<ma> & j_turns_negative
+
+    returns:
+        BitmapStore
+    """
+    if store is None:
+        store = BitmapStore.from_data(df)
+    prev_j = df.groupby('code')['kdj_j'].shift(1).values
+    j = df['kdj_j'].values
+    store.add_mask('j_turns_negative', df, (j < 0) & (prev_j >= 0))
+    store.add_mask('j_turns_positive', df, (j >= 0) & (prev_j < 0))
+    negative = store['j_turns_negative']
+    for ma_type in ma_types:
+        above = store.add_mask(f'above_{ma_type}', df, df['close'].values > df[ma_type].values)
+        store[f'D1_{ma_type}'] = above & negative
+    return store
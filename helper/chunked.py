@@ -0,0 +1,235 @@
+import os
+import shutil
+import tempfile
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from .bar_store import BarStore
+
+
+"""
+超内存数据的分块计算
+- 指标按代码独立计算, 各代码块之间没有共享状态
+- 第一遍只读 code 列统计每只股票的行数; 用一小块样本实测 prepare_data 每行的峰值内存
+- 按内存预算把代码分组, 第二遍把数据源 (CSV 或 BarStore 的分片) 按组落盘, 再逐组计算指标并增量写入列式存储 (BarStore)
+- 任意时刻内存中只有一个代码组, 峰值内存由预算决定, 与总数据量无关
+"""
+
+
+def _count_rows(source, chunksize):
+    """Rows per code without loading the data"""
+    if isinstance(source, BarStore):
+        counts = np.zeros(len(source.index['codes']), dtype=np.int64)
+        for part in source.index['parts']:
+            codes = source._load_part(part, ['code'])['code']
+            counts += np.bincount(codes, minlength=len(counts))
+        return pd.Series(counts, index=source.index['codes'])
+    counts = pd.Series(dtype=np.int64)
+    for chunk in pd.read_csv(source, usecols=['code'], chunksize=chunksize):
+        counts = counts.add(chunk['code'].value_counts(), fill_value=0)
+    return counts.astype(np.int64).sort_index()
+
+
+def _drop_index_columns(df):
+    """Drop the unnamed index column written by DataFrame.to_csv"""
+    return df.loc[:, ~df.columns.str.startswith('Unnamed')]
+
+
+def _read_codes(source, codes, chunksize):
+    """Rows of the given codes, sorted by code and date"""
+    if isinstance(source, BarStore):
+        df = source.read(codes=codes)
+        time_col = source.index['time_col'] or 'time'
+        return df.rename(columns={time_col: 'date'})
+    wanted = set(codes)
+    chunks = [_drop_index_columns(chunk[chunk['code'].isin(wanted)]) for chunk in pd.read_csv(source, chunksize=chunksize)]
+    df = pd.concat(chunks, ignore_index=True)
+    df['date'] = pd.to_datetime(df['date'])
+    return df.sort_values(['code', 'date'], ignore_index=True)
+
+
+def measure_row_bytes(strategy, sample):
+    """Peak bytes allocated per input row while running strategy.prepare_data on a sample"""
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        prepared = strategy.prepare_data(sample)
+        peak = tracemalloc.get_traced_memory()[1] - base
+    finally:
+        if started:
+            tracemalloc.stop()
+    return max(peak, 1) / max(len(sample), 1), prepared
+
+
+def plan_chunks(row_counts, rows_per_chunk):
+    """Greedy code groups of at most rows_per_chunk rows (a larger single code gets its own group)"""
+    groups, current, size = [], [], 0
+    for code, rows in row_counts.items():
+        if current and size + rows > rows_per_chunk:
+            groups.append(current)
+            current, size = [], 0
+        current.append(code)
+        size += rows
+    if current:
+        groups.append(current)
+    return groups
+
+
+def _spill_csv(path, groups, spill_dir, chunksize):
+    """One pass over the CSV appending each row to its code group's file"""
+    group_of = {code: g for g, codes in enumerate(groups) for code in codes}
+    paths = [os.path.join(spill_dir, f'group-{g:05d}.csv') for g in range(len(groups))]
+    written = set()
+    for chunk in pd.read_csv(path, chunksize=chunksize):
+        chunk = _drop_index_columns(chunk)
+        group_ids = chunk['code'].map(group_of)
+        for g, rows in chunk.groupby(group_ids, sort=False):
+            g = int(g)
+            rows.to_csv(paths[g], mode='a', header=g not in written, index=False)
+            written.add(g)
+    return paths
+
+
+def _spill_store(store, groups, spill_dir):
+    """One pass over the BarStore parts saving each part's rows of every code group as an .npz piece"""
+    group_of = np.full(len(store.index['codes']), -1, dtype=np.int64)
+    for g, codes in enumerate(groups):
+        group_of[[store._code_ids[code] for code in codes]] = g
+    columns = ['time', 'code'] + list(store.index['columns'])
+    paths = [[] for _ in groups]
+    for k, part in enumerate(store.index['parts']):
+        if not (group_of[part['codes']] >= 0).any():
+            continue
+        data = store._load_part(part, columns)
+        group_ids = group_of[data['code']]
+        for g in np.unique(group_ids[group_ids >= 0]):
+            path = os.path.join(spill_dir, f'group-{g:05d}-{k:05d}.npz')
+            rows = group_ids == g
+            np.savez(path, **{col: np.asarray(values[rows]) for col, values in data.items()})
+            paths[g].append(path)
+    return paths
+
+
+def _read_spilled_store(store, paths):
+    """Rows of one spilled code group, in the same layout and order as _read_codes on the store"""
+    pieces = []
+    for path in paths:
+        with np.load(path) as data:
+            pieces.append({col: data[col] for col in data.files})
+    merged = {col: np.concatenate([p[col] for p in pieces]) for col in pieces[0]}
+    order = np.lexsort((merged['time'], merged['code']))
+    all_codes = np.array(store.index['codes'], dtype=object)
+    df = pd.DataFrame({'code': all_codes[merged['code'][order]], 'date': merged['time'][order].astype('datetime64[ns]')})
+    for col in store.index['columns']:
+        df[col] = merged[col][order]
+    return df
+
+
+def _iter_groups(source, groups, spill_dir, chunksize):
+    """
+    Yield the rows of each code group, after a single pass over the source
+    CSV rows are spilled to one CSV per group, BarStore parts to .npz pieces per group,
+    so the source is read once however many groups there are
+    """
+    if isinstance(source, BarStore):
+        for paths in _spill_store(source, groups, spill_dir):
+            yield _read_spilled_store(source, paths)
+        return
+    for path in _spill_csv(source, groups, spill_dir, chunksize):
+        df = pd.read_csv(path)
+        df['date'] = pd.to_datetime(df['date'])
+        yield df.sort_values(['code', 'date'], ignore_index=True)
+
+
+def prepare_out_of_core(source,
+                        strategy,
+                        store,
+                        memory_budget_mb=512,
+                        chunksize=200000,
+                        sample_codes=2,
+                        spill_dir=None):
+    """
+    Run strategy.prepare_data over data larger than memory, code group by code group
+    source: price CSV path or BarStore with a 'date' time column
+    store: BarStore (or directory for a new one, partitioned by year) receiving the prepared frames
+    memory_budget_mb: peak memory allowed for one code group
+    chunksize: CSV rows parsed at a time
+    sample_codes: codes used to measure prepare_data's memory per row
+    spill_dir: directory for the per-group spill files (default: a temporary directory)
+
+    returns:
+        summary dict (groups, rows, measured bytes per row, rows per group)
+    """
+    if not isinstance(store, BarStore):
+        store = BarStore(store, partition='Y', time_col='date')
+    row_counts = _count_rows(source, chunksize)
+    row_counts = row_counts[row_counts > 0]
+    if row_counts.empty:
+        raise ValueError("No rows in source")
+
+    # 用前几只股票实测每行内存, 再按预算换算每组行数
+    sample_group = list(row_counts.index[:sample_codes])
+    sample = _read_codes(source, sample_group, chunksize)
+    row_bytes, sample_prepared = measure_row_bytes(strategy, sample)
+    budget = memory_budget_mb * 1024 ** 2
+    rows_per_chunk = max(int(budget / row_bytes), 1)
+    groups = plan_chunks(row_counts.drop(sample_group), rows_per_chunk)
+
+    def write(prepared):
+        # 各组独立推断类型 (整数列在有缺失的组里会变成浮点), 统一存为 float64
+        numeric = [col for col in prepared.columns
+                   if col not in ('code', 'date') and pd.api.types.is_numeric_dtype(prepared[col])]
+        store.write(prepared[['code', 'date'] + numeric].astype({col: np.float64 for col in numeric}))
+
+    write(sample_prepared)
+    del sample, sample_prepared
+
+    own_spill = spill_dir is None
+    if own_spill:
+        spill_dir = tempfile.mkdtemp(prefix='qt_chunks_')
+    try:
+        for df in _iter_groups(source, groups, spill_dir, chunksize):
+            write(strategy.prepare_data(df))
+            del df
+    finally:
+        if own_spill:
+            shutil.rmtree(spill_dir, ignore_errors=True)
+
+    return {
+        'groups': len(groups) + bool(sample_group),
+        'rows': int(row_counts.sum()),
+        'codes': len(row_counts),
+        'row_bytes': row_bytes,
+        'rows_per_group': rows_per_chunk,
+    }
+
+
+def find_signals_out_of_core(store, strategy, ma_type, memory_budget_mb=512, row_bytes=None, spill_dir=None):
+    """
+    find_trading_signals over a prepared BarStore, one code group at a time
+    row_bytes: memory per row (default: 8 bytes per stored column, times 6 for working copies)
+    spill_dir: directory for the per-group pieces (default: a temporary directory)
+    """
+    row_counts = _count_rows(store, None)
+    row_counts = row_counts[row_counts > 0]
+    if row_bytes is None:
+        row_bytes = 8 * (len(store.index['columns']) + 2) * 6
+    groups = plan_chunks(row_counts, max(int(memory_budget_mb * 1024 ** 2 / row_bytes), 1))
+    signals = []
+    own_spill = spill_dir is None
+    if own_spill:
+        spill_dir = tempfile.mkdtemp(prefix='qt_chunks_')
+    try:
+        for prepared in _iter_groups(store, groups, spill_dir, None):
+            found = strategy.find_trading_signals(prepared, ma_type=ma_type)
+            if not found.empty:
+                signals.append(found)
+    finally:
+        if own_spill:
+            shutil.rmtree(spill_dir, ignore_errors=True)
+    return pd.concat(signals, ignore_index=True) if signals else pd.DataFrame()
@@ -0,0 +1,175 @@
+import os
+import numpy as np
+import pandas as pd
+
+
+"""
+紧凑存储模式
+- 指标列以float32存储 (计算仍在float64中完成, 只在最后降精度)
+- code列转换为category或int32编码
+- 布尔信号列按位打包 (np.packbits), 每行1bit; compact=True 的策略直接用打包的列求D1/D2, 不在表上新增布尔列
+- validate_compact 对比float64与紧凑模式的信号集合
+"""
+
+
+INDICATOR_COLUMNS = [
+    'ma5', 'ma20', 'ma60',
+    'kdj_k', 'kdj_d', 'kdj_j',
+    'wr_14', 'wr_28',
+    'macd_dif', 'macd_dea', 'macd',
+    'boll_mid_20', 'boll_upper_20', 'boll_lower_20',
+]
+
+
+def compact_frame(df, indicator_columns=None, code_as='category'):
+    """
+    Downcast a prepared frame for storage
+    indicator_columns: columns stored as float32 (default: INDICATOR_COLUMNS present in df)
+    code_as: 'category' (pandas categorical) or 'int' (int32 ids, categories kept in df.attrs['code_categories'])
+    """
+    df = df.copy()
+    if indicator_columns is None:
+        indicator_columns = [col for col in INDICATOR_COLUMNS if col in df.columns]
+    for col in indicator_columns:
+        df[col] = df[col].astype(np.float32)
+
+    if code_as == 'category':
+        df['code'] = df['code'].astype('category')
+    elif code_as == 'int':
+        codes, categories = pd.factorize(df['code'], sort=True)
+        df['code'] = codes.astype(np.int32)
+        df.attrs['code_categories'] = list(categories)
+    else:
+        raise ValueError(f"Unknown code encoding: {code_as}")
+    return df
+
+
+class PackedSignals:
+    """
+    按位打包的布尔信号列
+    Each column is stored as np.packbits output, 1 bit per row
+    """
+    def __init__(self, length, index=None):
+        self.length = length
+        self.index = index
+        self.bits = {}
+
+    def add(self, name, mask):
+        """Pack a boolean column"""
+        mask = np.asarray(mask, dtype=bool)
+        if len(mask) != self.length:
+            raise ValueError(f"Signal {name} has {len(mask)} rows, expected {self.length}")
+        self.bits[name] = np.packbits(mask)
+
+    def unpack(self, name):
+        """Boolean array for one column"""
+        return np.unpackbits(self.bits[name], count=self.length).astype(bool)
+
+    def combine(self, *names):
+        """Logical AND of several columns, evaluated on the packed bytes"""
+        packed = self.bits[names[0]].copy()
+        for name in names[1:]:
+            np.bitwise_and(packed, self.bits[name], out=packed)
+        return np.unpackbits(packed, count=self.length).astype(bool)
+
+    @property
+    def nbytes(self):
+        return sum(bits.nbytes for bits in self.bits.values())
+
+
+def pack_signal_columns(df, ma_type='ma20'):
+    """
+    Compute and pack the D1/D2 signal columns used by find_trading_signals
+    (above_<ma_type>, j_turns_negative, j_turns_positive)
+    df: prepared frame sorted by code and date
+    """
+    above = (df['close'] > df[ma_type]).values
+    j = df['kdj_j'].values
+    prev_j = df.groupby('code', observed=True)['kdj_j'].shift(1).values
+
+    packed = PackedSignals(len(df), index=df.index)
+    packed.add(f'above_{ma_type}', above)
+    packed.add('j_turns_negative', (j < 0) & (prev_j >= 0))
+    packed.add('j_turns_positive', (j >= 0) & (prev_j < 0))
+    return packed
+
+
+def _signal_keys(signals, date_col):
+    if signals.empty:
+        return set()
+    return set(zip(signals['code'].astype(str), pd.to_datetime(signals[date_col])))
+
+
+def validate_compact(df, strategy, ma_types=('ma20',), code_as='category'):
+    """
+    Compare signals computed on the float64 prepared frame with the compact frame
+    df: raw stock data
+    strategy: TradingStrategy instance with compact=False
+    code_as: code encoding of the compact frame
+
+    returns:
+        one report row per ma_type with signal counts, mismatches and memory usage
+    """
+    if getattr(strategy, 'compact', False):
+        raise ValueError("Pass a strategy with compact=False; the float64 path is the reference")
+    full = strategy.prepare_data(df)
+    compact = compact_frame(full, code_as=code_as)
+
+    rows = []
+    for ma_type in ma_types:
+        full_bits = pack_signal_columns(full, ma_type)
+        compact_bits = pack_signal_columns(compact, ma_type)
+        d1_full = full_bits.combine(f'above_{ma_type}', 'j_turns_negative')
+        d1_compact = compact_bits.combine(f'above_{ma_type}', 'j_turns_negative')
+
+        full_signals = strategy.find_trading_signals(full, ma_type=ma_type)
+        compact_signals = strategy.find_trading_signals(compact, ma_type=ma_type)
+        date_col = 'D1日期' if 'D1日期' in full_signals.columns else '信号日期'
+        full_keys = _signal_keys(full_signals, date_col)
+        compact_keys = _signal_keys(compact_signals, date_col)
+
+        rows.append({
+            'ma_type': ma_type,
+            'rows': len(full),
+            'd1_float64': int(d1_full.sum()),
+            'd1_compact': int(d1_compact.sum()),
+            'd1_mismatch': int((d1_full != d1_compact).sum()),
+            'signals_float64': len(full_keys),
+            'signals_compact': len(compact_keys),
+            'signals_mismatch': len(full_keys ^ compact_keys),
+            'identical': bool((d1_full == d1_compact).all() and full_keys == compact_keys),
+            'memory_float64_mb': full.memory_usage(deep=True).sum() / 1024 ** 2,
+            'memory_compact_mb': compact.memory_usage(deep=True).sum() / 1024 ** 2,
+            'signal_bool_bytes': len(compact_bits.bits) * len(full),
+            'signal_packed_bytes': compact_bits.nbytes,
+        })
+    return pd.DataFrame(rows)
+
+
+def main():
+    from .data_loader import DataLoader
+    from .strategy import TradingStrategyA, TradingStrategyB
+
+    dataset_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dataset')
+    hs300_constituents_path = os.path.join(dataset_dir, '沪深300成分股.csv')
+    datasets = ['沪深300-2025年至今数据.csv', '沪深300-2025年2月数据.csv']
+
+    reports = []
+    for name in datasets:
+        data_loader = DataLoader(os.path.join(dataset_dir, name), hs300_constituents_path)
+        stock_data = data_loader.load_stock_data()
+        for strategy in [TradingStrategyA(), TradingStrategyB()]:
+            report = validate_compact(stock_data, strategy, ma_types=('ma5', 'ma20', 'ma60'))
+            report.insert(0, 'strategy', type(strategy).__name__)
+            report.insert(0, 'dataset', name)
+            reports.append(report)
+
+    report = pd.concat(reports, ignore_index=True)
+    print("\n=== 紧凑模式信号一致性验证 ===")
+    with pd.option_context('display.width', None, 'display.max_columns', None):
+        print(report.round(2).to_string(index=False))
+    return report
+
+
+if __name__ == "__main__":
+    main()
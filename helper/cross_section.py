@@ -0,0 +1,180 @@
+import numpy as np
+import pandas as pd
+
+
+"""
+截面因子
+- 长表 (日期, 代码) 一次性展开成 因子 x 日期 x 代码 的三维数组
+- 每个日期上的排名、z-score、缩尾都沿代码轴向量化计算, 不按日期 groupby-apply
+- 每日 top-K 用 np.argpartition 部分排序选出
+"""
+
+
+def _quantile_panel(sorted_panel, count, q):
+    """Linear-interpolated quantile of rows sorted with NaN last (same as np.nanquantile)"""
+    position = q * np.maximum(count - 1, 0)
+    low = np.floor(position).astype(np.int64)
+    high = np.minimum(low + 1, np.maximum(count - 1, 0))
+    low_value = np.take_along_axis(sorted_panel, low, axis=-1)
+    high_value = np.take_along_axis(sorted_panel, high, axis=-1)
+    result = low_value + (high_value - low_value) * (position - low)
+    return np.where(count > 0, result, np.nan)
+
+
+def _winsorize_panel(panel, lower, upper):
+    """Clip each (factor, date) row to its own [lower, upper] quantiles"""
+    # 一次排序求出两个分位数, 比 np.nanquantile 沿轴计算快得多
+    sorted_panel = np.sort(panel, axis=-1)
+    count = np.sum(~np.isnan(panel), axis=-1, keepdims=True)
+    low = _quantile_panel(sorted_panel, count, lower)
+    high = _quantile_panel(sorted_panel, count, upper)
+    return np.clip(panel, low, high)
+
+
+def _zscore_panel(panel):
+    count = np.sum(~np.isnan(panel), axis=-1, keepdims=True)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.nansum(panel, axis=-1, keepdims=True) / count
+        var = np.nansum((panel - mean) ** 2, axis=-1, keepdims=True) / (count - 1)
+        return (panel - mean) / np.sqrt(var)
+
+
+def _rank_panel(panel, ascending=True, pct=False):
+    """1-based ranks along the code axis, ties by code order (pandas method='first'), NaN stays NaN"""
+    keys = panel if ascending else -panel
+    # argsort 把 NaN 排在最后, 有效值的名次不受影响
+    order = np.argsort(keys, axis=-1, kind='stable')
+    ranks = np.empty(panel.shape)
+    np.put_along_axis(ranks, order, np.broadcast_to(np.arange(1, panel.shape[-1] + 1, dtype=float), panel.shape), axis=-1)
+    missing = np.isnan(panel)
+    ranks[missing] = np.nan
+    if pct:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            ranks = ranks / np.sum(~missing, axis=-1, keepdims=True)
+    return ranks
+
+
+class CrossSection:
+    """
+    截面因子计算
+    Per-date ranks, z-scores, winsorization and top-K over a long (date, code) frame
+    """
+    def __init__(self, df, factors, date_col='date', code_col='code'):
+        """
+        df: long frame with one row per (date, code)
+        factors: factor columns to load into the panel
+        """
+        self.factors = list(factors)
+        self.index = df.index
+        self.date_ids, self.dates = pd.factorize(df[date_col], sort=True)
+        self.code_ids, self.codes = pd.factorize(df[code_col], sort=True)
+        if pd.Series(self.date_ids.astype(np.int64) * len(self.codes) + self.code_ids).duplicated().any():
+            raise ValueError(f"Duplicate ({date_col}, {code_col}) rows")
+        self.values = np.full((len(self.factors), len(self.dates), len(self.codes)), np.nan)
+        self.values[:, self.date_ids, self.code_ids] = df[self.factors].to_numpy(dtype=np.float64).T
+
+    def _to_long(self, panel, suffix=''):
+        return pd.DataFrame(
+            panel[:, self.date_ids, self.code_ids].T,
+            columns=[f'{factor}{suffix}' for factor in self.factors],
+            index=self.index,
+        )
+
+    def _date_code_panel(self, values):
+        """Scatter one value per row into a (date x code) matrix"""
+        panel = np.full((len(self.dates), len(self.codes)), np.nan)
+        panel[self.date_ids, self.code_ids] = np.asarray(values, dtype=np.float64)
+        return panel
+
+    def _panel(self, winsorize=None):
+        if winsorize is None:
+            return self.values
+        return _winsorize_panel(self.values, *winsorize)
+
+    def count(self):
+        """Number of non-missing values of each factor per date"""
+        return pd.DataFrame(np.sum(~np.isnan(self.values), axis=-1).T, index=self.dates, columns=self.factors)
+
+    def rank(self, ascending=True, pct=False, suffix='_rank'):
+        """Per-date rank of every factor (1 = smallest when ascending)"""
+        return self._to_long(_rank_panel(self.values, ascending, pct), suffix)
+
+    def zscore(self, winsorize=None, suffix='_z'):
+        """
+        Per-date z-score of every factor
+        winsorize: (lower, upper) quantiles to clip to before standardizing, e.g. (0.01, 0.99)
+        """
+        return self._to_long(_zscore_panel(self._panel(winsorize)), suffix)
+
+    def winsorize(self, lower=0.01, upper=0.99, suffix='_w'):
+        """Factors clipped to their per-date [lower, upper] quantiles"""
+        return self._to_long(_winsorize_panel(self.values, lower, upper), suffix)
+
+    def composite(self, weights, winsorize=(0.01, 0.99)):
+        """
+        Weighted sum of per-date z-scores
+        weights: dict of factor -> weight, negative weights favour low values
+        Rows missing any weighted factor score NaN.
+        """
+        z = _zscore_panel(self._panel(winsorize))
+        # 只有一个有效值的日期标准差为0/NaN, 记0分 (与截面均值持平)
+        valid = ~np.isnan(self.values)
+        z = np.where(valid & np.isnan(z), 0., z)
+        score = np.zeros(z.shape[1:])
+        for factor, weight in weights.items():
+            score = score + weight * z[self.factors.index(factor)]
+        return pd.Series(score[self.date_ids, self.code_ids], index=self.index)
+
+    def top_k(self, score, k, ascending=False):
+        """
+        Boolean mask of the k best rows per date by score (a Series aligned with the frame)
+        Ties at the k-th place are broken arbitrarily; NaN scores are never selected.
+        """
+        panel = self._date_code_panel(score)
+        keys = np.where(np.isnan(panel), np.inf, panel if ascending else -panel)
+        kth = min(k, panel.shape[1])
+        if kth == 0:
+            return pd.Series(False, index=self.index)
+        best = np.argpartition(keys, kth - 1, axis=1)[:, :kth]
+        chosen = np.zeros(panel.shape, dtype=bool)
+        np.put_along_axis(chosen, best, True, axis=1)
+        chosen &= ~np.isnan(panel)
+        return pd.Series(chosen[self.date_ids, self.code_ids], index=self.index)
+
+
+def add_signal_factors(signals):
+    """
+    Add ranking factors derived from the signal table
+    - 均线距离: close / MA20 - 1 on the signal day (in %)
+    """
+    signals = signals.copy()
+    if 'D1收盘价' in signals.columns:
+        signals['均线距离'] = (signals['D1收盘价'] / signals['D1_20日均线'] - 1) * 100
+    else:
+        signals['均线距离'] = (signals['当日收盘价'] / signals['20日均线'] - 1) * 100
+    return signals
+
+
+def select_top_signals(signals, weights, k=5, date_col=None, winsorize=(0.01, 0.99)):
+    """
+    Keep the k best signals per date by a composite of per-date z-scores
+    signals: output of find_trading_signals (optionally with add_signal_factors / risk columns)
+    weights: dict of factor column -> weight, e.g. {'J值差值': 1, 'D1_WR14': -1, '均线距离': 0.5}
+    k: signals kept per date
+
+    returns:
+        selected signals with 综合得分 and 当日排名, sorted by date and rank
+    """
+    if signals.empty:
+        return signals
+    if date_col is None:
+        date_col = 'D1日期' if 'D1日期' in signals.columns else '信号日期'
+    signals = signals.reset_index(drop=True)
+    cross = CrossSection(signals, list(weights), date_col=date_col)
+    score = cross.composite(weights, winsorize=winsorize)
+    selected = signals.assign(综合得分=score.values)
+    ranks = _rank_panel(cross._date_code_panel(score.values), ascending=False)
+    selected['当日排名'] = ranks[cross.date_ids, cross.code_ids]
+    selected = selected[cross.top_k(score, k).values]
+    return selected.sort_values([date_col, '当日排名'], ignore_index=True)
+
@@ -1,32 +1,232 @@
 import os
+import numpy as np
 import pandas as pd
+from .profiler import profile_stage
+
+
+PRICE_COLUMNS = ['open', 'high', 'low', 'close', 'preclose']
+ADJUST_TYPES = ('qfq', 'hfq')
+
+
+def _code_fingerprints(df, columns):
+    """Order-independent hash of each code's rows"""
+    hashes = pd.util.hash_pandas_object(df[columns], index=False).values
+    return pd.Series(hashes, index=df['code'].values).groupby(level=0).sum()
+
+
+def cumulative_factors(factors):
+    """
+    Normalize a corporate-action factor table to cumulative back-adjustment factors
+    factors: either baostock query_adjust_factor output (code, dividOperateDate, backAdjustFactor)
+             or one row per event (code, date, ratio) with ratio = previous close / ex-right reference price
+
+    returns:
+        (code, date, factor) sorted by code and date, factor applies from date onwards
+    """
+    if 'backAdjustFactor' in factors.columns:
+        table = pd.DataFrame({
+            'code': factors['code'].values,
+            'date': pd.to_datetime(factors['dividOperateDate']).values,
+            'factor': factors['backAdjustFactor'].astype(float).values,
+        }).sort_values(['code', 'date'], kind='stable')
+    elif 'ratio' in factors.columns:
+        table = pd.DataFrame({
+            'code': factors['code'].values,
+            'date': pd.to_datetime(factors['date']).values,
+            'factor': factors['ratio'].astype(float).values,
+        }).sort_values(['code', 'date'], kind='stable')
+        table['factor'] = table.groupby('code')['factor'].cumprod()
+    else:
+        raise KeyError("Factor table needs backAdjustFactor (baostock) or ratio columns")
+    return table.reset_index(drop=True)
+
+
+def adjust_prices(df, factors, how='qfq', columns=None):
+    """
+    Forward (qfq) or back (hfq) adjust price columns of all codes in one pass
+    df: price frame with 'code' and 'date'
+    factors: cumulative factor table from cumulative_factors
+    how: 'qfq' - prices scaled to the latest factor of each code (latest prices unchanged)
+         'hfq' - prices scaled from the first listing (earliest prices unchanged)
+    columns: price columns to adjust (default: open/high/low/close/preclose present in df)
+    """
+    if how not in ADJUST_TYPES:
+        raise ValueError(f"Unknown adjust type: {how}, expected one of {ADJUST_TYPES}")
+    columns = [col for col in (columns or PRICE_COLUMNS) if col in df.columns]
+
+    # (代码, 日期) 合成有序键, 每行二分查找最近一次除权因子
+    codes, code_ids = np.unique(np.r_[df['code'].values, factors['code'].values].astype(str), return_inverse=True)
+    row_ids, factor_ids = code_ids[:len(df)], code_ids[len(df):]
+    row_days = df['date'].values.astype('datetime64[D]').astype(np.int64)
+    factor_days = factors['date'].values.astype('datetime64[D]').astype(np.int64)
+    span = max(row_days.max(initial=0), factor_days.max(initial=0)) + 1
+    factor_keys = factor_ids * span + factor_days
+    row_keys = row_ids * span + row_days
+
+    pos = np.searchsorted(factor_keys, row_keys, side='right') - 1
+    matched = (pos >= 0) & (factor_ids[np.maximum(pos, 0)] == row_ids) if len(factor_keys) else np.zeros(len(df), dtype=bool)
+    factor = np.ones(len(df))
+    factor[matched] = factors['factor'].values[pos[matched]]
+
+    if how == 'qfq':
+        latest = np.ones(len(codes))
+        if len(factor_ids):
+            last_row = np.r_[factor_ids[1:] != factor_ids[:-1], True]
+            latest[factor_ids[last_row]] = factors['factor'].values[last_row]
+        factor = factor / latest[row_ids]
+
+    df = df.copy()
+    for col in columns:
+        df[col] = df[col].to_numpy(dtype=np.float64) * factor
+    return df
 
 
 class DataLoader:
     """
     数据加载
     """
-    def __init__(self, 
-                 stock_data_path, 
-                 hs300_constituents_path):
+    def __init__(self,
+                 stock_data_path,
+                 hs300_constituents_path,
+                 adjust_factors_path=None,
+                 adjust=None,
+                 cache_dir=None):
+        """
+        adjust_factors_path: CSV of corporate-action factors (see cumulative_factors)
+        adjust: None (raw prices), 'qfq' (forward adjusted) or 'hfq' (back adjusted)
+        cache_dir: directory to persist adjusted panels between runs (default: in-memory only)
+        """
+        if adjust is not None and adjust not in ADJUST_TYPES:
+            raise ValueError(f"Unknown adjust type: {adjust}, expected one of {ADJUST_TYPES}")
+        if adjust is not None and adjust_factors_path is None:
+            raise ValueError("adjust requires adjust_factors_path")
         self.stock_data_path = stock_data_path
         self.hs300_constituents_path = hs300_constituents_path
-        
+        self.adjust_factors_path = adjust_factors_path
+        self.adjust = adjust
+        self.cache_dir = cache_dir
+        self._adjust_cache = {}
+        self.last_adjust_stats = {}
+
+    @profile_stage()
     def load_hs300_constituents(self):
         """Load HS300 constituent stocks data from CSV file"""
         if not os.path.exists(self.hs300_constituents_path):
             raise FileNotFoundError(f"HS300 constituents file not found: {self.hs300_constituents_path}")
-            
+
         df = pd.read_csv(self.hs300_constituents_path)
         df['updateDate'] = pd.to_datetime(df['updateDate'])
         return df
-        
-    def load_stock_data(self):
-        """Load stock price data from CSV file"""
+
+    @profile_stage()
+    def load_stock_data(self, codes=None, end=None, usecols=None, chunksize=200000):
+        """
+        Load stock price data from CSV file, adjusted when the loader was created with adjust
+        codes: only keep these codes (default: all)
+        end: only keep rows up to this date (default: all)
+        usecols: columns to parse, 'code' and 'date' are always kept (default: all)
+        chunksize: rows parsed at a time when filtering, bounds peak memory to the kept rows
+        """
         if not os.path.exists(self.stock_data_path):
             raise FileNotFoundError(f"Stock data file not found: {self.stock_data_path}")
-            
-        df = pd.read_csv(self.stock_data_path)
-        df['date'] = pd.to_datetime(df['date'])
+
+        read_kwargs = {}
+        if usecols is not None:
+            wanted = set(usecols) | {'code', 'date'}
+            read_kwargs['usecols'] = lambda col: col in wanted
+        if codes is None and end is None:
+            df = pd.read_csv(self.stock_data_path, **read_kwargs)
+            df['date'] = pd.to_datetime(df['date'])
+        else:
+            # 边读边过滤, 只保留需要的股票和日期
+            codes = set(codes) if codes is not None else None
+            end = pd.Timestamp(end) if end is not None else None
+            chunks = []
+            for chunk in pd.read_csv(self.stock_data_path, chunksize=chunksize, **read_kwargs):
+                if codes is not None:
+                    chunk = chunk[chunk['code'].isin(codes)]
+                chunk['date'] = pd.to_datetime(chunk['date'])
+                if end is not None:
+                    chunk = chunk[chunk['date'] <= end]
+                chunks.append(chunk)
+            df = pd.concat(chunks, ignore_index=True)
         df = df.sort_values(['code', 'date'])
-        return df 
\ No newline at end of file
+        if self.adjust is not None:
+            df = self.adjust_stock_data(df, how=self.adjust)
+        return df
+
+    @profile_stage()
+    def load_adjust_factors(self):
+        """Load the corporate-action factor table as cumulative back-adjustment factors"""
+        if not os.path.exists(self.adjust_factors_path):
+            raise FileNotFoundError(f"Adjust factor file not found: {self.adjust_factors_path}")
+        return cumulative_factors(pd.read_csv(self.adjust_factors_path))
+
+    @profile_stage()
+    def adjust_stock_data(self, df, how='qfq', factors=None):
+        """
+        Adjusted copy of a price frame, reusing cached rows of codes whose prices and factors are unchanged
+        df: raw price frame sorted by code and date
+        how: 'qfq' or 'hfq'
+        factors: cumulative factor table (default: load_adjust_factors())
+        """
+        if factors is None:
+            factors = self.load_adjust_factors()
+        price_cols = [col for col in ['code', 'date'] + PRICE_COLUMNS if col in df.columns]
+        # 每只股票的指纹 = 行情指纹 + 因子指纹, 只重算指纹变化的股票
+        codes = pd.unique(df['code'].values)
+        price_hash = _code_fingerprints(df, price_cols).reindex(codes).values
+        factor_hash = _code_fingerprints(factors, ['code', 'date', 'factor']).reindex(codes, fill_value=0).values
+        fingerprints = pd.Series(price_hash.astype(np.uint64) ^ factor_hash.astype(np.uint64), index=codes)
+
+        cached = self._load_adjust_cache(how)
+        same = pd.Index([])
+        if cached is not None:
+            old_fingerprints, panel = cached
+            common = fingerprints.index.intersection(old_fingerprints.index)
+            same = common[fingerprints[common].values == old_fingerprints[common].values]
+
+        columns = [col for col in PRICE_COLUMNS if col in df.columns]
+        reuse = df['code'].isin(same).values
+        values = {col: df[col].to_numpy(dtype=np.float64, copy=True) for col in columns}
+        if (~reuse).any():
+            stale = df[~reuse]
+            fresh = adjust_prices(stale, factors[factors['code'].isin(set(stale['code']))], how=how, columns=columns)
+            for col in columns:
+                values[col][~reuse] = fresh[col].values
+        if reuse.any():
+            reused = pd.merge(df.loc[reuse, ['code', 'date']], panel, on=['code', 'date'], how='left')
+            for col in columns:
+                values[col][reuse] = reused[col].values
+
+        adjusted = df.copy()
+        for col in columns:
+            adjusted[col] = values[col]
+        self._save_adjust_cache(how, fingerprints, adjusted[price_cols], cached)
+        self.last_adjust_stats = {'codes': len(fingerprints), 'reused': len(same), 'recomputed': len(fingerprints) - len(same)}
+        return adjusted
+
+    def _cache_path(self, how):
+        return os.path.join(self.cache_dir, f'adjusted_{how}.pkl')
+
+    def _load_adjust_cache(self, how):
+        if how in self._adjust_cache:
+            return self._adjust_cache[how]
+        if self.cache_dir is not None and os.path.exists(self._cache_path(how)):
+            cached = pd.read_pickle(self._cache_path(how))
+            self._adjust_cache[how] = (cached['fingerprints'], cached['panel'])
+            return self._adjust_cache[how]
+        return None
+
+    def _save_adjust_cache(self, how, fingerprints, panel, cached=None):
+        """Store the adjusted rows of the codes just processed, keeping the cached rows of all other codes"""
+        if cached is not None:
+            # 只加载了部分股票时, 其余股票的指纹和复权行情原样保留
+            old_fingerprints, old_panel = cached
+            keep = old_fingerprints.index.difference(fingerprints.index)
+            fingerprints = pd.concat([old_fingerprints[keep], fingerprints])
+            panel = pd.concat([old_panel[old_panel['code'].isin(keep)], panel], ignore_index=True)
+        self._adjust_cache[how] = (fingerprints, panel)
+        if self.cache_dir is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            pd.to_pickle({'fingerprints': fingerprints, 'panel': panel}, self._cache_path(how))
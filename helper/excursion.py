@@ -0,0 +1,139 @@
+import numpy as np
+import pandas as pd
+
+from . import kernels
+from .price_index import PriceIndex
+
+
+"""
+交易期间的价格偏移 (MAE / MFE)
+- 行情按代码分段排好序后, 对最低价建区间最小值、对最高价建区间最大值(及位置)的稀疏表
+- 建表 O(n log n), 之后任意 [入场, 出场] 区间的极值查询都是两次查表, 所有交易一次向量化完成
+- 入场按D1收盘价, 偏移统计D1之后到D2 (含) 的K线:
+    MAE      最大不利偏移: 区间最低价 / 入场价 - 1 (%)
+    MFE      最大有利偏移: 区间最高价 / 入场价 - 1 (%)
+    MFE用时  入场到区间最高价出现的交易日数
+    最大回撤 区间最高价之后 (含当日) 到出场的最低价相对最高价的回落 (%)
+"""
+
+
+EXCURSION_COLUMNS = ['MAE', 'MFE', 'MFE用时', '最大回撤']
+
+
+class SparseTable:
+    """
+    稀疏表
+    O(1) range min/max position queries over a static array after an O(n log n) build
+    """
+    def __init__(self, values, op='max'):
+        """
+        values: 1-D array
+        op: 'max' or 'min'; ties resolve to the earliest position
+        """
+        if op not in ('max', 'min'):
+            raise ValueError(f"Unknown op: {op}")
+        self.values = np.asarray(values, dtype=np.float64)
+        # NaN 永远不会被选为极值
+        fill = -np.inf if op == 'max' else np.inf
+        self._keys = np.where(np.isnan(self.values), fill, self.values)
+        if op == 'min':
+            self._keys = -self._keys
+        n = len(self._keys)
+        self._levels = [np.arange(n, dtype=np.int64)]
+        width = 1
+        while 2 * width <= n:
+            prev = self._levels[-1]
+            left, right = prev[:n - 2 * width + 1], prev[width:n - width + 1]
+            self._levels.append(self._pick(left, right))
+            width *= 2
+
+    def _pick(self, left, right):
+        # 右侧严格更优才取右侧, 相等时保留靠前的位置
+        return np.where(self._keys[right] > self._keys[left], right, left)
+
+    def argquery(self, left, right):
+        """
+        Position of the extremum in each inclusive range [left, right]
+        left, right: arrays of positions with left <= right
+        """
+        left = np.asarray(left, dtype=np.int64)
+        right = np.asarray(right, dtype=np.int64)
+        if (left > right).any():
+            raise ValueError("Empty range")
+        if len(left) == 0:
+            return left
+        level = np.floor(np.log2(right - left + 1)).astype(np.int64)
+        width = np.left_shift(1, level)
+        result = np.empty(len(left), dtype=np.int64)
+        # 按层分组查表, 每层一次向量化
+        for k in np.unique(level):
+            rows = level == k
+            table = self._levels[k]
+            result[rows] = self._pick(table[left[rows]], table[right[rows] - width[rows] + 1])
+        return result
+
+    def query(self, left, right):
+        """Extremum value of each inclusive range [left, right]"""
+        return self.values[self.argquery(left, right)]
+
+
+def trade_excursions(df, entry_pos, exit_pos, entry_price=None):
+    """
+    MAE, MFE, time to MFE and drawdown of trades held from entry_pos to exit_pos
+    df: price frame with 'code', 'date', 'high', 'low', 'close' (any row order)
+    entry_pos, exit_pos: row positions of the entry (D1) and exit (D2) bars of the same code
+    entry_price: entry prices (default: close of the entry bar)
+
+    returns:
+        DataFrame with EXCURSION_COLUMNS, one row per trade in input order
+    """
+    entry_pos = np.asarray(entry_pos, dtype=np.int64)
+    exit_pos = np.asarray(exit_pos, dtype=np.int64)
+    order, _, _ = kernels.segment_order(df['code'].values, df['date'].values)
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    high = df['high'].to_numpy(dtype=np.float64)[order]
+    low = df['low'].to_numpy(dtype=np.float64)[order]
+    if entry_price is None:
+        entry_price = df['close'].to_numpy(dtype=np.float64)[entry_pos]
+    entry_price = np.asarray(entry_price, dtype=np.float64)
+
+    entry_rank = rank[entry_pos]
+    exit_rank = rank[exit_pos]
+    if (exit_rank < entry_rank).any():
+        raise ValueError("Exit before entry")
+    # 入场在D1收盘, D1当日的高低点不计入; 同日进出时退化为D1当日
+    first = np.minimum(entry_rank + 1, exit_rank)
+
+    peak_rank = SparseTable(high, 'max').argquery(first, exit_rank)
+    low_table = SparseTable(low, 'min')
+    trough = low_table.query(first, exit_rank)
+    after_peak_low = low_table.query(peak_rank, exit_rank)
+    peak = high[peak_rank]
+
+    return pd.DataFrame({
+        'MAE': (trough / entry_price - 1) * 100,
+        'MFE': (peak / entry_price - 1) * 100,
+        'MFE用时': peak_rank - entry_rank,
+        '最大回撤': (after_peak_low / peak - 1) * 100,
+    })
+
+
+def add_excursions(df, signals, index=None):
+    """
+    Add MAE/MFE columns to a D1/D2 signal table (TradingStrategyB/C output)
+    df: prepared price frame the signals were found on
+    index: PriceIndex over df, pass one to share it
+    """
+    if signals.empty:
+        return signals
+    index = PriceIndex(df) if index is None else index
+    entry_pos = index.locate(signals['code'].values, signals['D1日期'].values)
+    exit_pos = index.locate(signals['code'].values, signals['D2日期'].values)
+    if (entry_pos < 0).any() or (exit_pos < 0).any():
+        raise IndexError("Signal not found in price data")
+    excursions = trade_excursions(df, entry_pos, exit_pos, entry_price=signals['D1收盘价'].values)
+    signals = signals.copy()
+    for col in EXCURSION_COLUMNS:
+        signals[col] = excursions[col].values
+    return signals
@@ -0,0 +1,215 @@
+import numpy as np
+import pandas as pd
+
+from . import kernels
+from .price_index import PriceIndex
+
+
+"""
+路径相关的出场规则
+- 止损: 最低价跌破 入场价 x (1 - stop_loss)
+- 止盈: 最高价突破 入场价 x (1 + take_profit)
+- 移动止损: 最低价跌破 入场以来(不含当日)最高价 x (1 - trailing_stop)
+- 信号出场: exit_events 为 True 的当日收盘 (例: J值转正, 即策略B的D2)
+- 到期: 持有 max_holding 个交易日后收盘出场; 数据先结束则按最后一根K线收盘记为 数据结束
+- 所有交易一起计算: 每笔交易入场后 max_holding 根K线展开成 (交易 x 持仓日) 矩阵, 逐列判断触发条件,
+  argmax 找出首次触发的位置, 没有逐笔循环
+- 同一根K线上多个条件同时触发时按 止损/移动止损 -> 止盈 -> 信号 的顺序处理 (保守假设);
+  开盘即跳空越过价位时按开盘价成交
+"""
+
+
+EXIT_REASONS = ('止损', '移动止损', '止盈', '信号', '到期', '数据结束')
+
+# 每块展开的 (交易 x 持仓日) 单元数上限
+_CELLS_PER_CHUNK = 2_000_000
+
+
+class ExitEngine:
+    """
+    出场引擎
+    Vectorized first-passage exits (stop, target, trailing stop, signal, max holding) for many trades
+    """
+    def __init__(self, stop_loss=None, take_profit=None, trailing_stop=None, max_holding=20, gap_fill=True):
+        """
+        stop_loss: stop distance below the entry price as a fraction (0.05 = 5%), None to disable
+        take_profit: target distance above the entry price as a fraction, None to disable
+        trailing_stop: stop distance below the highest high since entry as a fraction, None to disable
+        max_holding: exit at the close after this many trading days (None: hold until the data ends)
+        gap_fill: fill at the open when the bar gaps through the stop/target level
+        """
+        for name, value in [('stop_loss', stop_loss), ('take_profit', take_profit), ('trailing_stop', trailing_stop)]:
+            if value is not None and value <= 0:
+                raise ValueError(f"{name} must be positive")
+        if max_holding is not None and max_holding < 1:
+            raise ValueError("max_holding must be at least 1")
+        self.stop_loss = stop_loss
+        self.take_profit = take_profit
+        self.trailing_stop = trailing_stop
+        self.max_holding = max_holding
+        self.gap_fill = gap_fill
+
+    def run(self, df, entry_pos, entry_price=None, exit_events=None):
+        """
+        First exit of every trade
+        df: price frame with 'code', 'date', 'open', 'high', 'low', 'close' (any row order)
+        entry_pos: row positions of the entry bars (the trade is entered at that bar's close)
+        entry_price: entry prices (default: close of the entry bar)
+        exit_events: boolean mask aligned with df, exit at the close of the first later bar where it is True
+
+        returns:
+            DataFrame (one row per trade, in input order) with entry_pos, exit_pos, 出场日期, 出场价格,
+            出场原因, 出场持仓交易日, 出场收益率 (in %)
+        """
+        entry_pos = np.asarray(entry_pos, dtype=np.int64)
+        order, starts, lengths = kernels.segment_order(df['code'].values, df['date'].values)
+        rank = np.empty(len(order), dtype=np.int64)
+        rank[order] = np.arange(len(order))
+        segment_end = np.repeat(starts + lengths, lengths)
+
+        prices = {col: df[col].to_numpy(dtype=np.float64)[order] for col in ('open', 'high', 'low', 'close')}
+        events = None if exit_events is None else np.asarray(exit_events, dtype=bool)[order]
+        entry_rank = rank[entry_pos]
+        entry_end = segment_end[entry_rank]
+        if entry_price is None:
+            entry_price = prices['close'][entry_rank]
+        entry_price = np.asarray(entry_price, dtype=np.float64)
+
+        horizon = self.max_holding
+        if horizon is None:
+            horizon = int((entry_end - entry_rank - 1).max(initial=1))
+        horizon = max(horizon, 1)
+
+        exit_rank = np.empty(len(entry_pos), dtype=np.int64)
+        exit_price = np.empty(len(entry_pos))
+        reason = np.empty(len(entry_pos), dtype=np.int64)
+        chunk = max(_CELLS_PER_CHUNK // horizon, 1)
+        for lo in range(0, len(entry_pos), chunk):
+            hi = min(lo + chunk, len(entry_pos))
+            exit_rank[lo:hi], exit_price[lo:hi], reason[lo:hi] = self._first_passage(
+                prices, events, entry_rank[lo:hi], entry_end[lo:hi], entry_price[lo:hi], horizon
+            )
+
+        exit_pos = order[exit_rank]
+        dates = pd.to_datetime(df['date'].values)
+        return pd.DataFrame({
+            'entry_pos': entry_pos,
+            'exit_pos': exit_pos,
+            '出场日期': dates[exit_pos],
+            '出场价格': exit_price,
+            '出场原因': np.array(EXIT_REASONS, dtype=object)[reason],
+            '出场持仓交易日': exit_rank - entry_rank,
+            '出场收益率': (exit_price / entry_price - 1) * 100,
+        })
+
+    def _first_passage(self, prices, events, entry_rank, entry_end, entry_price, horizon):
+        """Exit rank, price and reason code for one chunk of trades"""
+        steps = np.arange(1, horizon + 1)
+        rows = entry_rank[:, None] + steps[None, :]
+        available = rows < entry_end[:, None]
+        rows = np.where(available, rows, entry_rank[:, None])
+        bar_open, high, low, close = (prices[col][rows] for col in ('open', 'high', 'low', 'close'))
+        base = entry_price[:, None]
+
+        # 不利方向: 固定止损与移动止损取较高的价位 (价格下跌时先触及)
+        adverse_level = np.full(rows.shape, -np.inf)
+        adverse_reason = np.zeros(rows.shape, dtype=np.int64)
+        if self.stop_loss is not None:
+            adverse_level = np.broadcast_to(base * (1 - self.stop_loss), rows.shape).copy()
+        if self.trailing_stop is not None:
+            # 入场价与之前各日最高价中的峰值, 不含当日 (当日高低点先后未知)
+            peak = np.maximum.accumulate(np.concatenate([base, high[:, :-1]], axis=1), axis=1)
+            trail_level = peak * (1 - self.trailing_stop)
+            use_trail = trail_level > adverse_level
+            adverse_level = np.where(use_trail, trail_level, adverse_level)
+            adverse_reason = np.where(use_trail, 1, adverse_reason)
+        adverse_hit = available & (low <= adverse_level)
+
+        target_hit = np.zeros(rows.shape, dtype=bool)
+        if self.take_profit is not None:
+            target_level = np.broadcast_to(base * (1 + self.take_profit), rows.shape)
+            target_hit = available & (high >= target_level)
+        signal_hit = np.zeros(rows.shape, dtype=bool) if events is None else available & events[rows]
+
+        hit = adverse_hit | target_hit | signal_hit
+        any_hit = hit.any(axis=1)
+        first = np.argmax(hit, axis=1)
+        # 未触发: 到期 (持满 horizon 日) 或 数据结束 (最后一根可用K线)
+        n_available = available.sum(axis=1)
+        last = np.maximum(n_available - 1, 0)
+        step = np.where(any_hit, first, last)
+        trade = np.arange(len(entry_rank))
+
+        price = close[trade, step].copy()
+        # 不限持仓时 horizon 只是最长的剩余K线数, 未触发的交易都是持有到数据结束
+        expired = n_available >= horizon if self.max_holding is not None else np.zeros(len(entry_rank), dtype=bool)
+        reason = np.where(expired, EXIT_REASONS.index('到期'), EXIT_REASONS.index('数据结束'))
+        on_signal = any_hit & signal_hit[trade, step]
+        reason = np.where(on_signal, EXIT_REASONS.index('信号'), reason)
+
+        on_target = any_hit & target_hit[trade, step]
+        if self.take_profit is not None:
+            level = target_level[trade, step]
+            fill = np.maximum(bar_open[trade, step], level) if self.gap_fill else level
+            price = np.where(on_target, fill, price)
+            reason = np.where(on_target, EXIT_REASONS.index('止盈'), reason)
+
+        on_adverse = any_hit & adverse_hit[trade, step]
+        level = adverse_level[trade, step]
+        fill = np.minimum(bar_open[trade, step], level) if self.gap_fill else level
+        price = np.where(on_adverse, fill, price)
+        reason = np.where(on_adverse, adverse_reason[trade, step], reason)
+
+        # 入场即为最后一根K线: 无法出场, 按入场价记录
+        no_bar = n_available == 0
+        price = np.where(no_bar, entry_price, price)
+        return entry_rank + np.where(no_bar, 0, step + 1), price, reason
+
+    def attach(self, df, signals, date_col=None, index=None, exit_events=None):
+        """
+        Add exit columns to a signal table, entering at the close of the signal date
+        signals: find_trading_signals output (D1日期 or 信号日期 as the entry date)
+        index: PriceIndex over df, pass one to share it
+
+        returns:
+            signals with 出场日期, 出场价格, 出场原因, 出场持仓交易日 and 出场收益率 (in %)
+        """
+        if signals.empty:
+            return signals
+        if date_col is None:
+            date_col = 'D1日期' if 'D1日期' in signals.columns else '信号日期'
+        index = PriceIndex(df) if index is None else index
+        entry_pos = index.locate(signals['code'].values, signals[date_col].values)
+        if (entry_pos < 0).any():
+            raise IndexError("Signal not found in price data")
+        exits = self.run(df, entry_pos, exit_events=exit_events)
+        signals = signals.copy()
+        for col in ('出场日期', '出场价格', '出场原因', '出场持仓交易日', '出场收益率'):
+            signals[col] = exits[col].values
+        return signals
+
+    @staticmethod
+    def summary(exits):
+        """
+        Trade count, mean return, win rate and mean holding per exit reason
+
+        returns:
+            DataFrame indexed by 出场原因 (in EXIT_REASONS order), plus a 合计 row
+        """
+        returns = exits['出场收益率']
+        frame = pd.DataFrame({
+            '出场原因': exits['出场原因'].values,
+            '收益率': returns.values,
+            '盈利': (returns > 0).astype(float).values,
+            '持仓': exits['出场持仓交易日'].values,
+        })
+        grouped = frame.groupby('出场原因')
+        table = pd.DataFrame({
+            '交易数': grouped.size(),
+            '平均收益率': grouped['收益率'].mean(),
+            '胜率': grouped['盈利'].mean() * 100,
+            '平均持仓交易日': grouped['持仓'].mean(),
+        })
+        table = table.reindex([reason for reason in EXIT_REASONS if reason in table.index])
+        table.loc['合计'] = [len(frame), frame['收益率'].mean(), frame['盈利'].mean() * 100, frame['持仓'].mean()]
+        return table
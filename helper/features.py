@@ -0,0 +1,183 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from numpy.lib.format import open_memmap
+from numpy.lib.stride_tricks import sliding_window_view
+
+from . import kernels
+from .compact import INDICATOR_COLUMNS
+from .price_index import PriceIndex
+
+
+"""
+信号回看窗口特征
+- 每个信号取D1 (含) 之前 lookback 根K线的 OHLCV 与指标, 组成 [lookback x 特征] 矩阵, 供信号质量模型训练
+- 行情按代码排序后只复制一次成 (行 x 特征) 面板, 每只股票前面补 lookback-1 行 NaN,
+  再用 sliding_window_view 得到所有窗口的步长视图: 单个窗口是视图, 不复制数据, 也不会跨越两只股票
+- 历史不足 lookback 根K线的窗口开头为 NaN, history() 给出实际K线数
+- 批量导出按 batch_size 分批把窗口写入 open_memmap 打开的 windows.npy, 内存占用只有一批,
+  元数据 (代码、日期、标签) 每列一个 .npy, manifest.json 记录特征名与回看长度
+"""
+
+
+PRICE_COLUMNS = ['open', 'high', 'low', 'close', 'volume', 'amount', 'turn']
+MANIFEST_FILE = 'manifest.json'
+WINDOWS_FILE = 'windows.npy'
+
+
+def default_features(df):
+    """OHLCV columns and prepared indicator columns present in df"""
+    return [col for col in PRICE_COLUMNS + INDICATOR_COLUMNS if col in df.columns]
+
+
+class FeatureWindows:
+    """
+    回看窗口
+    Strided [lookback x features] views over the per-code arrays of a price frame
+    """
+    def __init__(self, df, lookback=20, features=None, dtype=np.float32, index=None):
+        """
+        df: long prepared frame with 'code', 'date' and the feature columns (any row order)
+        lookback: bars per window, the window ends at (and includes) the signal bar
+        features: feature columns (default: default_features(df))
+        dtype: dtype of the panel and of exported windows
+        index: PriceIndex over df, pass one to share it
+        """
+        if lookback < 1:
+            raise ValueError("lookback must be at least 1")
+        self.df = df
+        self.lookback = lookback
+        self.features = list(features) if features is not None else default_features(df)
+        self.index = PriceIndex(df) if index is None else index
+
+        order, starts, lengths = kernels.segment_order(df['code'].values, df['date'].values)
+        pad = lookback - 1
+        # 补齐后每只股票的行区间: 前 pad 行为 NaN, 之后是该股票按日期排序的K线
+        segment = np.repeat(np.arange(len(starts)), lengths)
+        padded_rank = np.arange(len(order)) + (segment + 1) * pad
+        self.panel = np.full((len(order) + len(starts) * pad, len(self.features)), np.nan, dtype=dtype)
+        self.panel[padded_rank] = df[self.features].to_numpy(dtype=dtype)[order]
+
+        # 原始行位置 -> 以该行结尾的窗口编号 (padded_rank - pad)
+        self._window_id = np.empty(len(order), dtype=np.int64)
+        self._window_id[order] = padded_rank - pad
+        self._history = np.empty(len(order), dtype=np.int64)
+        self._history[order] = np.arange(len(order)) - np.repeat(starts, lengths) + 1
+        # (窗口 x 特征 x lookback) 视图, 转置成 (窗口 x lookback x 特征), 仍然是视图
+        self.windows = sliding_window_view(self.panel, lookback, axis=0).transpose(0, 2, 1)
+
+    @property
+    def shape(self):
+        """Shape of one window"""
+        return self.lookback, len(self.features)
+
+    def window(self, pos):
+        """[lookback x features] view ending at row position pos of df (no copy)"""
+        return self.windows[self._window_id[pos]]
+
+    def gather(self, positions):
+        """
+        Windows ending at many row positions
+        Fancy indexing copies, so batch the positions (see iter_batches) for large event sets
+
+        returns:
+            array of shape (len(positions), lookback, n_features)
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        return self.windows[self._window_id[positions]]
+
+    def history(self, positions):
+        """Real bars in each window (lookback unless the code's data starts inside the window)"""
+        return np.minimum(self._history[np.asarray(positions, dtype=np.int64)], self.lookback)
+
+    def locate_signals(self, signals, date_col=None):
+        """
+        Row positions of the signal bars
+        signals: find_trading_signals output (D1日期 or 信号日期 as the window end)
+        """
+        if date_col is None:
+            date_col = 'D1日期' if 'D1日期' in signals.columns else '信号日期'
+        positions = self.index.locate(signals['code'].values, signals[date_col].values)
+        if (positions < 0).any():
+            raise IndexError("Signal not found in price data")
+        return positions
+
+    def iter_batches(self, positions, batch_size=4096):
+        """
+        Yield (slice into positions, windows) batches, one batch in memory at a time
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        for lo in range(0, len(positions), batch_size):
+            batch = slice(lo, min(lo + batch_size, len(positions)))
+            yield batch, self.gather(positions[batch])
+
+    def export(self, path, positions, meta=None, batch_size=4096):
+        """
+        Write the windows of positions to a directory
+        path: output directory (created when missing)
+        positions: row positions of the window ends
+        meta: DataFrame aligned with positions (labels etc.), each column saved as <column>.npy;
+              code and date of every window are always saved
+
+        returns:
+            path
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        os.makedirs(path, exist_ok=True)
+        out = open_memmap(os.path.join(path, WINDOWS_FILE), mode='w+', dtype=self.panel.dtype,
+                          shape=(len(positions),) + self.shape)
+        for batch, windows in self.iter_batches(positions, batch_size):
+            out[batch] = windows
+        out.flush()
+        del out
+
+        columns = {
+            'code': np.asarray(self.df['code'].to_numpy()[positions], dtype=str),
+            'date': pd.to_datetime(self.df['date'].values[positions]).values.astype('datetime64[D]'),
+            'history': self.history(positions),
+        }
+        if meta is not None:
+            if len(meta) != len(positions):
+                raise ValueError("meta is not aligned with positions")
+            for col in meta.columns:
+                columns[col] = meta[col].to_numpy()
+        for col, values in columns.items():
+            values = np.asarray(values)
+            # 字符串列存成定长 unicode, 读取时不需要 pickle
+            if values.dtype == object:
+                values = values.astype(str)
+            np.save(os.path.join(path, f'{col}.npy'), values, allow_pickle=False)
+
+        manifest = {
+            'lookback': self.lookback,
+            'features': self.features,
+            'dtype': np.dtype(self.panel.dtype).name,
+            'rows': int(len(positions)),
+            'columns': list(columns),
+        }
+        with open(os.path.join(path, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        return path
+
+    def export_signals(self, path, signals, label_columns=('D1-D2收益率',), date_col=None, batch_size=4096):
+        """Export the windows of a signal table, with the label columns present in signals as meta"""
+        positions = self.locate_signals(signals, date_col)
+        labels = [col for col in label_columns if col in signals.columns]
+        meta = signals[labels].reset_index(drop=True) if labels else None
+        return self.export(path, positions, meta=meta, batch_size=batch_size)
+
+
+def load_windows(path, mmap=True):
+    """
+    Read an exported directory
+
+    returns:
+        (windows array (memory-mapped unless mmap=False), meta DataFrame, manifest dict)
+    """
+    with open(os.path.join(path, MANIFEST_FILE), encoding='utf-8') as f:
+        manifest = json.load(f)
+    windows = np.load(os.path.join(path, WINDOWS_FILE), mmap_mode='r' if mmap else None)
+    meta = pd.DataFrame({col: np.load(os.path.join(path, f'{col}.npy')) for col in manifest['columns']})
+    return windows, meta, manifest
@@ -1,13 +1,9 @@
-from typing import Union, List, str
+from typing import Union, List
 
 import os
-import time
+import importlib
 from pathlib import Path
-import pandas as np
-import datetime
-import numpy as np
-
-from jqdatasdk import *
+import pandas as pd
 
 """
 股票行情获取
@@ -17,46 +13,109 @@ from jqdatasdk import *
 - 转换股票行情周期
 - 获取单个股票财务指标
 - 获取单个股票估值指标
+
+导入本模块不会导入 jqdatasdk, 也不会登录; 第一次调用聚宽接口时才导入SDK并认证。
+账号密码通过 JQSession 传入, 或读取环境变量 JQ_USERNAME / JQ_PASSWORD。
 """
 
-auth("account", "password") # jqtrading api
 
-# set pd.dataframe
-pd.set_option("display.max_rows", 10000)
-pd.set_option("display.max_columns", 1000)
+class JQSession:
+    """
+    聚宽会话
+    Imports jqdatasdk and authenticates on first use
+    """
+    def __init__(self, username: str = None, password: str = None):
+        """
+        params:
+            username (str): 聚宽账号, 默认读取环境变量 JQ_USERNAME
+            password (str): 聚宽密码, 默认读取环境变量 JQ_PASSWORD
+        """
+        self.username = username
+        self.password = password
+        self._sdk = None
+
+    @property
+    def sdk(self):
+        """
+        已认证的 jqdatasdk 模块
+
+        returns:
+            jqdatasdk module
+        """
+        if self._sdk is None:
+            username = self.username or os.environ.get("JQ_USERNAME")
+            password = self.password or os.environ.get("JQ_PASSWORD")
+            if not username or not password:
+                raise RuntimeError("JoinQuant credentials missing: pass them to JQSession or set JQ_USERNAME/JQ_PASSWORD")
+            sdk = importlib.import_module("jqdatasdk")
+            sdk.auth(username, password)
+            self._sdk = sdk
+        return self._sdk
+
+    @property
+    def authenticated(self):
+        return self._sdk is not None
+
+
+_default_session = None
+
+
+def get_session():
+    """
+    默认会话 (使用环境变量中的账号), 首次调用时创建
 
+    returns:
+        JQSession
+    """
+    global _default_session
+    if _default_session is None:
+        _default_session = JQSession()
+    return _default_session
 
-def get_stock_list():
+
+def set_display_options():
+    """设置 pd.DataFrame 的显示行列数"""
+    pd.set_option("display.max_rows", 10000)
+    pd.set_option("display.max_columns", 1000)
+
+
+def get_stock_list(session: JQSession = None):
     """
     获取股票列表
     .XSHG -> 上证  .XSHE -> 深证
-    
+
+    params:
+        session (JQSession): 聚宽会话, 默认 get_session()
+
     return:
         stock_list(List), 股票代码列表
     """
-
-    return list(get_all_securities(["stock"]).index)
+    sdk = (session or get_session()).sdk
+    return list(sdk.get_all_securities(["stock"]).index)
 
 
 def get_single_stock_price(
         stock_code: Union[int, List],
         start_date: str,
         end_date: str,
-        time_frequency: str
+        time_frequency: str,
+        session: JQSession = None
 ):
     """
     获取单个股票数据
-    
+
     params:
         stock_code (Union[int, List]): 单个股票代码或列表
         start_date (str): 起始时间 xx-xx-xx
         end_date (str): 终止时间 xx-xx-xx
-        time_frequency (str): 行情周期 "daily" "Xd" "Xm"    
-    
+        time_frequency (str): 行情周期 "daily" "Xd" "Xm"
+        session (JQSession): 聚宽会话, 默认 get_session()
+
     return:
         data(pd.DataFrame), 单个股票的行情数据
     """
-    data = get_price(
+    sdk = (session or get_session()).sdk
+    data = sdk.get_price(
         security=stock_code,
         start_date=start_date,
         end_date=end_date,
@@ -95,7 +154,7 @@ def transfer_price_frequency(
     params:
         stock_data (pd.DataFrame): 股票行情数据
         time_frequency (str): 需要转换的行情周期
-    
+
     returns:
         转换后的目标行情周期行情数据
     """
@@ -111,7 +170,8 @@ def transfer_price_frequency(
 def get_single_finance(
         stock_code: Union[int, List],
         date: str,
-        stock_data: pd.DataFrame
+        stock_data: pd.DataFrame,
+        session: JQSession = None
 ):
     """
     获取单个股票的财务指标
@@ -120,12 +180,14 @@ def get_single_finance(
         stock_code (Union[int, List]): 股票代码或列表
         date (str): 需要查询的日期, 例如年份/季度/月份
         stock_data: 股票行情数据
-    
+        session (JQSession): 聚宽会话, 默认 get_session()
+
     returns:
         过滤后的单个股票的财务指标
     """
-    data = get_fundamentals(
-        query(indicator).filter(indicator.code == stock_code),
+    sdk = (session or get_session()).sdk
+    data = sdk.get_fundamentals(
+        sdk.query(sdk.indicator).filter(sdk.indicator.code == stock_code),
         date=date,
         statDate=stock_data
     )
@@ -136,7 +198,8 @@ def get_single_finance(
 def get_single_valuation(
         stock_code: Union[int, List],
         date: str,
-        stock_data: pd.DataFrame
+        stock_data: pd.DataFrame,
+        session: JQSession = None
 ):
     """
     获取单个股票估值指标
@@ -145,12 +208,16 @@ def get_single_valuation(
         stock_code (Union[int, List]): 股票代码或列表
         date (str): 需要查询的日期, 例如年份/季度/月份
         stock_data: 股票行情数据
-    
+        session (JQSession): 聚宽会话, 默认 get_session()
+
     returns:
         过滤后的单个股票的估值指标
     """
-    data = get_fundamentals(
-        query(valuation).filter(valuation.code == stock_code),
+    sdk = (session or get_session()).sdk
+    data = sdk.get_fundamentals(
+        sdk.query(sdk.valuation).filter(sdk.valuation.code == stock_code),
         date=date,
         statDate=stock_data
-    )
\ No newline at end of file
+    )
+
+    return data
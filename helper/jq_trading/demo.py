@@ -1,6 +1,13 @@
-from jqdatasdk import *
+from helper.jq_trading.data_utils import JQSession, set_display_options
 
 
-auth("account", "password")
+def main():
+    # 账号密码读取环境变量 JQ_USERNAME / JQ_PASSWORD, 第一次请求时才登录
+    session = JQSession()
+    set_display_options()
+    df = session.sdk.get_price("000300.XSHG")
+    print(df)
 
-df = get_price()
\ No newline at end of file
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+
+
+"""
+递归指标计算内核
+- pandas: 参考实现 (逐代码循环 / groupby)
+- numpy: 按时间步推进, 同一时间步上所有代码一起向量化计算
+- numba: JIT编译的逐行循环 (可选依赖, 未安装时自动回退到numpy)
+
+三种实现按相同顺序执行相同的浮点运算, 输出逐位一致。
+所有内核的输入都是按代码分段排好序的一维数组, starts/lengths 给出每段的起点和长度。
+"""
+
+
+BACKENDS = ('pandas', 'numpy', 'numba')
+DEFAULT_BACKEND = os.environ.get('QT_BACKEND', 'pandas')
+
+_numba = None
+_numba_kernels = None
+
+
+def _load_numba():
+    """Import numba on first use, returns None when it is not installed"""
+    global _numba
+    if _numba is None:
+        try:
+            import numba
+            _numba = numba
+        except ImportError:
+            _numba = False
+    return _numba or None
+
+
+def available_backends():
+    """Backends that can run in this environment"""
+    return [name for name in BACKENDS if name != 'numba' or _load_numba() is not None]
+
+
+def resolve_backend(name=None):
+    """
+    Validate a backend name, falling back from numba to numpy when numba is missing
+    name: 'pandas', 'numpy' or 'numba' (default: QT_BACKEND environment variable, else 'pandas')
+    """
+    name = name or DEFAULT_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend: {name}, expected one of {BACKENDS}")
+    if name == 'numba' and _load_numba() is None:
+        warnings.warn("numba is not installed, falling back to the numpy backend", RuntimeWarning)
+        return 'numpy'
+    return name
+
+
+def segment_order(codes, dates=None):
+    """
+    Stable row order grouping each code contiguously (by date within code when given)
+
+    returns:
+        order: positions into the original rows
+        starts, lengths: segment bounds in the reordered arrays
+    """
+    code_ids = pd.factorize(np.asarray(codes))[0]
+    if dates is None:
+        order = np.argsort(code_ids, kind='stable')
+    else:
+        order = np.lexsort((np.asarray(dates), code_ids))
+    sorted_ids = code_ids[order]
+    starts = np.flatnonzero(np.r_[True, sorted_ids[1:] != sorted_ids[:-1]]) if len(order) else np.array([], dtype=np.int64)
+    lengths = np.diff(np.r_[starts, len(order)])
+    return order, starts, lengths
+
+
+def ewm_alpha(span):
+    """Smoothing factor exactly as pandas derives it from span"""
+    com = (span - 1) / 2
+    return 1. / (1. + float(com))
+
+
+# ---------------------------------------------------------------- numpy
+
+def _kdj_numpy(rsv, starts, lengths, m1, m2):
+    k = np.empty(len(rsv))
+    d = np.empty(len(rsv))
+    for t in range(lengths.max() if len(lengths) else 0):
+        rows = starts[lengths > t] + t
+        if t == 0:
+            k[rows] = 50
+            d[rows] = 50
+        else:
+            k[rows] = (m1 - 1) * k[rows - 1] / m1 + rsv[rows] / m1
+            d[rows] = (m2 - 1) * d[rows - 1] / m2 + k[rows] / m2
+    return k, d
+
+
+def _ewm_numpy(values, starts, lengths, alpha, adjust, ignore_na, minp):
+    old_wt_factor = 1. - alpha
+    new_wt = 1. if adjust else alpha
+    out = np.empty(len(values))
+    weighted = values[starts].copy()
+    nobs = (weighted == weighted).astype(np.int64)
+    old_wt = np.ones(len(starts))
+    out[starts] = np.where(nobs >= minp, weighted, np.nan)
+    for t in range(1, lengths.max() if len(lengths) else 0):
+        active = np.flatnonzero(lengths > t)
+        rows = starts[active] + t
+        cur = values[rows]
+        w = weighted[active]
+        wt = old_wt[active]
+        is_obs = cur == cur
+        n = nobs[active] + is_obs
+
+        valid = w == w
+        decay = valid & (is_obs | (not ignore_na))
+        wt = np.where(decay, wt * old_wt_factor, wt)
+        update = valid & is_obs
+        blend = update & (w != cur)
+        with np.errstate(invalid='ignore'):
+            blended = (wt * w + new_wt * cur) / (wt + new_wt)
+        w = np.where(blend, blended, w)
+        if adjust:
+            wt = np.where(update, wt + new_wt, wt)
+        else:
+            wt = np.where(update, 1., wt)
+        w = np.where(~valid & is_obs, cur, w)
+
+        weighted[active] = w
+        old_wt[active] = wt
+        nobs[active] = n
+        out[rows] = np.where(n >= minp, w, np.nan)
+    return out
+
+
+def _next_event_numpy(events, starts, lengths):
+    ends = np.repeat(starts + lengths, lengths)
+    positions = np.flatnonzero(events)
+    nxt = np.searchsorted(positions, np.arange(len(events)), side='right')
+    found = np.full(len(events), -1, dtype=np.int64)
+    has = nxt < len(positions)
+    candidate = positions[np.minimum(nxt, max(len(positions) - 1, 0))] if len(positions) else found
+    ok = has & (candidate < ends)
+    found[ok] = candidate[ok]
+    return found
+
+
+# ---------------------------------------------------------------- pandas
+
+def _kdj_pandas(rsv, starts, lengths, m1, m2):
+    k = np.zeros(len(rsv))
+    d = np.zeros(len(rsv))
+    for s, n in zip(starts, lengths):
+        for i in range(s, s + n):
+            if i == s:
+                k[i] = 50
+                d[i] = 50
+            else:
+                k[i] = (m1 - 1) * k[i-1] / m1 + rsv[i] / m1
+                d[i] = (m2 - 1) * d[i-1] / m2 + k[i] / m2
+    return k, d
+
+
+def _ewm_pandas(values, starts, lengths, span, adjust, ignore_na, minp):
+    seg = np.repeat(np.arange(len(starts)), lengths)
+    series = pd.Series(values)
+    return series.groupby(seg).transform(
+        lambda x: x.ewm(span=span, adjust=adjust, ignore_na=ignore_na, min_periods=minp).mean()
+    ).values
+
+
+def _next_event_pandas(events, starts, lengths):
+    seg = np.repeat(np.arange(len(starts)), lengths)
+    pos = pd.Series(np.where(events, np.arange(len(events)), np.nan))
+    nxt = pos.groupby(seg).shift(-1).groupby(seg).bfill()
+    return nxt.fillna(-1).astype(np.int64).values
+
+
+# ---------------------------------------------------------------- numba
+
+def _build_numba_kernels(numba):
+    @numba.njit(cache=True)
+    def kdj(rsv, starts, lengths, m1, m2):
+        k = np.empty(len(rsv))
+        d = np.empty(len(rsv))
+        for j in range(len(starts)):
+            s = starts[j]
+            for i in range(s, s + lengths[j]):
+                if i == s:
+                    k[i] = 50
+                    d[i] = 50
+                else:
+                    k[i] = (m1 - 1) * k[i-1] / m1 + rsv[i] / m1
+                    d[i] = (m2 - 1) * d[i-1] / m2 + k[i] / m2
+        return k, d
+
+    @numba.njit(cache=True)
+    def ewm(values, starts, lengths, alpha, adjust, ignore_na, minp):
+        old_wt_factor = 1. - alpha
+        new_wt = 1. if adjust else alpha
+        out = np.empty(len(values))
+        for j in range(len(starts)):
+            s = starts[j]
+            weighted = values[s]
+            nobs = 1 if weighted == weighted else 0
+            out[s] = weighted if nobs >= minp else np.nan
+            old_wt = 1.
+            for i in range(s + 1, s + lengths[j]):
+                cur = values[i]
+                is_obs = cur == cur
+                if is_obs:
+                    nobs += 1
+                if weighted == weighted:
+                    if is_obs or not ignore_na:
+                        old_wt *= old_wt_factor
+                        if is_obs:
+                            if weighted != cur:
+                                weighted = old_wt * weighted + new_wt * cur
+                                weighted /= (old_wt + new_wt)
+                            if adjust:
+                                old_wt += new_wt
+                            else:
+                                old_wt = 1.
+                elif is_obs:
+                    weighted = cur
+                out[i] = weighted if nobs >= minp else np.nan
+        return out
+
+    @numba.njit(cache=True)
+    def next_event(events, starts, lengths):
+        found = np.full(len(events), -1, dtype=np.int64)
+        for j in range(len(starts)):
+            s = starts[j]
+            nxt = -1
+            for i in range(s + lengths[j] - 1, s - 1, -1):
+                found[i] = nxt
+                if events[i]:
+                    nxt = i
+        return found
+
+    return {'kdj': kdj, 'ewm': ewm, 'next_event': next_event}
+
+
+def _numba_kernel(name):
+    global _numba_kernels
+    if _numba_kernels is None:
+        _numba_kernels = _build_numba_kernels(_load_numba())
+    return _numba_kernels[name]
+
+
+# ---------------------------------------------------------------- dispatch
+
+def _as_segments(starts, lengths):
+    return np.asarray(starts, dtype=np.int64), np.asarray(lengths, dtype=np.int64)
+
+
+def kdj_recursion(rsv, starts, lengths, m1=3, m2=3, backend=None):
+    """
+    K and D lines of KDJ, K_0 = D_0 = 50 at the start of every segment
+    rsv: RSV values, segments contiguous
+    """
+    backend = resolve_backend(backend)
+    rsv = np.asarray(rsv, dtype=np.float64)
+    starts, lengths = _as_segments(starts, lengths)
+    if backend == 'numba':
+        return _numba_kernel('kdj')(rsv, starts, lengths, m1, m2)
+    if backend == 'numpy':
+        return _kdj_numpy(rsv, starts, lengths, m1, m2)
+    return _kdj_pandas(rsv, starts, lengths, m1, m2)
+
+
+def ewm_mean(values, starts, lengths, span, adjust=False, ignore_na=False, min_periods=0, backend=None):
+    """
+    Exponentially weighted mean per segment, matching Series.ewm(span=span, ...).mean()
+    """
+    backend = resolve_backend(backend)
+    values = np.asarray(values, dtype=np.float64)
+    starts, lengths = _as_segments(starts, lengths)
+    alpha = ewm_alpha(span)
+    minp = max(int(min_periods), 1)
+    if backend == 'numba':
+        return _numba_kernel('ewm')(values, starts, lengths, alpha, adjust, ignore_na, minp)
+    if backend == 'numpy':
+        return _ewm_numpy(values, starts, lengths, alpha, adjust, ignore_na, minp)
+    return _ewm_pandas(values, starts, lengths, span, adjust, ignore_na, minp)
+
+
+def next_event_index(events, starts, lengths, backend=None):
+    """
+    For every row, the position of the first later row in the same segment where events is True (-1 if none)
+    Used for the D1 -> D2 scan (first J turn positive after D1).
+    """
+    backend = resolve_backend(backend)
+    events = np.asarray(events, dtype=bool)
+    starts, lengths = _as_segments(starts, lengths)
+    if backend == 'numba':
+        return _numba_kernel('next_event')(events, starts, lengths)
+    if backend == 'numpy':
+        return _next_event_numpy(events, starts, lengths)
+    return _next_event_pandas(events, starts, lengths)
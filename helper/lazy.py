@@ -0,0 +1,307 @@
+import re
+
+import pandas as pd
+
+from .data_loader import DataLoader
+from .technical_analysis import TechnicalAnalysis
+from .rules import RuleSet, parse_rule
+from .profiler import PROFILER
+
+
+"""
+惰性查询管道
+- load -> with_indicators([...]) -> filter(...) -> signals(...) -> collect()
+- 每一步只记录执行计划, collect() 时先优化再执行:
+    * 代码过滤 (含成分股) 下推到读取 CSV
+    * 截止日期下推到读取 (指标只依赖历史数据)
+    * 起始日期在只有窗口类指标时下推为预热行数裁剪, KDJ/MACD 是递归指标, 不裁剪
+    * 只计算后续步骤真正用到的指标
+- explain() 打印优化后的计划
+"""
+
+
+# 指标名 -> (输出列, 所需行情列, 回看行数; None 表示递归指标, 依赖全部历史)
+def _indicator_spec(name):
+    match = re.match(r'^ma(\d+)$', name)
+    if match:
+        window = int(match.group(1))
+        return [name], ['close'], window
+    match = re.match(r'^wr_(\d+)$', name)
+    if match:
+        return [name], ['high', 'low', 'close'], int(match.group(1))
+    match = re.match(r'^boll(?:_(\d+))?$', name)
+    if match:
+        window = int(match.group(1) or 20)
+        return [f'boll_{band}_{window}' for band in ('mid', 'upper', 'lower')], ['close'], window
+    if name == 'kdj':
+        return ['kdj_k', 'kdj_d', 'kdj_j'], ['high', 'low', 'close'], None
+    if name == 'macd':
+        return ['macd_dif', 'macd_dea', 'macd'], ['close'], None
+    raise KeyError(f"Unknown indicator: {name}")
+
+
+def _indicator_for_column(column):
+    """Indicator that produces a column, None for raw columns"""
+    if re.match(r'^(ma\d+|wr_\d+)$', column):
+        return column
+    match = re.match(r'^boll_(?:mid|upper|lower)_(\d+)$', column)
+    if match:
+        return f'boll_{match.group(1)}'
+    if column in ('kdj_k', 'kdj_d', 'kdj_j'):
+        return 'kdj'
+    if column in ('macd_dif', 'macd_dea', 'macd'):
+        return 'macd'
+    return None
+
+
+def _normalize_indicator(name):
+    if name == 'boll':
+        return 'boll_20'
+    return _indicator_for_column(name) or name
+
+
+def _compute_indicator(df, name):
+    ta = TechnicalAnalysis
+    if re.match(r'^ma\d+$', name):
+        df = df.copy()
+        df[name] = ta.calculate_ma(df, window=int(name[2:]))
+        return df
+    if name.startswith('wr_'):
+        return ta.calculate_wr(df, period=int(name[3:]))
+    if name.startswith('boll_'):
+        return ta.calculate_boll(df, window=int(name[5:]))
+    if name == 'kdj':
+        return ta.calculate_kdj(df)
+    if name == 'macd':
+        return ta.calculate_macd(df)
+    raise KeyError(f"Unknown indicator: {name}")
+
+
+def _expression_columns(node):
+    """Column names referenced by a compiled rule expression"""
+    if node[0] == 'col':
+        return {node[1]}
+    columns = set()
+    for child in node[1:]:
+        if isinstance(child, tuple):
+            if child and isinstance(child[0], tuple):
+                for item in child:
+                    columns |= _expression_columns(item)
+            else:
+                columns |= _expression_columns(child)
+    return columns
+
+
+# 策略 A/B/C 的 find_trading_signals 用到的指标 (与 prepare_data 一致)
+STRATEGY_INDICATORS = ['ma5', 'ma20', 'ma60', 'kdj', 'wr_14', 'wr_28', 'macd', 'boll_20']
+
+
+class LazyPipeline:
+    """
+    惰性查询
+    Immutable plan of load / indicator / filter / signal steps, optimized and run by collect()
+    """
+    def __init__(self, loader, plan=()):
+        self.loader = loader
+        self.plan = tuple(plan)
+
+    @classmethod
+    def scan(cls, stock_data_path, hs300_constituents_path=None, **loader_kwargs):
+        """Start a pipeline over a price CSV (loader_kwargs go to DataLoader, e.g. adjust)"""
+        return cls(DataLoader(stock_data_path, hs300_constituents_path, **loader_kwargs))
+
+    def _then(self, op, **args):
+        return LazyPipeline(self.loader, self.plan + ((op, args),))
+
+    def constituents(self):
+        """Inner join with the HS300 constituents (adds code_name)"""
+        if self.loader.hs300_constituents_path is None:
+            raise ValueError("Pipeline was created without hs300_constituents_path")
+        return self._then('constituents')
+
+    def with_indicators(self, names):
+        """Request indicators: 'ma20', 'kdj', 'wr_14', 'macd', 'boll' / 'boll_20' or any of their columns"""
+        names = [_normalize_indicator(name) for name in names]
+        for name in names:
+            _indicator_spec(name)
+        return self._then('indicators', names=names)
+
+    def filter(self, expr=None, codes=None, start=None, end=None):
+        """
+        Keep rows matching all given conditions
+        expr: rule expression (see helper.rules), e.g. 'close > ma(20) & kdj_j < 0'
+        codes: code or list of codes
+        start / end: inclusive date bounds (signal date after signals())
+        """
+        if isinstance(codes, str):
+            codes = [codes]
+        compiled = parse_rule(expr) if expr is not None else None
+        return self._then('filter', expr=expr, compiled=compiled,
+                          codes=list(codes) if codes is not None else None,
+                          start=pd.Timestamp(start) if start is not None else None,
+                          end=pd.Timestamp(end) if end is not None else None)
+
+    def signals(self, strategy, ma_type='ma20'):
+        """Replace the rows with strategy.find_trading_signals(frame, ma_type)"""
+        return self._then('signals', strategy=strategy, ma_type=ma_type)
+
+    def select(self, columns):
+        """Keep only these columns"""
+        return self._then('select', columns=list(columns))
+
+    # ------------------------------------------------------------ planning
+
+    def _optimize(self):
+        """Work out pushdowns and the indicators that are actually needed"""
+        signal_step = next((i for i, (op, _) in enumerate(self.plan) if op == 'signals'), len(self.plan))
+        before_signals = self.plan[:signal_step]
+        has_signals = signal_step < len(self.plan)
+
+        # 代码过滤与行顺序无关 (每只股票独立计算), 任何位置都可以下推
+        codes = None
+        for op, args in self.plan:
+            if op == 'filter' and args['codes'] is not None:
+                codes = set(args['codes']) if codes is None else codes & set(args['codes'])
+
+        # 日期过滤只在信号之前下推; 信号之后的日期过滤作用于信号日期 (D2可能在其之后)
+        starts = [args['start'] for op, args in before_signals if op == 'filter' and args['start'] is not None]
+        ends = [args['end'] for op, args in before_signals if op == 'filter' and args['end'] is not None]
+
+        # 指标剪枝: 只保留后续步骤用到的
+        requested = []
+        for op, args in before_signals:
+            if op == 'indicators':
+                requested.extend(args['names'])
+        used = set()
+        for op, args in before_signals:
+            if op == 'filter' and args['compiled'] is not None:
+                used |= {_indicator_for_column(col) for col in _expression_columns(args['compiled'])}
+        if has_signals:
+            strategy_args = self.plan[signal_step][1]
+            used |= set(STRATEGY_INDICATORS) | {strategy_args['ma_type']}
+        selects = [args['columns'] for op, args in self.plan if op == 'select']
+        if selects and not has_signals:
+            # 最后一次 select 决定输出列
+            used |= {_indicator_for_column(col) for col in selects[-1]}
+            needed = [name for name in dict.fromkeys(requested) if name in used]
+        else:
+            needed = list(dict.fromkeys(requested))
+        needed += sorted(name for name in used - set(needed) if name is not None)
+
+        specs = {name: _indicator_spec(name) for name in needed}
+        lookbacks = [spec[2] for spec in specs.values()]
+        recursive = any(lookback is None for lookback in lookbacks)
+        # 信号步骤需要前一日J值, 多留一行
+        warmup = None if recursive else max(lookbacks, default=0) + (1 if has_signals else 0)
+
+        usecols = None
+        if selects or has_signals:
+            usecols = {'code', 'date'}
+            for spec in specs.values():
+                usecols |= set(spec[1])
+            for op, args in self.plan:
+                if op == 'filter' and args['compiled'] is not None:
+                    usecols |= {col for col in _expression_columns(args['compiled']) if _indicator_for_column(col) is None}
+                if op == 'select':
+                    usecols |= {col for col in args['columns'] if _indicator_for_column(col) is None}
+            usecols.discard('code_name')
+
+        return {
+            'codes': codes,
+            'constituents': any(op == 'constituents' for op, _ in self.plan),
+            'end': min(ends) if ends else None,
+            'start': max(starts) if starts else None,
+            'warmup': warmup,
+            'indicators': needed,
+            'pruned': [name for name in dict.fromkeys(requested) if name not in needed],
+            'usecols': sorted(usecols) if usecols is not None else None,
+        }
+
+    def explain(self):
+        """Optimized plan as text"""
+        opt = self._optimize()
+        lines = ['LazyPipeline plan:']
+        load = [f"path={self.loader.stock_data_path}"]
+        if opt['constituents']:
+            load.append("codes=HS300 constituents" + (f" & {len(opt['codes'])} codes" if opt['codes'] else ''))
+        elif opt['codes'] is not None:
+            load.append(f"codes={len(opt['codes'])}")
+        if opt['end'] is not None:
+            load.append(f"end={opt['end'].date()}")
+        if opt['usecols'] is not None:
+            load.append(f"usecols={opt['usecols']}")
+        lines.append(f"  load({', '.join(load)})")
+        if opt['start'] is not None:
+            if opt['warmup'] is not None:
+                lines.append(f"  trim(start={opt['start'].date()}, warmup_rows={opt['warmup']})")
+            else:
+                lines.append(f"  no start pushdown (recursive indicators need full history)")
+        lines.append(f"  indicators({opt['indicators']})")
+        if opt['pruned']:
+            lines.append(f"  pruned({opt['pruned']})")
+        for op, args in self.plan:
+            if op in ('filter', 'signals', 'select'):
+                shown = {key: value for key, value in args.items()
+                         if value is not None and key != 'compiled' and key != 'strategy'}
+                if op == 'signals':
+                    shown['strategy'] = type(args['strategy']).__name__
+                if 'codes' in shown:
+                    shown['codes'] = len(shown['codes'])
+                lines.append(f"  {op}({', '.join(f'{k}={v}' for k, v in shown.items())})")
+        return '\n'.join(lines)
+
+    # ------------------------------------------------------------ execution
+
+    def collect(self):
+        """Run the optimized plan and return the resulting frame"""
+        opt = self._optimize()
+        codes = opt['codes']
+        constituents = None
+        if opt['constituents']:
+            constituents = self.loader.load_hs300_constituents()[['code', 'code_name']]
+            members = set(constituents['code'])
+            codes = members if codes is None else codes & members
+
+        df = self.loader.load_stock_data(codes=codes, end=opt['end'], usecols=opt['usecols'])
+        if constituents is not None:
+            with PROFILER.stage('merge_constituents', rows=len(df)):
+                df = pd.merge(df, constituents, on='code', how='inner')
+
+        if opt['start'] is not None and opt['warmup'] is not None:
+            # 窗口类指标只需要起始日期前 warmup 行历史
+            first = (df['date'] >= opt['start']).groupby(df['code']).transform('idxmax')
+            position = df.groupby('code').cumcount()
+            first_position = position.loc[first.values].values
+            df = df[position.values >= first_position - opt['warmup']]
+
+        for name in opt['indicators']:
+            df = _compute_indicator(df, name)
+
+        in_signals = False
+        for op, args in self.plan:
+            if op == 'filter':
+                df = self._apply_filter(df, args, in_signals)
+            elif op == 'signals':
+                df = args['strategy'].find_trading_signals(df, ma_type=args['ma_type'])
+                in_signals = True
+            elif op == 'select':
+                df = df[args['columns']]
+        return df.reset_index(drop=True)
+
+    @staticmethod
+    def _apply_filter(df, args, in_signals):
+        if df.empty:
+            return df
+        mask = pd.Series(True, index=df.index)
+        if args['codes'] is not None:
+            mask &= df['code'].isin(args['codes'])
+        date_col = 'date'
+        if in_signals:
+            date_col = 'D1日期' if 'D1日期' in df.columns else '信号日期'
+        if args['start'] is not None:
+            mask &= pd.to_datetime(df[date_col]) >= args['start']
+        if args['end'] is not None:
+            mask &= pd.to_datetime(df[date_col]) <= args['end']
+        if args['expr'] is not None:
+            mask &= RuleSet({'filter': args['expr']}).evaluate(df)['filter']
+        return df[mask.values]
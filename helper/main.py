@@ -1,6 +1,10 @@
 import pandas as pd
-from data_loader import DataLoader
-from strategy import TradingStrategyA, TradingStrategyB, TradingStrategyC
+from .data_loader import DataLoader
+from .strategy import TradingStrategyA, TradingStrategyB, TradingStrategyC
+from .profiler import PROFILER
+from .significance import bootstrap_metrics, placebo_test
+from .price_index import PriceIndex
+from .risk import RiskEngine
 import os
 
 
@@ -30,7 +34,8 @@ def get_strategy_columns(strategy_name):
             'D2_MACD_DIF', 'D2_MACD_DEA', 'D2_MACD',
             'D1_BOLL中轨', 'D1_BOLL上轨', 'D1_BOLL下轨',
             'D2_BOLL中轨', 'D2_BOLL上轨', 'D2_BOLL下轨',
-            '持仓天数'
+            '持仓天数', '持仓交易日',
+            'MAE', 'MFE', 'MFE用时', '最大回撤'
         ]
 
 
@@ -43,7 +48,8 @@ def main():
     stock_data = data_loader.load_stock_data()
     hs300_constituents = data_loader.load_hs300_constituents()
     
-    stock_data = pd.merge(stock_data, hs300_constituents[['code', 'code_name']], on='code', how='inner')
+    with PROFILER.stage('merge_constituents', rows=len(stock_data)):
+        stock_data = pd.merge(stock_data, hs300_constituents[['code', 'code_name']], on='code', how='inner')
     
     # 选择策略
     strategy_name = input("请选择策略 (A/B/C): ").upper()
@@ -51,10 +57,10 @@ def main():
         strategy = TradingStrategyA()
         date_col = '信号日期'
     elif strategy_name == 'B':
-        strategy = TradingStrategyB()
+        strategy = TradingStrategyB(excursions=True)
         date_col = 'D1日期'  # 策略B使用'D1日期'作为日期列
     elif strategy_name == 'C':
-        strategy = TradingStrategyC(j_diff_threshold=20)
+        strategy = TradingStrategyC(j_diff_threshold=20, excursions=True)
         date_col = 'D1日期'
     else:
         print("无效的策略选择")
@@ -67,41 +73,40 @@ def main():
     print("\n策略返回的数据框列名:")
     print(signals.columns.tolist())
     
-    signals = pd.merge(signals, hs300_constituents[['code', 'code_name']], on='code', how='left')
+    with PROFILER.stage('merge_signal_names', rows=len(signals)):
+        signals = pd.merge(signals, hs300_constituents[['code', 'code_name']], on='code', how='left')
 
-    # 计算不同时间段的收益率
-    returns_5 = strategy.calculate_returns(prepared_data, signals, days=5)
-    returns_10 = strategy.calculate_returns(prepared_data, signals, days=10)
-    returns_30 = strategy.calculate_returns(prepared_data, signals, days=30)
+    # 信号日的EWMA年化波动率 (只用信号日及之前的收益率)
+    vol_col = '年化波动率' if strategy_name == 'A' else 'D1_年化波动率'
+    with PROFILER.stage('attach_volatility', rows=len(signals)):
+        signals = RiskEngine(prepared_data).attach_to_signals(signals, date_col=date_col, column=vol_col)
+
+    # 计算不同时间段的收益率, 共用一个 (代码, 日期) 行索引
+    price_index = PriceIndex(prepared_data)
+    returns_5 = strategy.calculate_returns(prepared_data, signals, days=5, index=price_index)
+    returns_10 = strategy.calculate_returns(prepared_data, signals, days=10, index=price_index)
+    returns_30 = strategy.calculate_returns(prepared_data, signals, days=30, index=price_index)
     
     print("\n=== 策略回测结果 ===")
     print(f"找到的交易信号总数: {len(signals)}")
     
     if len(signals) == 0:
         print("\n无交易信号")
+        PROFILER.report()
         return
     
     print("\n=== 交易信号明细 ===")
     
-    # 将日期转换为字符串格式
-    signals[f'{date_col}_str'] = pd.to_datetime(signals[date_col]).dt.strftime('%Y-%m-%d')
-    
-    # 添加不同时间段的收益率到signals
-    for days, returns in [(5, returns_5), (10, returns_10), (30, returns_30)]:
-        if not returns.empty:
-            # 将returns中的日期也转换为字符串格式
-            returns['signal_date_str'] = returns['signal_date'].dt.strftime('%Y-%m-%d')
-            signals = pd.merge(signals, returns[['code', 'signal_date_str', 'return']], 
-                             left_on=['code', f'{date_col}_str'], 
-                             right_on=['code', 'signal_date_str'], 
-                             how='left')
-            signals = signals.rename(columns={'return': f'{days}日收益率'})
-            signals = signals.drop(['signal_date_str'], axis=1)
-        else:
-            signals[f'{days}日收益率'] = None
-    
-    # 删除临时列
-    signals = signals.drop([f'{date_col}_str'], axis=1)
+    with PROFILER.stage('merge_returns', rows=len(signals)):
+        # 按行位置拼接收益率, 不再比较日期字符串
+        signal_pos = price_index.locate(signals['code'].values, signals[date_col].values)
+        for days, returns in [(5, returns_5), (10, returns_10), (30, returns_30)]:
+            if not returns.empty:
+                return_pos = price_index.locate(returns['code'].values, returns['signal_date'].values)
+                by_row = pd.Series(returns['return'].values, index=return_pos)
+                signals[f'{days}日收益率'] = by_row.reindex(signal_pos).values
+            else:
+                signals[f'{days}日收益率'] = None
     
     # 格式化日期显示
     signals[date_col] = pd.to_datetime(signals[date_col]).dt.strftime('%Y-%m-%d')
@@ -125,7 +130,8 @@ def main():
             'D2_MACD_DIF', 'D2_MACD_DEA', 'D2_MACD',
             'D1_BOLL中轨', 'D1_BOLL上轨', 'D1_BOLL下轨',
             'D2_BOLL中轨', 'D2_BOLL上轨', 'D2_BOLL下轨',
-            '持仓天数'
+            '持仓天数', '持仓交易日',
+            'MAE', 'MFE', 'MFE用时', '最大回撤'
         ]
     else:  # 策略C
         display_columns = [
@@ -138,9 +144,15 @@ def main():
             'D2_MACD_DIF', 'D2_MACD_DEA', 'D2_MACD',
             'D1_BOLL中轨', 'D1_BOLL上轨', 'D1_BOLL下轨',
             'D2_BOLL中轨', 'D2_BOLL上轨', 'D2_BOLL下轨',
-            '持仓天数'
+            '持仓天数', '持仓交易日',
+            'MAE', 'MFE', 'MFE用时', '最大回撤'
         ]
     
+    display_columns.append(vol_col)
+
+    # 显著性检验使用未四舍五入的收益率, 四舍五入只用于展示
+    trade_returns = signals['D1-D2收益率'].copy() if 'D1-D2收益率' in signals.columns else None
+
     # 对数值列进行四舍五入
     numeric_columns = [col for col in signals.columns if col not in ['code', 'code_name', date_col]]
     signals[numeric_columns] = signals[numeric_columns].round(2)
@@ -163,11 +175,27 @@ def main():
             print(f"{days}天胜率: {(returns['return'] > 0).mean() * 100:.2f}%")
         else:
             print(f"\n{days}天收益率数据不足")
+
+    # 显著性检验: Bootstrap置信区间 + 相同日期随机入场对照
+    print(f"\n=== 显著性检验 ===")
+    if trade_returns is not None and len(trade_returns) > 1:
+        print("\nD1-D2收益率 Bootstrap:")
+        print(bootstrap_metrics(trade_returns, seed=0).round(4))
+    for days, returns in [(5, returns_5), (10, returns_10), (30, returns_30)]:
+        if len(returns) > 1:
+            with PROFILER.stage(f'significance_{days}d', rows=len(returns)):
+                print(f"\n{days}天收益率 Bootstrap:")
+                print(bootstrap_metrics(returns['return'], seed=0).round(4))
+                print(f"\n{days}天收益率 随机入场对照:")
+                print(placebo_test(prepared_data, returns, days=days, date_col='signal_date', seed=0).round(4))
         
     print(f"\n=== 信号时间分布 ===")
     signals_by_month = signals.groupby(pd.to_datetime(signals[date_col]).dt.to_period('M')).size()
     print("\n每月信号数量:")
     print(signals_by_month)
+
+    # 性能统计 (QT_PROFILE=1 时开启)
+    PROFILER.report()
     
 if __name__ == "__main__":
     main()
\ No newline at end of file
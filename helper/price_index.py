@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+
+from .trading_calendar import TradingCalendar
+
+
+"""
+(代码, 交易日) -> 行位置 索引
+- 加载数据后构建一次: 代码编号 x 交易日序号 合成有序键, 每只股票占一段连续区间
+- 批量查找用一次 searchsorted 完成, 不再对整张表做布尔过滤
+- 策略、收益率计算和 main.py 的结果拼接共用同一个索引
+"""
+
+
+class PriceIndex:
+    """
+    行情行索引
+    Batched (code, date) -> row lookups and trading-day offsets over a long price frame
+    """
+    def __init__(self, df, calendar=None, date_col='date'):
+        """
+        df: long price frame with 'code' and date_col (any row order, one row per code and date)
+        calendar: TradingCalendar (default: built from the frame's dates)
+        """
+        self.df = df
+        self.date_col = date_col
+        self.calendar = TradingCalendar.from_data(df, date_col) if calendar is None else calendar
+        self.codes = pd.Index(pd.unique(df['code'].values))
+        code_ids = self.codes.get_indexer(df['code'].values).astype(np.int64)
+        ordinals = self.calendar.ordinal(df[date_col].values)
+        if (ordinals < 0).any():
+            raise ValueError("Frame contains dates that are not in the trading calendar")
+
+        self._stride = len(self.calendar) + 1
+        keys = code_ids * self._stride + ordinals
+        self._order = np.argsort(keys, kind='stable')
+        self._keys = keys[self._order]
+        if len(self._keys) > 1 and (np.diff(self._keys) == 0).any():
+            raise ValueError(f"Duplicate (code, {date_col}) rows")
+        # 每只股票在有序键中的区间 [starts, ends)
+        self._starts = np.searchsorted(self._keys, np.arange(len(self.codes)) * self._stride, side='left')
+        self._ends = np.r_[self._starts[1:], len(self._keys)]
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _code_ids(self, codes):
+        return self.codes.get_indexer(np.asarray(codes, dtype=object))
+
+    def locate(self, codes, dates, how='exact'):
+        """
+        Row positions of (code, date) pairs, -1 when missing
+        how: 'exact' - the bar on that date
+             'prev'  - the code's last bar on or before the date (as-of lookup)
+             'next'  - the code's first bar on or after the date
+        """
+        if how not in ('exact', 'prev', 'next'):
+            raise ValueError(f"Unknown lookup mode: {how}")
+        code_ids = self._code_ids(codes)
+        ordinals = self.calendar.ordinal(dates, how=how)
+        return self._locate_ordinals(code_ids, ordinals, how)
+
+    def _locate_ordinals(self, code_ids, ordinals, how):
+        if len(self._keys) == 0:
+            return np.full(len(code_ids), -1, dtype=np.int64)
+        valid = (code_ids >= 0) & (ordinals >= 0)
+        safe_ids = np.where(valid, code_ids, 0)
+        targets = safe_ids * self._stride + np.where(valid, ordinals, 0)
+        starts, ends = self._starts[safe_ids], self._ends[safe_ids]
+        if how == 'prev':
+            pos = np.searchsorted(self._keys, targets, side='right') - 1
+            valid &= pos >= starts
+        else:
+            pos = np.searchsorted(self._keys, targets, side='left')
+            valid &= pos < ends
+            if how == 'exact':
+                valid &= self._keys[np.minimum(pos, len(self._keys) - 1)] == targets
+        pos = np.clip(pos, 0, len(self._keys) - 1)
+        return np.where(valid, self._order[pos], -1)
+
+    def offset(self, codes, dates, k, how='next'):
+        """
+        Row positions of the bar k trading days after each (code, date), -1 when beyond the data
+        how: 'exact' - only a bar on exactly that trading day
+             'next'  - first bar of the code on or after that day (exit delayed by a suspension)
+        """
+        if how not in ('exact', 'next'):
+            raise ValueError(f"Unknown lookup mode: {how}")
+        code_ids = self._code_ids(codes)
+        ordinals = self.calendar.ordinal(dates)
+        shifted = np.where((ordinals >= 0) & (ordinals + k >= 0) & (ordinals + k < len(self.calendar)), ordinals + k, -1)
+        return self._locate_ordinals(code_ids, shifted, how)
+
+    def values(self, positions, field):
+        """Column values at row positions (NaN where the position is -1)"""
+        positions = np.asarray(positions, dtype=np.int64)
+        column = self.df[field].to_numpy(dtype=np.float64)
+        return np.where(positions >= 0, column[np.maximum(positions, 0)], np.nan)
+
+    def lookup(self, codes, dates, field, how='exact'):
+        """Field values of (code, date) pairs, NaN when missing"""
+        return self.values(self.locate(codes, dates, how=how), field)
+
+    def forward_index(self, k, how='next'):
+        """For every row of the frame, the row position k trading days later (-1 if none)"""
+        return self.offset(self.df['code'].values, self.df[self.date_col].values, k, how=how)
+
+    def forward_return(self, codes, dates, k, field='close'):
+        """Return (in %) from each (code, date) to the bar k trading days later, NaN when unavailable"""
+        start = self.lookup(codes, dates, field)
+        end = self.values(self.offset(codes, dates, k), field)
+        return (end / start - 1) * 100
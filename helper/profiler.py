@@ -0,0 +1,217 @@
+import csv
+import functools
+import json
+import os
+import time
+import tracemalloc
+
+import pandas as pd
+
+
+"""
+流水线性能分析
+- 按阶段记录墙钟时间、CPU时间、处理行数、峰值内存
+- 通过环境变量 QT_PROFILE=1 或 PROFILER.enable() 开启, 关闭时几乎没有额外开销
+- QT_PROFILE_MEMORY=0 关闭 tracemalloc 内存跟踪
+- QT_PROFILE_OUTPUT=trace.json / trace.csv 在结束时导出跟踪记录
+"""
+
+
+def _env_flag(name, default):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() not in ('', '0', 'false', 'no', 'off')
+
+
+class _NullStage:
+    """Shared no-op context used while profiling is disabled"""
+    rows = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    def __init__(self, profiler, name, rows):
+        self.profiler = profiler
+        self.name = name
+        self.rows = rows
+        self.peak = 0
+
+    def __enter__(self):
+        prof = self.profiler
+        self.parent = prof._stack[-1] if prof._stack else None
+        if prof.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if self.parent is not None:
+                self.parent.peak = max(self.parent.peak, peak)
+            tracemalloc.reset_peak()
+            self.start_mem = current
+            self.peak = current
+        prof._stack.append(self)
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self.start_wall
+        cpu = time.process_time() - self.start_cpu
+        prof = self.profiler
+        prof._stack.pop()
+        peak_mb = None
+        if prof.trace_memory:
+            self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            peak_mb = (self.peak - self.start_mem) / 1024 ** 2
+            if self.parent is not None:
+                self.parent.peak = max(self.parent.peak, self.peak)
+            tracemalloc.reset_peak()
+        prof.records.append({
+            'stage': self.name,
+            'parent': self.parent.name if self.parent is not None else None,
+            'depth': len(prof._stack),
+            'start_s': self.start_wall - prof._origin,
+            'wall_s': wall,
+            'cpu_s': cpu,
+            'rows': self.rows,
+            'peak_mb': peak_mb,
+            'error': exc_type.__name__ if exc_type is not None else None,
+        })
+        return False
+
+
+class StageProfiler:
+    """
+    阶段性能分析器
+    Records wall time, CPU time, rows processed and peak allocated memory per stage
+    """
+    def __init__(self, enabled=None, trace_memory=None):
+        """
+        enabled: turn profiling on (default: QT_PROFILE environment variable)
+        trace_memory: track peak memory with tracemalloc (default: QT_PROFILE_MEMORY, on)
+        """
+        self.enabled = False
+        self.trace_memory = False
+        self.records = []
+        self._stack = []
+        self._origin = time.perf_counter()
+        if enabled is None:
+            enabled = _env_flag('QT_PROFILE', False)
+        if enabled:
+            self.enable(trace_memory)
+
+    def enable(self, trace_memory=None):
+        """Start recording stages"""
+        if trace_memory is None:
+            trace_memory = _env_flag('QT_PROFILE_MEMORY', True)
+        self.enabled = True
+        self.trace_memory = trace_memory
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def disable(self):
+        """Stop recording stages"""
+        self.enabled = False
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.trace_memory = False
+
+    def reset(self):
+        """Drop all recorded stages"""
+        self.records = []
+        self._origin = time.perf_counter()
+
+    def stage(self, name, rows=None):
+        """
+        Context manager timing one stage
+        name: stage name
+        rows: rows processed (can also be set on the returned object inside the block)
+        """
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name, rows)
+
+    def trace(self):
+        """Recorded stages as a DataFrame"""
+        return pd.DataFrame(self.records, columns=[
+            'stage', 'parent', 'depth', 'start_s', 'wall_s', 'cpu_s', 'rows', 'peak_mb', 'error'
+        ])
+
+    def summary(self):
+        """Per-stage totals sorted by wall time"""
+        trace = self.trace()
+        if trace.empty:
+            return trace
+        summary = trace.groupby('stage').agg(
+            calls=('stage', 'size'),
+            wall_s=('wall_s', 'sum'),
+            cpu_s=('cpu_s', 'sum'),
+            rows=('rows', 'sum'),
+            peak_mb=('peak_mb', 'max'),
+        )
+        summary['rows_per_s'] = summary['rows'] / summary['wall_s'].where(summary['wall_s'] > 0)
+        return summary.sort_values('wall_s', ascending=False)
+
+    def export(self, path):
+        """Write the trace as JSON (.json) or CSV (any other extension)"""
+        if str(path).endswith('.json'):
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(self.records, f, ensure_ascii=False, indent=2)
+        else:
+            with open(path, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.DictWriter(f, fieldnames=list(self.trace().columns))
+                writer.writeheader()
+                writer.writerows(self.records)
+        print(f"Profile trace saved to {path}...")
+
+    def report(self, output_path=None):
+        """Print the summary table and export the trace (default path: QT_PROFILE_OUTPUT)"""
+        if not self.enabled:
+            return
+        print("\n=== 阶段性能统计 ===")
+        with pd.option_context('display.width', None, 'display.max_rows', None):
+            print(self.summary().round(4).to_string())
+        output_path = output_path or os.environ.get('QT_PROFILE_OUTPUT')
+        if output_path:
+            self.export(output_path)
+
+
+PROFILER = StageProfiler()
+
+
+def _stage_label(name, kwargs):
+    if not kwargs:
+        return name
+    params = ', '.join(f'{k}={v}' for k, v in kwargs.items() if isinstance(v, (int, float, str)))
+    return f'{name}({params})' if params else name
+
+
+def profile_stage(name=None, profiler=None):
+    """
+    Decorator recording a function call as a stage
+    name: stage name (default: the function's qualified name); scalar keyword
+          arguments are appended, e.g. TechnicalAnalysis.calculate_wr(period=14)
+    profiler: StageProfiler to record into (default: PROFILER)
+    """
+    def decorator(func):
+        stage_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            prof = profiler or PROFILER
+            if not prof.enabled:
+                return func(*args, **kwargs)
+            rows = next((len(a) for a in args if isinstance(a, pd.DataFrame)), None)
+            with prof.stage(_stage_label(stage_name, kwargs), rows) as stage:
+                result = func(*args, **kwargs)
+                if stage.rows is None and isinstance(result, pd.DataFrame):
+                    stage.rows = len(result)
+                return result
+        return wrapper
+    return decorator
@@ -0,0 +1,168 @@
+import numpy as np
+import pandas as pd
+
+from .technical_analysis import TechnicalAnalysis
+from .trading_calendar import TradingCalendar
+
+
+"""
+市场状态过滤
+- 由成分股行情一次性展开成 (日期 x 代码) 矩阵, 逐日向量化计算:
+    合成指数     成分股日收益的等权 / 前一日成交额加权平均, 连乘成指数 (基点1000)
+    趋势向上     合成指数在其60日均线上方
+    市场宽度     收盘价在20日均线上方的股票占比 (%)
+    J值离散度    当日各股J值的截面标准差
+- 结果按交易日序号存成稠密数组, 任意日期的查询都是 O(1) 查表
+- RegimeGate 把过滤条件预先算成每个交易日一个布尔值, 策略的 find_trading_signals 只保留允许入场日期的D1
+"""
+
+
+WEIGHTINGS = ('equal', 'amount')
+REGIME_COLUMNS = ['合成指数', '合成指数MA', '趋势向上', '市场宽度', 'J值离散度', '样本数']
+
+
+class MarketRegime:
+    """
+    市场状态
+    Composite index and regime flags of the loaded constituents, indexed by trading day
+    """
+    def __init__(self, table, calendar=None):
+        """
+        table: DataFrame indexed by date with REGIME_COLUMNS (see from_data)
+        calendar: TradingCalendar of the table's dates (default: built from the index)
+        """
+        self.table = table
+        self.calendar = TradingCalendar(table.index.values) if calendar is None else calendar
+        # 交易日序号 -> 表中行号, 日历与表日期一致时即为恒等映射
+        self._rows = pd.Index(table.index).get_indexer(self.calendar.dates)
+
+    @classmethod
+    def from_data(cls, df, weighting='equal', ma_window=60, breadth_ma='ma20', base=1000.0):
+        """
+        Build the regime table from a long price frame in one pass
+        df: frame with 'code', 'date', 'close' (plus 'preclose', 'amount', breadth_ma and 'kdj_j' when available)
+        weighting: 'equal' or 'amount' (previous day's turnover amount)
+        ma_window: moving-average window of the composite trend flag
+        breadth_ma: MA column compared with the close for breadth (computed when missing)
+        base: composite level on the first date
+        """
+        if weighting not in WEIGHTINGS:
+            raise ValueError(f"Unknown weighting: {weighting}")
+        df = df.sort_values(['code', 'date'])
+        ta = TechnicalAnalysis()
+        if breadth_ma not in df.columns:
+            df = df.assign(**{breadth_ma: ta.calculate_ma(df, window=int(breadth_ma[2:]))})
+        if 'kdj_j' not in df.columns:
+            df = ta.calculate_kdj(df)
+
+        # 日收益: 优先用交易所前收盘价 (已处理除权), 否则用同一只股票的上一行收盘价
+        close = df['close'].to_numpy(dtype=np.float64)
+        if 'preclose' in df.columns:
+            prev_close = df['preclose'].to_numpy(dtype=np.float64)
+        else:
+            prev_close = df.groupby('code')['close'].shift(1).to_numpy(dtype=np.float64)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            returns = close / prev_close - 1
+
+        date_ids, dates = pd.factorize(df['date'], sort=True)
+        code_ids, codes = pd.factorize(df['code'], sort=True)
+
+        def panel(values):
+            out = np.full((len(dates), len(codes)), np.nan)
+            out[date_ids, code_ids] = values
+            return out
+
+        ret = panel(returns)
+        if weighting == 'amount':
+            # 用前一日成交额加权, 避免当日成交额带来的前视偏差
+            amount = panel(df['amount'].to_numpy(dtype=np.float64))
+            weights = np.vstack([np.full((1, len(codes)), np.nan), amount[:-1]])
+        else:
+            weights = np.ones_like(ret)
+        valid = ~np.isnan(ret) & ~np.isnan(weights) & (weights > 0)
+        weights = np.where(valid, weights, 0.)
+        weight_sum = weights.sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            index_ret = np.where(weight_sum > 0, (np.where(valid, ret, 0.) * weights).sum(axis=1) / weight_sum, 0.)
+        index_ret[0] = 0.
+        level = base * np.cumprod(1 + index_ret)
+        level_ma = pd.Series(level).rolling(ma_window, min_periods=ma_window).mean().values
+
+        above = panel((close > df[breadth_ma].to_numpy(dtype=np.float64)).astype(np.float64))
+        has_ma = panel(df[breadth_ma].notna().to_numpy(dtype=np.float64)) == 1
+        counted = has_ma.sum(axis=1)
+        j = panel(df['kdj_j'].to_numpy(dtype=np.float64))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            breadth = np.where(counted > 0, np.where(has_ma, above, 0.).sum(axis=1) / counted * 100, np.nan)
+            j_count = np.sum(~np.isnan(j), axis=1)
+            j_mean = np.nansum(j, axis=1) / j_count
+            j_dispersion = np.sqrt(np.nansum((j - j_mean[:, None]) ** 2, axis=1) / (j_count - 1))
+
+        trend = np.where(np.isnan(level_ma), np.nan, (level > level_ma).astype(np.float64))
+        table = pd.DataFrame({
+            '合成指数': level,
+            '合成指数MA': level_ma,
+            '趋势向上': trend,
+            '市场宽度': breadth,
+            'J值离散度': j_dispersion,
+            '样本数': valid.sum(axis=1),
+        }, index=pd.DatetimeIndex(dates, name='date'))
+        return cls(table)
+
+    def lookup(self, dates, column):
+        """Values of a regime column on the given dates (NaN for dates outside the table)"""
+        ordinals = self.calendar.ordinal(dates)
+        rows = np.where(ordinals >= 0, self._rows[np.maximum(ordinals, 0)], -1)
+        values = self.table[column].to_numpy(dtype=np.float64)
+        return np.where(rows >= 0, values[np.maximum(rows, 0)], np.nan)
+
+    def to_file(self, path):
+        """Save the regime table as CSV readable by from_file"""
+        self.table.to_csv(path, encoding='utf-8-sig')
+
+    @classmethod
+    def from_file(cls, path):
+        table = pd.read_csv(path, index_col='date', parse_dates=['date'], encoding='utf-8-sig')
+        return cls(table[REGIME_COLUMNS])
+
+
+class RegimeGate:
+    """
+    市场状态过滤器
+    Per-trading-day entry permission derived from a MarketRegime, O(1) per lookup
+    """
+    def __init__(self, regime, require_uptrend=True, min_breadth=None, max_j_dispersion=None, allow_missing=True):
+        """
+        regime: MarketRegime
+        require_uptrend: only allow entries while the composite is above its MA
+        min_breadth: minimum share of codes above their MA (in %), None to ignore
+        max_j_dispersion: maximum cross-sectional J std, None to ignore
+        allow_missing: allow entries on days where a used flag is not available yet (MA warm-up)
+        """
+        self.regime = regime
+        table = regime.table
+        allowed = np.ones(len(table), dtype=bool)
+        conditions = []
+        if require_uptrend:
+            conditions.append((table['趋势向上'].to_numpy(dtype=np.float64), lambda v: v == 1))
+        if min_breadth is not None:
+            conditions.append((table['市场宽度'].to_numpy(dtype=np.float64), lambda v: v >= min_breadth))
+        if max_j_dispersion is not None:
+            conditions.append((table['J值离散度'].to_numpy(dtype=np.float64), lambda v: v <= max_j_dispersion))
+        for values, test in conditions:
+            with np.errstate(invalid='ignore'):
+                passed = test(values)
+            allowed &= np.where(np.isnan(values), allow_missing, passed)
+        self.allowed = allowed
+        self.allow_missing = allow_missing
+
+    def allows(self, dates):
+        """Boolean array: entries allowed on each date (dates outside the regime table follow allow_missing)"""
+        ordinals = self.regime.calendar.ordinal(dates)
+        rows = np.where(ordinals >= 0, self.regime._rows[np.maximum(ordinals, 0)], -1)
+        return np.where(rows >= 0, self.allowed[np.maximum(rows, 0)], self.allow_missing)
+
+    def summary(self):
+        """Share of trading days on which entries are allowed"""
+        return {'days': len(self.allowed), 'allowed_days': int(self.allowed.sum()),
+                'allowed_pct': float(self.allowed.mean() * 100) if len(self.allowed) else 0.0}
@@ -0,0 +1,169 @@
+import numpy as np
+import pandas as pd
+
+
+class RiskSnapshot:
+    """
+    风险快照
+    Volatility and EWMA covariance of every code as of one date
+    """
+    def __init__(self, date, volatility, covariance):
+        self.date = date
+        self.volatility = volatility
+        self.covariance = covariance
+
+    @property
+    def correlation(self):
+        """Correlation matrix derived from the covariance matrix"""
+        std = np.sqrt(np.diag(self.covariance.values))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            corr = self.covariance.values / np.outer(std, std)
+        np.fill_diagonal(corr, 1.0)
+        return pd.DataFrame(corr, index=self.covariance.index, columns=self.covariance.columns)
+
+
+class RiskEngine:
+    """
+    风险引擎
+    Time-varying volatility and covariance over the (date x code) price panel
+    """
+    def __init__(self, df, price_col='close', annualization=252):
+        """
+        df: long price frame with 'date', 'code' and price_col
+        price_col: price column used for log returns
+        annualization: trading days per year
+        """
+        self.annualization = annualization
+        prices = df.pivot_table(index='date', columns='code', values=price_col, aggfunc='last')
+        self.returns = np.log(prices.sort_index()).diff()
+        self._cov_state = None
+
+    def rolling_volatility(self, window=20, min_periods=None):
+        """
+        Annualized rolling volatility for every code in one pass
+        window: lookback in trading days
+        """
+        std = self.returns.rolling(window=window, min_periods=min_periods or window).std()
+        return std * np.sqrt(self.annualization)
+
+    def ewma_volatility(self, lam=0.94, min_periods=20):
+        """
+        Annualized EWMA (RiskMetrics) volatility for every code in one pass
+        lam: decay factor, var_t = lam * var_{t-1} + (1 - lam) * r_t^2
+        """
+        var = self.returns.pow(2).ewm(alpha=1 - lam, adjust=False, min_periods=min_periods).mean()
+        return np.sqrt(var * self.annualization)
+
+    def iter_covariance(self, dates=None, lam=0.94, warmup=20):
+        """
+        Incrementally updated EWMA covariance, yielding a RiskSnapshot per requested date
+        dates: dates to snapshot (default: every date after warmup)
+        lam: decay factor, cov_t = lam * cov_{t-1} + (1 - lam) * r_t r_t' (zero-mean, like ewma_volatility)
+        warmup: number of initial returns used to seed the covariance
+
+        The seed is the zero-mean second moment of the warmup returns. A missing
+        return (suspension, not yet listed) leaves the pairs of that code
+        unchanged for the day instead of counting as a zero return. Runs of
+        fully observed days between two requested dates are applied as one
+        weighted block update, cov = lam^B * cov + (1 - lam) * R' W R, so the
+        cost is a single matrix product per run rather than an outer product per day.
+        """
+        returns = self.returns.iloc[1:]
+        values = returns.values
+        observed = ~np.isnan(values)
+        values = np.where(observed, values, 0.0)
+        complete = observed.all(axis=1)
+        all_dates = returns.index
+        codes = returns.columns
+
+        if dates is None:
+            targets = np.arange(warmup, len(all_dates))
+        else:
+            targets = all_dates.searchsorted(pd.to_datetime(pd.Index(dates)), side='right') - 1
+            targets = np.unique(targets[targets >= warmup - 1])
+
+        state = self._cov_state
+        if state is not None and state[2:] == (lam, warmup) and (len(targets) == 0 or targets[0] >= state[0]):
+            # 从上一次的状态继续递推
+            pos, cov = state[0], state[1].copy()
+        else:
+            # 用前warmup个收益率的零均值二阶矩初始化 (与递推的零均值假设一致), 缺失值成对剔除
+            seed, seen = values[:warmup], observed[:warmup].astype(np.float64)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                cov = np.nan_to_num((seed.T @ seed) / (seen.T @ seen))
+            pos = warmup - 1
+        vol_scale = np.sqrt(self.annualization)
+
+        for target in targets:
+            day = pos + 1
+            while day <= target:
+                if complete[day]:
+                    # 连续的无缺失交易日合并为一次加权块更新
+                    run = complete[day:target + 1]
+                    end = day + (len(run) if run.all() else int(np.argmin(run)))
+                    block = values[day:end]
+                    weights = (1 - lam) * lam ** np.arange(len(block) - 1, -1, -1)
+                    cov *= lam ** len(block)
+                    cov += block.T @ (block * weights[:, None])
+                    day = end
+                else:
+                    # 有缺失的交易日只更新两只股票都有收益率的配对
+                    both = np.outer(observed[day], observed[day])
+                    cov = np.where(both, lam * cov + (1 - lam) * np.outer(values[day], values[day]), cov)
+                    day += 1
+            pos = max(pos, target)
+            self._cov_state = (pos, cov.copy(), lam, warmup)
+            cov_df = pd.DataFrame(cov * self.annualization, index=codes, columns=codes)
+            volatility = pd.Series(np.sqrt(np.diag(cov)) * vol_scale, index=codes, name='annual_volatility')
+            yield RiskSnapshot(all_dates[pos], volatility, cov_df)
+
+    def snapshot(self, date, lam=0.94, warmup=20):
+        """Risk snapshot (annualized volatility, covariance, correlation) as of date"""
+        for snap in self.iter_covariance(dates=[date], lam=lam, warmup=warmup):
+            return snap
+        raise ValueError(f"Not enough history before {date} for a {warmup}-day warmup")
+
+    def annual_volatility(self, date=None, method='ewma', **kwargs):
+        """
+        Per-code annual volatility as of date, in the layout of 沪深300-价格波动率.csv
+        method: 'ewma' or 'rolling'
+        """
+        vol = self._volatility_panel(method, **kwargs)
+        if date is not None:
+            vol = vol.loc[:pd.Timestamp(date)]
+        latest = vol.ffill().iloc[-1]
+        return latest.rename('annual_volatility').rename_axis('code').reset_index()
+
+    def attach_to_signals(self, signals, date_col='D1日期', method='ewma', column='D1_年化波动率', **kwargs):
+        """
+        Add the point-in-time volatility of each signal's code on its signal date
+        signals: signal frame with 'code' and date_col
+        """
+        vol = self._volatility_panel(method, **kwargs)
+        vol_long = vol.stack().rename(column).reset_index()
+        signals = signals.copy()
+        signal_dates = pd.to_datetime(signals[date_col])
+        merged = pd.merge(
+            pd.DataFrame({'code': signals['code'].values, 'date': signal_dates.values}),
+            vol_long, on=['code', 'date'], how='left'
+        )
+        signals[column] = merged[column].values
+        return signals
+
+    def target_weights(self, date, codes=None, target_vol=0.15, max_weight=1.0, method='ewma', **kwargs):
+        """
+        Inverse-volatility position sizes scaled to a per-position target volatility
+        target_vol: annualized volatility budget per position
+        max_weight: cap on any single weight
+        """
+        vol = self._volatility_panel(method, **kwargs).loc[:pd.Timestamp(date)].ffill().iloc[-1]
+        if codes is not None:
+            vol = vol.reindex(codes)
+        return (target_vol / vol).clip(upper=max_weight).rename('weight')
+
+    def _volatility_panel(self, method, **kwargs):
+        if method == 'ewma':
+            return self.ewma_volatility(**kwargs)
+        if method == 'rolling':
+            return self.rolling_volatility(**kwargs)
+        raise ValueError(f"Unknown volatility method: {method}")
@@ -0,0 +1,290 @@
+import ast
+import re
+
+import numpy as np
+import pandas as pd
+
+from .technical_analysis import TechnicalAnalysis
+from . import kernels
+from .bitset import BitmapStore
+
+
+"""
+信号规则表达式
+- 例: close > ma(20) & cross_below(kdj_j, 0)
+- 表达式编译为向量化布尔数组, 在按代码分段的行上计算
+- 同一批规则中相同的子表达式只计算一次
+- 缺少的指标列按需计算 (ma20, kdj_j, wr_14, macd, boll_mid_20 ...)
+
+函数:
+    ma(n)               n日均线 (等价于列 ma{n})
+    wr(n)               n日WR (等价于列 wr_{n})
+    prev(x, k=1)        同一只股票k行之前的值 (条件的前值在每只股票的前k行为 False)
+    cross_below(x, y)   x < y 且前一日 x >= y   (例: J值转负)
+    cross_above(x, y)   x >= y 且前一日 x < y   (例: J值转正)
+    abs(x)
+运算: > >= < <= == !=  & | ~ (and / or / not 同义, 优先级低于比较)  + - * /
+类型: 比较和算术的操作数为数值, & | ~ 的操作数为条件 (比较结果或布尔列), 日期、代码等非数值列不能参与运算
+"""
+
+
+_COMPARE = {
+    ast.Gt: '>', ast.GtE: '>=', ast.Lt: '<', ast.LtE: '<=', ast.Eq: '==', ast.NotEq: '!=',
+}
+_ARITH = {ast.Add: '+', ast.Sub: '-', ast.Mult: '*', ast.Div: '/'}
+_LOGIC = {ast.BitAnd: '&', ast.BitOr: '|', ast.And: '&', ast.Or: '|'}
+
+
+class RuleSyntaxError(ValueError):
+    pass
+
+
+def _compile(node):
+    """Translate a Python AST node into a canonical hashable expression tuple"""
+    if isinstance(node, ast.Expression):
+        return _compile(node.body)
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+        return ('const', float(node.value))
+    if isinstance(node, ast.Name):
+        return ('col', node.id)
+    if isinstance(node, ast.UnaryOp):
+        if isinstance(node.op, (ast.Invert, ast.Not)):
+            return ('not', _compile(node.operand))
+        if isinstance(node.op, ast.USub):
+            operand = _compile(node.operand)
+            if operand[0] == 'const':
+                return ('const', -operand[1])
+            return ('neg', operand)
+    if isinstance(node, ast.BoolOp) or (isinstance(node, ast.BinOp) and type(node.op) in _LOGIC):
+        op = _LOGIC[type(node.op)]
+        values = node.values if isinstance(node, ast.BoolOp) else [node.left, node.right]
+        operands = []
+        for value in values:
+            child = _compile(value)
+            # 展平并排序, 使 a & b 与 b & a 共享同一个键
+            operands.extend(child[1] if child[0] == op else [child])
+        return (op, tuple(sorted(set(operands), key=repr)))
+    if isinstance(node, ast.BinOp) and type(node.op) in _ARITH:
+        return (_ARITH[type(node.op)], _compile(node.left), _compile(node.right))
+    if isinstance(node, ast.Compare):
+        if len(node.ops) != 1:
+            raise RuleSyntaxError("Chained comparisons are not supported, use &")
+        return ('cmp', _COMPARE[type(node.ops[0])], _compile(node.left), _compile(node.comparators[0]))
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
+        return _compile_call(node.func.id, [_compile(arg) for arg in node.args])
+    raise RuleSyntaxError(f"Unsupported expression: {ast.dump(node)}")
+
+
+def _int_arg(args, i, name):
+    if len(args) <= i or args[i][0] != 'const' or args[i][1] != int(args[i][1]):
+        raise RuleSyntaxError(f"{name}() expects an integer argument")
+    return int(args[i][1])
+
+
+def _compile_call(name, args):
+    if name == 'ma':
+        return ('col', f'ma{_int_arg(args, 0, name)}')
+    if name == 'wr':
+        return ('col', f'wr_{_int_arg(args, 0, name)}')
+    if name == 'prev':
+        k = _int_arg(args, 1, name) if len(args) > 1 else 1
+        return ('prev', args[0], k) if args[0][0] != 'const' else args[0]
+    if name == 'abs':
+        return ('abs', args[0])
+    if name in ('cross_below', 'cross_above'):
+        if len(args) != 2:
+            raise RuleSyntaxError(f"{name}() expects two arguments")
+        x, y = args
+        prev_x = ('prev', x, 1)
+        prev_y = ('prev', y, 1) if y[0] != 'const' else y
+        if name == 'cross_below':
+            return ('&', tuple(sorted({('cmp', '<', x, y), ('cmp', '>=', prev_x, prev_y)}, key=repr)))
+        return ('&', tuple(sorted({('cmp', '>=', x, y), ('cmp', '<', prev_x, prev_y)}, key=repr)))
+    raise RuleSyntaxError(f"Unknown function: {name}")
+
+
+def parse_rule(expression):
+    """Compile a rule string into its canonical expression tuple"""
+    # & | ~ 的优先级低于比较运算 (与pandas写法不同, 无需给比较加括号)
+    source = expression.replace('&', ' and ').replace('|', ' or ').replace('~', ' not ')
+    try:
+        tree = ast.parse(source.strip(), mode='eval')
+    except SyntaxError as e:
+        raise RuleSyntaxError(f"Invalid rule {expression!r}: {e}") from e
+    return _compile(tree)
+
+
+class _Context:
+    """Evaluation state for one frame: row order, segment bounds, columns and the subexpression cache"""
+    def __init__(self, df):
+        self.df = df
+        self.order, self.starts, self.lengths = kernels.segment_order(df['code'].values)
+        self.offset = np.arange(len(df)) - np.repeat(self.starts, self.lengths)
+        self.columns = {}
+        self.cache = {}
+        self.requested = 0
+
+    def column(self, name):
+        if name not in self.columns:
+            if name not in self.df.columns:
+                self.df = _add_indicator(self.df, name)
+            series = self.df[name]
+            # 布尔列作为条件, 数值列转为 float64; 日期、代码等列不参与运算
+            if pd.api.types.is_bool_dtype(series):
+                values = series.to_numpy(dtype=bool)
+            elif pd.api.types.is_numeric_dtype(series):
+                values = series.to_numpy(dtype=np.float64)
+            else:
+                raise RuleSyntaxError(f"Column {name} is not numeric ({series.dtype})")
+            self.columns[name] = values[self.order]
+        return self.columns[name]
+
+    def shift(self, values, k):
+        # 条件的前值缺失时为 False, 数值的前值缺失时为 NaN
+        fill = False if values.dtype == bool else np.nan
+        out = np.full(len(values), fill, dtype=values.dtype)
+        if k > 0 and len(values) > k:
+            out[k:] = values[:-k]
+            # 每只股票的前k行没有前值
+            out[self.offset < k] = fill
+        return out
+
+
+_INDICATOR_PATTERNS = [
+    (re.compile(r'^ma(\d+)$'), lambda df, m: df.assign(**{m.group(0): TechnicalAnalysis.calculate_ma(df, window=int(m.group(1)))})),
+    (re.compile(r'^kdj_[kdj]$'), lambda df, m: TechnicalAnalysis.calculate_kdj(df)),
+    (re.compile(r'^wr_(\d+)$'), lambda df, m: TechnicalAnalysis.calculate_wr(df, period=int(m.group(1)))),
+    (re.compile(r'^macd(_dif|_dea)?$'), lambda df, m: TechnicalAnalysis.calculate_macd(df)),
+    (re.compile(r'^boll_(mid|upper|lower)_(\d+)$'), lambda df, m: TechnicalAnalysis.calculate_boll(df, window=int(m.group(2)))),
+]
+
+
+def _add_indicator(df, name):
+    for pattern, compute in _INDICATOR_PATTERNS:
+        match = pattern.match(name)
+        if match:
+            return compute(df, match)
+    raise KeyError(f"Unknown column or indicator: {name}")
+
+
+def _is_mask(value):
+    return np.asarray(value).dtype == bool
+
+
+def _expect(values, mask, op):
+    """Raise RuleSyntaxError unless every operand is a condition (mask=True) or a number (mask=False)"""
+    for value in values:
+        if _is_mask(value) != mask:
+            expected = 'conditions' if mask else 'numbers'
+            raise RuleSyntaxError(f"Operands of {op} must be {expected}")
+
+
+def _evaluate(node, ctx):
+    ctx.requested += 1
+    if node in ctx.cache:
+        return ctx.cache[node]
+
+    kind = node[0]
+    if kind == 'const':
+        value = node[1]
+    elif kind == 'col':
+        value = ctx.column(node[1])
+    elif kind == 'prev':
+        value = ctx.shift(_evaluate(node[1], ctx), node[2])
+    elif kind == 'neg':
+        operand = _evaluate(node[1], ctx)
+        _expect([operand], False, '-')
+        value = -operand
+    elif kind == 'abs':
+        operand = _evaluate(node[1], ctx)
+        _expect([operand], False, 'abs()')
+        value = np.abs(operand)
+    elif kind == 'not':
+        operand = _evaluate(node[1], ctx)
+        _expect([operand], True, '~')
+        value = ~operand
+    elif kind in ('&', '|'):
+        operands = [_evaluate(child, ctx) for child in node[1]]
+        _expect(operands, True, kind)
+        value = operands[0]
+        for operand in operands[1:]:
+            value = (value & operand) if kind == '&' else (value | operand)
+    elif kind in ('+', '-', '*', '/'):
+        left, right = _evaluate(node[1], ctx), _evaluate(node[2], ctx)
+        _expect([left, right], False, kind)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            value = {'+': np.add, '-': np.subtract, '*': np.multiply, '/': np.divide}[kind](left, right)
+    elif kind == 'cmp':
+        left, right = _evaluate(node[2], ctx), _evaluate(node[3], ctx)
+        _expect([left, right], False, node[1])
+        with np.errstate(invalid='ignore'):
+            value = {
+                '>': np.greater, '>=': np.greater_equal, '<': np.less,
+                '<=': np.less_equal, '==': np.equal, '!=': np.not_equal,
+            }[node[1]](left, right)
+    else:
+        raise RuleSyntaxError(f"Unknown node: {kind}")
+
+    ctx.cache[node] = value
+    return value
+
+
+class RuleSet:
+    """
+    规则集合
+    A batch of named rules evaluated together over one frame
+    """
+    def __init__(self, rules):
+        """
+        rules: dict of rule name -> expression string
+        """
+        self.rules = dict(rules)
+        self.compiled = {name: parse_rule(expr) for name, expr in self.rules.items()}
+        self.last_stats = {}
+        self.frame = None
+
+    def evaluate(self, df):
+        """
+        Boolean mask per rule, aligned with df
+        df: long frame with 'code' (and 'date'), rows of each code in date order
+        """
+        ctx = _Context(df)
+        masks = {}
+        for name, node in self.compiled.items():
+            value = _evaluate(node, ctx)
+            mask = np.empty(len(df), dtype=bool)
+            mask[ctx.order] = np.broadcast_to(np.asarray(value, dtype=bool), len(df))
+            masks[name] = mask
+        self.last_stats = {
+            'rules': len(self.compiled),
+            'nodes_requested': ctx.requested,
+            'nodes_computed': len(ctx.cache),
+            'indicators_added': [col for col in ctx.df.columns if col not in df.columns],
+        }
+        self.frame = ctx.df
+        return pd.DataFrame(masks, index=df.index)
+
+    def bitmaps(self, df, store=None):
+        """
+        Evaluate the rules into (code x trading day) bitmaps, see bitset.py
+        store: BitmapStore to add to (default: a new one over df's codes and dates)
+
+        returns:
+            BitmapStore with one bitmap per rule name
+        """
+        masks = self.evaluate(df)
+        if store is None:
+            store = BitmapStore.from_data(df)
+        for name in self.rules:
+            store.add_mask(name, df, masks[name].values)
+        return store
+
+    def signals(self, df, columns=None):
+        """
+        Rows where each rule fires, tagged with the rule name
+        columns: columns of df to keep (default: all, including indicators computed on demand)
+        """
+        masks = self.evaluate(df)
+        frame = self.frame if columns is None else self.frame[columns]
+        parts = [frame[masks[name].values].assign(rule=name) for name in self.rules]
+        return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
@@ -0,0 +1,267 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from .data_loader import DataLoader
+from .strategy import TradingStrategyB
+from .signal_engine import SignalEngine, c_tag
+
+
+"""
+本地信号查询服务
+- 启动时加载行情、计算指标和各策略信号一次, 之后所有查询都是内存中的索引查找
+- asyncio HTTP 服务, 返回 JSON:
+    GET /signals?code=sh.600000[&strategy=B&ma_type=ma20&limit=20]   某只股票最近的信号
+    GET /signals?date=2025-03-03[&strategy=B&ma_type=ma20]            某日的全部D1/信号
+    GET /bars?code=sh.600000[&start=...&end=...&columns=close,kdj_j] 指标面板
+    GET /stats                                                       请求延迟分位数、数据版本
+- 行情文件更新后后台重新计算 (线程池中执行), 完成后原子替换状态, 查询不中断
+
+用法:
+    python -m helper.service --data 沪深300-2025年至今数据.csv --port 8765
+"""
+
+
+C_J_DIFF_THRESHOLD = 20
+
+
+def _date_col(signals):
+    return 'D1日期' if 'D1日期' in signals.columns else '信号日期'
+
+
+def _records(df):
+    """JSON-ready records (ISO dates, NaN -> null)"""
+    return json.loads(df.to_json(orient='records', date_format='iso', force_ascii=False))
+
+
+class SignalState:
+    """
+    服务状态
+    Prepared panel and per-(strategy, ma_type) signal tables with code/date indexes, built once
+    """
+    def __init__(self, stock_data_path, strategies=('A', 'B', 'C'), ma_types=('ma5', 'ma20', 'ma60')):
+        self.stock_data_path = stock_data_path
+        self.mtime = os.path.getmtime(stock_data_path)
+        started = time.perf_counter()
+
+        raw = DataLoader(stock_data_path, None).load_stock_data()
+        # 三个策略的 prepare_data 计算同一组指标, 只算一次
+        self.panel = TradingStrategyB().prepare_data(raw).reset_index(drop=True)
+        self.panel_index = self.panel.groupby('code').indices
+
+        self.signals = {}
+        self.by_code = {}
+        self.by_date = {}
+        # 所有 (策略, 均线) 组合一次扫描得出, 再拆回各策略自己的信号格式
+        engine = SignalEngine(j_diff_thresholds=(C_J_DIFF_THRESHOLD,), ma_types=ma_types, strategies=strategies)
+        tagged = engine.evaluate(self.panel)
+        for name in strategies:
+            tag = c_tag(C_J_DIFF_THRESHOLD) if name == 'C' else name
+            for ma_type in ma_types:
+                signals = SignalEngine.to_strategy_frame(tagged, tag, ma_type)
+                if signals.empty:
+                    signals = pd.DataFrame({'code': [], 'D1日期': pd.to_datetime([])})
+                signals = signals.sort_values([_date_col(signals), 'code'], ignore_index=True)
+                key = (name, ma_type)
+                self.signals[key] = signals
+                self.by_code[key] = signals.groupby('code').indices
+                self.by_date[key] = signals.groupby(_date_col(signals)).indices
+
+        self.build_seconds = time.perf_counter() - started
+        self.last_date = self.panel['date'].max()
+
+    def signals_for_code(self, strategy, ma_type, code, limit=20):
+        signals = self.signals[(strategy, ma_type)]
+        rows = self.by_code[(strategy, ma_type)].get(code, np.array([], dtype=np.int64))
+        return signals.iloc[rows[-limit:][::-1]]
+
+    def signals_on_date(self, strategy, ma_type, date):
+        signals = self.signals[(strategy, ma_type)]
+        rows = self.by_date[(strategy, ma_type)].get(pd.Timestamp(date), np.array([], dtype=np.int64))
+        return signals.iloc[rows]
+
+    def bars(self, code, start=None, end=None, columns=None):
+        rows = self.panel_index.get(code, np.array([], dtype=np.int64))
+        bars = self.panel.iloc[rows]
+        if start is not None:
+            bars = bars[bars['date'] >= pd.Timestamp(start)]
+        if end is not None:
+            bars = bars[bars['date'] <= pd.Timestamp(end)]
+        if columns is not None:
+            bars = bars[['code', 'date'] + [col for col in columns if col not in ('code', 'date')]]
+        return bars
+
+
+class LatencyTracker:
+    """Rolling window of request latencies"""
+    def __init__(self, window=10000):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.errors = 0
+
+    def record(self, seconds, ok=True):
+        self.samples.append(seconds)
+        self.count += 1
+        if not ok:
+            self.errors += 1
+
+    def summary(self):
+        result = {'requests': self.count, 'errors': self.errors}
+        if self.samples:
+            values = np.array(self.samples) * 1000
+            for p in (50, 90, 99):
+                result[f'p{p}_ms'] = round(float(np.percentile(values, p)), 3)
+            result['max_ms'] = round(float(values.max()), 3)
+        return result
+
+
+class SignalService:
+    """
+    信号查询服务
+    asyncio HTTP server over a SignalState, refreshed in the background when the data file changes
+    """
+    def __init__(self, stock_data_path, host='127.0.0.1', port=8765, refresh_seconds=60, **state_kwargs):
+        self.stock_data_path = stock_data_path
+        self.host = host
+        self.port = port
+        self.refresh_seconds = refresh_seconds
+        self.state_kwargs = state_kwargs
+        self.state = None
+        self.latency = LatencyTracker()
+        self.refreshes = 0
+        self.refresh_error = None
+
+    # ------------------------------------------------------------ lifecycle
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self.state = await loop.run_in_executor(None, lambda: SignalState(self.stock_data_path, **self.state_kwargs))
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        self._refresher = asyncio.create_task(self._refresh_loop())
+        return self
+
+    async def stop(self):
+        self._refresher.cancel()
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def serve_forever(self):
+        await self.start()
+        print(f"信号服务已启动: http://{self.host}:{self.port} (加载耗时 {self.state.build_seconds:.1f}s)")
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def _refresh_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.refresh_seconds)
+            try:
+                if os.path.getmtime(self.stock_data_path) == self.state.mtime:
+                    continue
+                # 在线程池中重建, 完成后整体替换; 旧状态继续服务查询
+                self.state = await loop.run_in_executor(
+                    None, lambda: SignalState(self.stock_data_path, **self.state_kwargs)
+                )
+                self.refreshes += 1
+                self.refresh_error = None
+            except Exception as e:
+                self.refresh_error = repr(e)
+
+    # ------------------------------------------------------------ HTTP
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                if int(headers.get('content-length', 0)):
+                    await reader.readexactly(int(headers['content-length']))
+
+                started = time.perf_counter()
+                parts = request_line.decode('latin-1').split()
+                method, target = (parts[0], parts[1]) if len(parts) >= 2 else ('', '/')
+                status, body = self._dispatch(method, target)
+                payload = json.dumps(body, ensure_ascii=False, default=str).encode('utf-8')
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                writer.write(
+                    f"HTTP/1.1 {status}\r\n"
+                    f"Content-Type: application/json; charset=utf-8\r\n"
+                    f"Content-Length: {len(payload)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + payload
+                )
+                await writer.drain()
+                self.latency.record(time.perf_counter() - started, ok=status.startswith('200'))
+                if not keep_alive:
+                    break
+        except (ConnectionResetError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def _dispatch(self, method, target):
+        if method != 'GET':
+            return '405 Method Not Allowed', {'error': 'only GET is supported'}
+        url = urlsplit(target)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        state = self.state
+        try:
+            if url.path == '/signals':
+                key = (query.get('strategy', 'B').upper(), query.get('ma_type', 'ma20'))
+                if key not in state.signals:
+                    return '400 Bad Request', {'error': f'unknown strategy/ma_type: {key}'}
+                if 'code' in query:
+                    rows = state.signals_for_code(*key, query['code'], limit=int(query.get('limit', 20)))
+                elif 'date' in query:
+                    rows = state.signals_on_date(*key, query['date'])
+                else:
+                    return '400 Bad Request', {'error': 'code or date is required'}
+                return '200 OK', {'strategy': key[0], 'ma_type': key[1], 'count': len(rows), 'signals': _records(rows)}
+            if url.path == '/bars':
+                if 'code' not in query:
+                    return '400 Bad Request', {'error': 'code is required'}
+                columns = query['columns'].split(',') if 'columns' in query else None
+                rows = state.bars(query['code'], query.get('start'), query.get('end'), columns)
+                return '200 OK', {'code': query['code'], 'count': len(rows), 'bars': _records(rows)}
+            if url.path == '/stats':
+                return '200 OK', {
+                    'latency': self.latency.summary(),
+                    'data_last_date': state.last_date,
+                    'build_seconds': round(state.build_seconds, 3),
+                    'refreshes': self.refreshes,
+                    'refresh_error': self.refresh_error,
+                    'signal_counts': {f'{s}/{m}': len(df) for (s, m), df in state.signals.items()},
+                }
+            return '404 Not Found', {'error': f'unknown path: {url.path}'}
+        except (KeyError, ValueError) as e:
+            return '400 Bad Request', {'error': str(e)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local signal query service")
+    parser.add_argument('--data', required=True, help="price CSV path")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--refresh', type=float, default=60, help="seconds between data file checks")
+    args = parser.parse_args()
+    service = SignalService(args.data, args.host, args.port, args.refresh)
+    asyncio.run(service.serve_forever())
+
+
+if __name__ == "__main__":
+    main()
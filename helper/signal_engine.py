@@ -0,0 +1,168 @@
+import numpy as np
+import pandas as pd
+
+from .technical_analysis import TechnicalAnalysis
+from .profiler import profile_stage
+from .strategy import _d1_d2_table
+
+
+"""
+统一信号引擎
+- 策略A/B/C 的 D1 条件相同 (收盘价在均线上方且J值转负), 只在出场 (无/D2) 和 J值差值 过滤上不同
+- J值转负/转正和每个D1对应的D2只计算一次, 各均线类型只多算一个 above 掩码
+- 所有候选D1建一张表, 每个策略变体只是这张表上的一个行掩码, 结果合并为带 策略 / ma_type 标签的长表
+- to_strategy_frame 可还原出与各策略 find_trading_signals 相同格式的信号表
+
+用法:
+    engine = SignalEngine(j_diff_thresholds=(10, 20, 30), ma_types=('ma5', 'ma20', 'ma60'))
+    tagged = engine.evaluate(prepared)
+    SignalEngine.summary(tagged)
+"""
+
+
+# 策略A的列 (候选表列 -> find_trading_signals 输出列)
+_A_COLUMNS = {
+    'code': 'code',
+    'D1日期': '信号日期',
+    'D1收盘价': '当日收盘价',
+    'D1_5日均线': '5日均线',
+    'D1_20日均线': '20日均线',
+    'D1_60日均线': '60日均线',
+    'D1_J值': '当日J值',
+    'D1_前一日J值': '前一日J值',
+    'D1_MACD_DIF': 'MACD_DIF',
+    'D1_MACD_DEA': 'MACD_DEA',
+    'D1_MACD': 'MACD',
+    'D1_BOLL中轨': 'BOLL中轨',
+    'D1_BOLL上轨': 'BOLL上轨',
+    'D1_BOLL下轨': 'BOLL下轨',
+    'D1_WR14': 'WR14',
+    'D1_WR28': 'WR28',
+}
+
+
+def c_tag(threshold):
+    """Strategy tag of C with the given J-diff threshold"""
+    return f'C({threshold:g})'
+
+
+class SignalEngine:
+    """
+    统一信号引擎
+    Evaluates strategies A, B and C (any number of J-diff thresholds) over one shared D1 candidate scan
+    """
+    def __init__(self, j_diff_thresholds=(20,), ma_types=('ma20',), strategies=('A', 'B', 'C')):
+        """
+        j_diff_thresholds: thresholds of strategy C, one tagged variant each
+        ma_types: MA columns for the D1 condition
+        strategies: subset of 'A', 'B', 'C' to emit
+        """
+        unknown = set(strategies) - {'A', 'B', 'C'}
+        if unknown:
+            raise ValueError(f"Unknown strategies: {sorted(unknown)}")
+        self.j_diff_thresholds = list(j_diff_thresholds)
+        self.ma_types = list(ma_types)
+        self.strategies = list(strategies)
+        self.ta = TechnicalAnalysis()
+
+    @property
+    def tags(self):
+        tags = [name for name in ('A', 'B') if name in self.strategies]
+        if 'C' in self.strategies:
+            tags += [c_tag(threshold) for threshold in self.j_diff_thresholds]
+        return tags
+
+    def candidates(self, df):
+        """
+        All D1 rows for every ma_type with their D2 (if any), one row per (ma_type, D1)
+        df: prepared frame sorted by code and date
+
+        returns:
+            candidate table (ma_type, D1_前一日J值 and the D1/D2 columns with J值差值, D2 columns NaN without a D2)
+        """
+        # J值事件与D2只依赖J值, 与均线类型无关
+        prev_j = df.groupby('code')['kdj_j'].shift(1).values
+        j = df['kdj_j'].values
+        j_turns_negative = (j < 0) & (prev_j >= 0)
+        j_turns_positive = (j >= 0) & (prev_j < 0)
+        d2_index = self.ta.next_event_index(df, j_turns_positive)
+
+        close = df['close'].values
+        d1_pos = [np.flatnonzero((close > df[ma_type].values) & j_turns_negative) for ma_type in self.ma_types]
+        ma_type = np.repeat(np.array(self.ma_types, dtype=object), [len(pos) for pos in d1_pos])
+        d1_pos = np.concatenate(d1_pos) if d1_pos else np.array([], dtype=np.int64)
+
+        table = _d1_d2_table(df, d1_pos, d2_index[d1_pos], with_j_diff=True)
+        table.insert(0, 'ma_type', ma_type)
+        table.insert(table.columns.get_loc('D1_J值'), 'D1_前一日J值', prev_j[d1_pos])
+        return table
+
+    @profile_stage()
+    def evaluate(self, df):
+        """
+        Signals of every strategy variant in one pass
+        df: prepared frame (prepare_data output) sorted by code and date
+
+        returns:
+            long table with 策略 (A / B / C(threshold)) and ma_type tags followed by the candidate columns;
+            A rows keep D1s without a D2 (their D2 columns are NaN)
+        """
+        table = self.candidates(df)
+        has_d2 = table['D2日期'].notna().values
+        j_diff = table['J值差值'].values
+
+        masks = []
+        if 'A' in self.strategies:
+            masks.append(('A', np.ones(len(table), dtype=bool)))
+        if 'B' in self.strategies:
+            masks.append(('B', has_d2))
+        if 'C' in self.strategies:
+            for threshold in self.j_diff_thresholds:
+                # NaN (无D2) 与阈值比较为 False
+                masks.append((c_tag(threshold), has_d2 & (j_diff > threshold)))
+
+        rows = [np.flatnonzero(mask) for _, mask in masks]
+        tagged = table.take(np.concatenate(rows) if rows else np.array([], dtype=np.int64))
+        tagged.insert(0, '策略', np.repeat(np.array([tag for tag, _ in masks], dtype=object), [len(r) for r in rows]))
+        return tagged.reset_index(drop=True)
+
+    @staticmethod
+    def to_strategy_frame(tagged, tag, ma_type):
+        """
+        One variant of the tagged table in the format of the strategy's own find_trading_signals
+        tag: 'A', 'B' or a C tag such as 'C(20)'
+        """
+        rows = tagged[(tagged['策略'] == tag) & (tagged['ma_type'] == ma_type)]
+        if tag == 'A':
+            signals = rows[list(_A_COLUMNS)].rename(columns=_A_COLUMNS)
+            return signals.sort_values(['信号日期', 'code']).reset_index(drop=True)
+        if rows.empty:
+            return pd.DataFrame()
+        drop = ['策略', 'ma_type', 'D1_前一日J值']
+        if tag == 'B':
+            drop.append('J值差值')
+        return rows.drop(columns=drop).reset_index(drop=True)
+
+    @staticmethod
+    def summary(tagged):
+        """
+        Per (策略, ma_type) signal count and D1->D2 return statistics
+
+        returns:
+            DataFrame indexed by (策略, ma_type) with 信号数, 有D2, 平均收益率, 胜率, 平均持仓交易日
+        """
+        returns = tagged['D1-D2收益率']
+        frame = tagged[['策略', 'ma_type']].assign(
+            有D2=returns.notna(),
+            收益率=returns,
+            盈利=(returns > 0).astype(float).where(returns.notna()),
+            持仓交易日=tagged['持仓交易日'].where(returns.notna()),
+        )
+        grouped = frame.groupby(['策略', 'ma_type'], sort=False)
+        return pd.DataFrame({
+            '信号数': grouped.size(),
+            '有D2': grouped['有D2'].sum(),
+            '平均收益率': grouped['收益率'].mean(),
+            '胜率': grouped['盈利'].mean() * 100,
+            '平均持仓交易日': grouped['持仓交易日'].mean(),
+        })
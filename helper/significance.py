@@ -0,0 +1,175 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .price_index import PriceIndex
+
+
+"""
+收益率显著性检验
+- Bootstrap: 对信号收益率重采样, 给出均值/中位数/胜率的置信区间和p值
+- 随机入场(placebo): 在相同的股票/日期上随机入场, 检验信号是否优于随机
+- 所有重采样以 (batch x n) 矩阵批量计算; 按batch划分随机种子, 结果与线程数无关
+"""
+
+
+METRICS = ('mean', 'median', 'win_rate')
+NULL_VALUES = {'mean': 0.0, 'median': 0.0, 'win_rate': 50.0}
+
+
+def _metrics(samples):
+    """Metrics along axis 1 of a (batch x n) return matrix"""
+    return {
+        'mean': samples.mean(axis=1),
+        'median': np.median(samples, axis=1),
+        'win_rate': (samples > 0).mean(axis=1) * 100,
+    }
+
+
+def _run_batches(draw, n_resamples, batch_size, seed, n_jobs):
+    """
+    Run draw(rng, size) over batches and stack the metric vectors
+    Each batch gets its own child seed, so results do not depend on n_jobs.
+    """
+    sizes = [batch_size] * (n_resamples // batch_size)
+    if n_resamples % batch_size:
+        sizes.append(n_resamples % batch_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    jobs = [(np.random.default_rng(s), size) for s, size in zip(seeds, sizes)]
+
+    if n_jobs == 1:
+        outputs = [draw(rng, size) for rng, size in jobs]
+    else:
+        with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+            outputs = list(executor.map(lambda job: draw(*job), jobs))
+    return {metric: np.concatenate([out[metric] for out in outputs]) for metric in METRICS}
+
+
+def bootstrap_metrics(returns, n_resamples=10000, confidence=0.95, seed=None, batch_size=2000, n_jobs=1):
+    """
+    Bootstrap confidence intervals and p-values for mean, median and win rate
+    returns: signal returns in %
+    n_resamples: number of bootstrap resamples
+    confidence: two-sided confidence level
+    seed: seed for reproducible resampling
+    n_jobs: threads used to run batches
+
+    p-values test mean > 0, median > 0 and win rate > 50% with the shift method:
+    the bootstrap distribution is recentred on the null value.
+    """
+    values = np.asarray(pd.Series(returns).dropna(), dtype=np.float64)
+    n = len(values)
+    if n == 0:
+        raise ValueError("No returns to resample")
+
+    def draw(rng, size):
+        return _metrics(values[rng.integers(0, n, size=(size, n))])
+
+    boot = _run_batches(draw, n_resamples, batch_size, seed, n_jobs)
+    observed = _metrics(values[None, :])
+    alpha = (1 - confidence) / 2
+
+    rows = []
+    for metric in METRICS:
+        obs = observed[metric][0]
+        dist = boot[metric]
+        null_dist = dist - obs + NULL_VALUES[metric]
+        rows.append({
+            'metric': metric,
+            'observed': obs,
+            'ci_low': np.quantile(dist, alpha),
+            'ci_high': np.quantile(dist, 1 - alpha),
+            'std_error': dist.std(ddof=1),
+            'p_value': (np.sum(null_dist >= obs) + 1) / (len(dist) + 1),
+        })
+    return pd.DataFrame(rows).set_index('metric')
+
+
+def forward_returns(prepared, days=10):
+    """
+    Return (in %) from each row's close to the close `days` trading days later for the same code
+    Same horizon definition as TradingStrategyA.calculate_returns.
+    """
+    exit_pos = PriceIndex(prepared).forward_index(days)
+    close = prepared['close'].to_numpy(dtype=np.float64)
+    future = np.where(exit_pos >= 0, close[np.maximum(exit_pos, 0)], np.nan)
+    return pd.Series((future / close - 1) * 100, index=prepared.index)
+
+
+def placebo_test(prepared, signals, days=10, date_col=None, match='date', n_trials=10000,
+                 confidence=0.95, seed=None, batch_size=1000, n_jobs=1):
+    """
+    Compare signal returns with random entries drawn from the same codes and dates
+    prepared: prepared price frame ('code', 'date', 'close')
+    signals: signal frame with 'code' and date_col
+    days: holding horizon in trading days (forward returns are looked up through PriceIndex)
+    match: 'date'  - random code on each signal's date
+           'code'  - random date for each signal's code
+           'none'  - any row of the signal codes within the signal date range
+
+    returns:
+        per-metric observed value, placebo mean and interval, and p-value of observed >= placebo
+    """
+    if date_col is None:
+        date_col = 'D1日期' if 'D1日期' in signals.columns else '信号日期'
+
+    pool = prepared[['code', 'date']].copy()
+    pool['fwd'] = forward_returns(prepared, days).values
+    pool = pool.dropna(subset=['fwd'])
+
+    entries = pd.DataFrame({'code': signals['code'].values, 'date': pd.to_datetime(signals[date_col]).values})
+    observed = pd.merge(entries, pool, on=['code', 'date'], how='left')['fwd'].dropna().values
+    entries = pd.merge(entries, pool, on=['code', 'date'], how='inner')[['code', 'date']]
+    if len(entries) == 0:
+        raise ValueError("No signal has a complete forward return for this horizon")
+
+    codes = set(entries['code'])
+    if match == 'date':
+        pool = pool[pool['date'].isin(set(entries['date']))]
+        key = 'date'
+    elif match == 'code':
+        pool = pool[pool['code'].isin(codes)]
+        key = 'code'
+    elif match == 'none':
+        pool = pool[pool['code'].isin(codes)
+                    & (pool['date'] >= entries['date'].min())
+                    & (pool['date'] <= entries['date'].max())]
+        key = None
+    else:
+        raise ValueError(f"Unknown match mode: {match}")
+
+    # 按匹配键把候选池排成连续分组, 每个信号在自己的分组内均匀抽样
+    if key is None:
+        fwd = pool['fwd'].values
+        starts = np.zeros(len(entries), dtype=np.int64)
+        sizes = np.full(len(entries), len(fwd), dtype=np.int64)
+    else:
+        pool = pool.sort_values(key, kind='stable')
+        fwd = pool['fwd'].values
+        groups = pool.groupby(key, sort=True).size()
+        group_start = pd.Series(np.r_[0, np.cumsum(groups.values)[:-1]], index=groups.index)
+        starts = group_start.loc[entries[key].values].values
+        sizes = groups.loc[entries[key].values].values
+
+    def draw(rng, size):
+        offsets = np.floor(rng.random((size, len(starts))) * sizes).astype(np.int64)
+        return _metrics(fwd[starts + offsets])
+
+    placebo = _run_batches(draw, n_trials, batch_size, seed, n_jobs)
+    obs_metrics = _metrics(observed[None, :])
+    alpha = (1 - confidence) / 2
+
+    rows = []
+    for metric in METRICS:
+        obs = obs_metrics[metric][0]
+        dist = placebo[metric]
+        rows.append({
+            'metric': metric,
+            'observed': obs,
+            'placebo_mean': dist.mean(),
+            'placebo_low': np.quantile(dist, alpha),
+            'placebo_high': np.quantile(dist, 1 - alpha),
+            'p_value': (np.sum(dist >= obs) + 1) / (len(dist) + 1),
+        })
+    return pd.DataFrame(rows).set_index('metric')
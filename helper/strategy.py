@@ -1,12 +1,119 @@
 import pandas as pd
 import numpy as np
 from .technical_analysis import TechnicalAnalysis
+from .profiler import profile_stage
+from .compact import compact_frame, pack_signal_columns
+from .trading_calendar import TradingCalendar
+from .price_index import PriceIndex
+from .excursion import EXCURSION_COLUMNS, trade_excursions
+
+
+def _find_d1_d2(ta, df, ma_type, compact=False):
+    """
+    Locate D1 rows (price above MA, J turns negative) and their D2 rows (first later J turn positive)
+    compact: use bit-packed signal columns and return df itself (no copy, no added columns)
+
+    returns:
+        (frame with the signal columns, D1 row positions, D2 row positions), only D1s that have a D2
+    """
+    if compact:
+        packed = pack_signal_columns(df, ma_type)
+        d1_mask = packed.combine(f'above_{ma_type}', 'j_turns_negative')
+        d2_index = ta.next_event_index(df, packed.unpack('j_turns_positive'))
+        d1_pos = np.flatnonzero(d1_mask & (d2_index >= 0))
+        return df, d1_pos, d2_index[d1_pos]
+
+    df = df.copy()
+    
+    # Check if price is above the selected MA
+    df[f'above_{ma_type}'] = df['close'] > df[f'{ma_type}']
+    
+    # Find where J value turns negative and then positive
+    df['prev_j'] = df.groupby('code')['kdj_j'].shift(1)
+    df['j_turns_negative'] = (df['kdj_j'] < 0) & (df['prev_j'] >= 0)
+    df['j_turns_positive'] = (df['kdj_j'] >= 0) & (df['prev_j'] < 0)
+    
+    # D1: 均线上方且J值转负; D2: D1之后同一只股票J值首次转正
+    d1_mask = (df[f'above_{ma_type}'] & df['j_turns_negative']).values
+    d2_index = ta.next_event_index(df, df['j_turns_positive'].values)
+    d1_pos = np.flatnonzero(d1_mask & (d2_index >= 0))
+    return df, d1_pos, d2_index[d1_pos]
+
+
+def _d1_d2_table(df, d1_pos, d2_pos, with_j_diff=False):
+    """
+    Build the D1/D2 signal table for the given row positions
+    d2_pos may hold -1 for D1s without a D2; their D2 columns are NaN/NaT
+    """
+    has_d2 = np.asarray(d2_pos) >= 0
+    d1 = df.iloc[d1_pos]
+    d2 = df.iloc[np.where(has_d2, d2_pos, d1_pos)]
+    d1_dates = d1['date'].reset_index(drop=True)
+    d2_dates = d2['date'].reset_index(drop=True).where(has_d2)
+    
+    def d2_values(col):
+        values = d2[col].values
+        return values if has_d2.all() else np.where(has_d2, values, np.nan)
+    
+    d1_j = d1['kdj_j'].values
+    d2_j = d2_values('kdj_j')
+    columns = {
+        'code': np.asarray(d1['code'], dtype=object),
+        'D1日期': d1_dates.values,
+        'D2日期': d2_dates.values,
+        'D1收盘价': d1['close'].values,
+        'D2收盘价': d2_values('close'),
+        'D1-D2收益率': (d2_values('close') / d1['close'].values - 1) * 100,
+        'D1_5日均线': d1['ma5'].values,
+        'D1_20日均线': d1['ma20'].values,
+        'D1_60日均线': d1['ma60'].values,
+        'D1_J值': d1_j,
+        'D2_J值': d2_j,
+    }
+    if with_j_diff:
+        columns['J值差值'] = d2_j - d1_j
+    columns['D1_WR14'] = d1['wr_14'].values
+    columns['D2_WR14'] = d2_values('wr_14')
+    columns['D1_WR28'] = d1['wr_28'].values
+    columns['D2_WR28'] = d2_values('wr_28')
+    for prefix, values in [('D1', lambda col: d1[col].values), ('D2', d2_values)]:
+        columns[f'{prefix}_MACD_DIF'] = values('macd_dif')
+        columns[f'{prefix}_MACD_DEA'] = values('macd_dea')
+        columns[f'{prefix}_MACD'] = values('macd')
+    for prefix, values in [('D1', lambda col: d1[col].values), ('D2', d2_values)]:
+        columns[f'{prefix}_BOLL中轨'] = values('boll_mid_20')
+        columns[f'{prefix}_BOLL上轨'] = values('boll_upper_20')
+        columns[f'{prefix}_BOLL下轨'] = values('boll_lower_20')
+    columns['持仓天数'] = (d2_dates - d1_dates).dt.days.values
+    columns['持仓交易日'] = TradingCalendar.from_data(df).trading_days_between(d1_dates, d2_dates)
+    return pd.DataFrame(columns)
+
+
+def _gate_entries(regime_gate, df, d1_pos, d2_pos):
+    """Keep the D1s whose date passes the regime gate (see regime.py)"""
+    if regime_gate is None:
+        return d1_pos, d2_pos
+    keep = regime_gate.allows(df['date'].values[d1_pos])
+    return d1_pos[keep], d2_pos[keep]
+
+
+def _add_excursion_columns(df, results_df, d1_pos, d2_pos):
+    """Append MAE/MFE columns of the D1->D2 trades (see excursion.py)"""
+    excursions = trade_excursions(df, d1_pos, d2_pos)
+    for col in EXCURSION_COLUMNS:
+        results_df[col] = excursions[col].values
+    return results_df
+
 
 
 class TradingStrategyA:
-    def __init__(self):
+    def __init__(self, compact=False, regime_gate=None):
         self.ta = TechnicalAnalysis()
+        self.compact = compact
+        # 市场状态过滤 (regime.RegimeGate), 只在允许入场的日期产生信号
+        self.regime_gate = regime_gate
         
+    @profile_stage()
     def prepare_data(self, df):
         """Prepare data by calculating necessary indicators"""
         df = df.copy()
@@ -25,25 +132,40 @@ class TradingStrategyA:
         df = self.ta.calculate_macd(df)
         # Calculate BOLL
         df = self.ta.calculate_boll(df)
+        # float32指标 + category代码, 计算完成后再降精度
+        if self.compact:
+            df = compact_frame(df)
         return df
         
+    @profile_stage()
     def find_trading_signals(self, df, ma_type):
         """
         Find trading signals based on strategy rules:
         1. Price above MA20
         2. KDJ J-value turns negative
         """
-        df = df.copy()
-        
-        # Check if price is above MA20
-        df[f'above_{ma_type}'] = df['close'] > df[f'{ma_type}']
-        
-        # Find where J value turns negative (current J < 0 and previous J >= 0)
-        df['prev_j'] = df.groupby('code')['kdj_j'].shift(1)
-        df['j_turns_negative'] = (df['kdj_j'] < 0) & (df['prev_j'] >= 0)
-        
-        # Create trading signals with selected columns
-        signals = df[df[f'above_{ma_type}'] & df['j_turns_negative']].copy()
+        if self.compact:
+            # 紧凑模式: 用按位打包的信号列求入场行, 只取出信号行, 不复制整张表
+            entry = pack_signal_columns(df, ma_type).combine(f'above_{ma_type}', 'j_turns_negative')
+            if self.regime_gate is not None:
+                entry &= self.regime_gate.allows(df['date'].values)
+            prev_j = df.groupby('code', observed=True)['kdj_j'].shift(1).values[entry]
+            signals = df[entry].assign(prev_j=prev_j)
+        else:
+            df = df.copy()
+            
+            # Check if price is above MA20
+            df[f'above_{ma_type}'] = df['close'] > df[f'{ma_type}']
+            
+            # Find where J value turns negative (current J < 0 and previous J >= 0)
+            df['prev_j'] = df.groupby('code')['kdj_j'].shift(1)
+            df['j_turns_negative'] = (df['kdj_j'] < 0) & (df['prev_j'] >= 0)
+            
+            # Create trading signals with selected columns
+            entry = df[f'above_{ma_type}'] & df['j_turns_negative']
+            if self.regime_gate is not None:
+                entry &= self.regime_gate.allows(df['date'].values)
+            signals = df[entry].copy()
         # signals = df[df['j_turns_negative']].copy()
         
         # Select and rename columns for better readability
@@ -89,48 +211,53 @@ class TradingStrategyA:
         
         return selected_signals
         
-    def calculate_returns(self, df, signals, days=10):
-        """Calculate returns for the specified number of days after signal"""
-        results = []
+    @profile_stage()
+    def calculate_returns(self, df, signals, days=10, index=None):
+        """
+        Calculate returns for the specified number of trading days after signal
+        The exit is the close `days` trading days later (or the next bar when the stock is suspended that day).
+        index: PriceIndex over df, pass one to share it between calls
+        """
+        if signals.empty:
+            return pd.DataFrame()
+        index = PriceIndex(df) if index is None else index
+        signal_pos = index.locate(signals['code'].values, signals['信号日期'].values)
+        if (signal_pos < 0).any():
+            raise IndexError("Signal not found in price data")
+        exit_pos = index.offset(signals['code'].values, signals['信号日期'].values, days)
+        has_exit = exit_pos >= 0
+        located = signals[has_exit]
+        signal_pos = signal_pos[has_exit]
+        exit_pos = exit_pos[has_exit]
+        if located.empty:
+            return pd.DataFrame()
         
-        for _, signal in signals.iterrows():
-            code = signal['code']
-            signal_date = signal['信号日期']
-            signal_price = df[
-                (df['code'] == code) & 
-                (df['date'] == signal_date)
-            ]['close'].iloc[0]
-            
-            # Find future prices
-            future_data = df[
-                (df['code'] == code) & 
-                (df['date'] > signal_date)
-            ].head(days)
-            
-            if len(future_data) == days:
-                future_return = (future_data.iloc[-1]['close'] / signal_price - 1) * 100
-                
-                results.append({
-                    'code': code,
-                    'signal_date': signal_date,
-                    'return': future_return,
-                    'macd_dif': signal['MACD_DIF'],
-                    'macd_dea': signal['MACD_DEA'],
-                    'macd': signal['MACD'],
-                    'boll_mid': signal['BOLL中轨'],
-                    'boll_upper': signal['BOLL上轨'],
-                    'boll_lower': signal['BOLL下轨'],
-                    'wr_14': signal['WR14'],
-                    'wr_28': signal['WR28']
-                })
-                
-        return pd.DataFrame(results)  
+        close = df['close'].values
+        return pd.DataFrame({
+            'code': located['code'].values,
+            'signal_date': located['信号日期'].values,
+            'return': (close[exit_pos] / close[signal_pos] - 1) * 100,
+            'macd_dif': located['MACD_DIF'].values,
+            'macd_dea': located['MACD_DEA'].values,
+            'macd': located['MACD'].values,
+            'boll_mid': located['BOLL中轨'].values,
+            'boll_upper': located['BOLL上轨'].values,
+            'boll_lower': located['BOLL下轨'].values,
+            'wr_14': located['WR14'].values,
+            'wr_28': located['WR28'].values,
+        })
     
 
 class TradingStrategyB:
-    def __init__(self):
+    def __init__(self, compact=False, excursions=False, regime_gate=None):
         self.ta = TechnicalAnalysis()
+        self.compact = compact
+        # 信号表追加 MAE/MFE/MFE用时/最大回撤 列
+        self.excursions = excursions
+        # 市场状态过滤 (regime.RegimeGate), 只保留允许入场日期的D1
+        self.regime_gate = regime_gate
         
+    @profile_stage()
     def prepare_data(self, df):
         """Prepare data by calculating necessary indicators"""
         df = df.copy()
@@ -150,94 +277,46 @@ class TradingStrategyB:
         df = self.ta.calculate_macd(df)
         # Calculate BOLL
         df = self.ta.calculate_boll(df)
+        # float32指标 + category代码, 计算完成后再降精度
+        if self.compact:
+            df = compact_frame(df)
         return df
         
+    @profile_stage()
     def find_trading_signals(self, df, ma_type):
         """
         Find trading signals based on strategy rules:
         1. Price above MA20
         2. Find where J turns negative (D1) and then turns positive (D2)
         """
-        df = df.copy()
-        
-        # Check if price is above MA10
-        df[f'above_{ma_type}'] = df['close'] > df[f'{ma_type}']
-        
-        # Find where J value turns negative and then positive
-        df['prev_j'] = df.groupby('code')['kdj_j'].shift(1)
-        df['j_turns_negative'] = (df['kdj_j'] < 0) & (df['prev_j'] >= 0)
+        df, d1_pos, d2_pos = _find_d1_d2(self.ta, df, ma_type, compact=self.compact)
+        d1_pos, d2_pos = _gate_entries(self.regime_gate, df, d1_pos, d2_pos)
         
-        # Create initial signals when J turns negative (D1)
-        signals = df[df[f'above_{ma_type}'] & df['j_turns_negative']].copy()
-        
-        # For each D1 signal, find the corresponding D2 (when J turns positive)
-        results = []
-        for _, signal in signals.iterrows():
-            code = signal['code']
-            d1_date = signal['date']
-            
-            # Find the next date when J turns positive after D1
-            future_data = df[
-                (df['code'] == code) & 
-                (df['date'] > d1_date)
-            ].copy()
-            
-            future_data['j_turns_positive'] = (future_data['kdj_j'] >= 0) & (future_data['prev_j'] < 0)
-            d2_data = future_data[future_data['j_turns_positive']]
-            
-            if len(d2_data) > 0:
-                d2_date = d2_data.iloc[0]['date']
-                d2_price = d2_data.iloc[0]['close']
-                period_return = (d2_price / signal['close'] - 1) * 100
-                
-                result = {
-                    'code': code,
-                    'D1日期': d1_date,
-                    'D2日期': d2_date,
-                    'D1收盘价': signal['close'],
-                    'D2收盘价': d2_price,
-                    'D1-D2收益率': period_return,
-                    'D1_5日均线': signal['ma5'],
-                    'D1_20日均线': signal['ma20'],
-                    'D1_60日均线': signal['ma60'],
-                    'D1_J值': signal['kdj_j'],
-                    'D2_J值': d2_data.iloc[0]['kdj_j'],
-                    'D1_WR14': signal['wr_14'],
-                    'D2_WR14': d2_data.iloc[0]['wr_14'],
-                    'D1_WR28': signal['wr_28'],
-                    'D2_WR28': d2_data.iloc[0]['wr_28'],
-                    'D1_MACD_DIF': signal['macd_dif'],
-                    'D1_MACD_DEA': signal['macd_dea'],
-                    'D1_MACD': signal['macd'],
-                    'D2_MACD_DIF': d2_data.iloc[0]['macd_dif'],
-                    'D2_MACD_DEA': d2_data.iloc[0]['macd_dea'],
-                    'D2_MACD': d2_data.iloc[0]['macd'],
-                    'D1_BOLL中轨': signal['boll_mid_20'],
-                    'D1_BOLL上轨': signal['boll_upper_20'],
-                    'D1_BOLL下轨': signal['boll_lower_20'],
-                    'D2_BOLL中轨': d2_data.iloc[0]['boll_mid_20'],
-                    'D2_BOLL上轨': d2_data.iloc[0]['boll_upper_20'],
-                    'D2_BOLL下轨': d2_data.iloc[0]['boll_lower_20'],
-                    '持仓天数': (d2_date - d1_date).days
-                }
-                results.append(result)
-        
-        if not results:
+        if len(d1_pos) == 0:
             return pd.DataFrame()
             
-        results_df = pd.DataFrame(results)
+        results_df = _d1_d2_table(df, d1_pos, d2_pos)
+        if self.excursions:
+            results_df = _add_excursion_columns(df, results_df, d1_pos, d2_pos)
         return results_df
         
-    def calculate_returns(self, df, signals, days=10):
+    @profile_stage()
+    def calculate_returns(self, df, signals, days=10, index=None):
         """This method is kept for backward compatibility but not used in the new strategy"""
         return pd.DataFrame() 
     
 
 class TradingStrategyC:
-    def __init__(self, j_diff_threshold):
+    def __init__(self, j_diff_threshold, compact=False, excursions=False, regime_gate=None):
         self.ta = TechnicalAnalysis()
         self.j_diff_threshold = j_diff_threshold
+        self.compact = compact
+        # 信号表追加 MAE/MFE/MFE用时/最大回撤 列
+        self.excursions = excursions
+        # 市场状态过滤 (regime.RegimeGate), 只保留允许入场日期的D1
+        self.regime_gate = regime_gate
         
+    @profile_stage()
     def prepare_data(self, df):
         """Prepare data by calculating necessary indicators"""
         df = df.copy()
@@ -256,8 +335,12 @@ class TradingStrategyC:
         df = self.ta.calculate_macd(df)
         # Calculate BOLL
         df = self.ta.calculate_boll(df)
+        # float32指标 + category代码, 计算完成后再降精度
+        if self.compact:
+            df = compact_frame(df)
         return df
         
+    @profile_stage()
     def find_trading_signals(self, df, ma_type):
         """
         Find trading signals based on strategy rules:
@@ -265,101 +348,44 @@ class TradingStrategyC:
         2. Find where J turns negative (D1) and then turns positive (D2)
         3. Only keep signals where J(D2) - J(D1) > 30
         """
-        df = df.copy()
+        df, d1_pos, d2_pos = _find_d1_d2(self.ta, df, ma_type, compact=self.compact)
+        d1_pos, d2_pos = _gate_entries(self.regime_gate, df, d1_pos, d2_pos)
         
-        # Check if price is above MA20
-        df[f'above_{ma_type}'] = df['close'] > df[f'{ma_type}']
+        # print("\n=== 策略C调试信息 ===")
+        # print(f"初始信号数量: {len(d1_pos)}")
         
-        # Find where J value turns negative and then positive
-        df['prev_j'] = df.groupby('code')['kdj_j'].shift(1)
-        df['j_turns_negative'] = (df['kdj_j'] < 0) & (df['prev_j'] >= 0)
+        d1_j = df['kdj_j'].values[d1_pos]
+        d2_j = df['kdj_j'].values[d2_pos]
         
-        # Create initial signals when J turns negative (D1)
-        signals = df[df[f'above_{ma_type}'] & df['j_turns_negative']].copy()
+        # Calculate J value difference
+        j_diff = d2_j - d1_j
         
-        # print("\n=== 策略C调试信息 ===")
-        # print(f"初始信号数量: {len(signals)}")
-        # if len(signals) > 0:
-        #     print("\n初始信号示例:")
-        #     print(signals[['code', 'date', 'close', 'kdj_j', 'prev_j']].head())
+        codes = df['code'].values[d1_pos]
+        d1_dates = df['date'].values[d1_pos]
+        d2_dates = df['date'].values[d2_pos]
+        for code, d1_date, d2_date, j1, j2, diff in zip(codes, d1_dates, d2_dates, d1_j, d2_j, j_diff):
+            print(f"\n股票 {code} 的J值变化:")
+            print(f"D1日期: {pd.Timestamp(d1_date)}, D1_J值: {j1:.2f}")
+            print(f"D2日期: {pd.Timestamp(d2_date)}, D2_J值: {j2:.2f}")
+            print(f"J值差值: {diff:.2f}")
         
-        # For each D1 signal, find the corresponding D2 (when J turns positive)
-        results = []
-        for _, signal in signals.iterrows():
-            code = signal['code']
-            d1_date = signal['date']
-            d1_j = signal['kdj_j']
-            
-            # Find the next date when J turns positive after D1
-            future_data = df[
-                (df['code'] == code) & 
-                (df['date'] > d1_date)
-            ].copy()
-            
-            future_data['j_turns_positive'] = (future_data['kdj_j'] >= 0) & (future_data['prev_j'] < 0)
-            d2_data = future_data[future_data['j_turns_positive']]
-            
-            if len(d2_data) > 0:
-                d2_date = d2_data.iloc[0]['date']
-                d2_price = d2_data.iloc[0]['close']
-                d2_j = d2_data.iloc[0]['kdj_j']
-                
-                # Calculate J value difference
-                j_diff = d2_j - d1_j
-                
-                print(f"\n股票 {code} 的J值变化:")
-                print(f"D1日期: {d1_date}, D1_J值: {d1_j:.2f}")
-                print(f"D2日期: {d2_date}, D2_J值: {d2_j:.2f}")
-                print(f"J值差值: {j_diff:.2f}")
-                
-                # Only keep signals where J(D2) - J(D1) > 30
-                if j_diff > self.j_diff_threshold:
-                    period_return = (d2_price / signal['close'] - 1) * 100
-                    
-                    result = {
-                        'code': code,
-                        'D1日期': d1_date,
-                        'D2日期': d2_date,
-                        'D1收盘价': signal['close'],
-                        'D2收盘价': d2_price,
-                        'D1-D2收益率': period_return,
-                        'D1_5日均线': signal['ma5'],
-                        'D1_20日均线': signal['ma20'],
-                        'D1_60日均线': signal['ma60'],
-                        'D1_J值': d1_j,
-                        'D2_J值': d2_j,
-                        'J值差值': j_diff,
-                        'D1_WR14': signal['wr_14'],
-                        'D2_WR14': d2_data.iloc[0]['wr_14'],
-                        'D1_WR28': signal['wr_28'],
-                        'D2_WR28': d2_data.iloc[0]['wr_28'],
-                        'D1_MACD_DIF': signal['macd_dif'],
-                        'D1_MACD_DEA': signal['macd_dea'],
-                        'D1_MACD': signal['macd'],
-                        'D2_MACD_DIF': d2_data.iloc[0]['macd_dif'],
-                        'D2_MACD_DEA': d2_data.iloc[0]['macd_dea'],
-                        'D2_MACD': d2_data.iloc[0]['macd'],
-                        'D1_BOLL中轨': signal['boll_mid_20'],
-                        'D1_BOLL上轨': signal['boll_upper_20'],
-                        'D1_BOLL下轨': signal['boll_lower_20'],
-                        'D2_BOLL中轨': d2_data.iloc[0]['boll_mid_20'],
-                        'D2_BOLL上轨': d2_data.iloc[0]['boll_upper_20'],
-                        'D2_BOLL下轨': d2_data.iloc[0]['boll_lower_20'],
-                        '持仓天数': (d2_date - d1_date).days
-                    }
-                    results.append(result)
+        # Only keep signals where J(D2) - J(D1) > threshold
+        keep = j_diff > self.j_diff_threshold
+        results_df = _d1_d2_table(df, d1_pos[keep], d2_pos[keep], with_j_diff=True)
+        if self.excursions:
+            results_df = _add_excursion_columns(df, results_df, d1_pos[keep], d2_pos[keep])
         
-        print(f"\n最终信号数量: {len(results)}")
-        if len(results) > 0:
+        print(f"\n最终信号数量: {len(results_df)}")
+        if len(results_df) > 0:
             print("\n最终信号示例:")
-            print(pd.DataFrame(results).head())
+            print(results_df.head())
         
-        if not results:
+        if results_df.empty:
             return pd.DataFrame()
             
-        results_df = pd.DataFrame(results)
         return results_df
         
-    def calculate_returns(self, df, signals, days=10):
+    @profile_stage()
+    def calculate_returns(self, df, signals, days=10, index=None):
         """This method is kept for backward compatibility but not used in the new strategy"""
         return pd.DataFrame() 
\ No newline at end of file
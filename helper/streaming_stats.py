@@ -0,0 +1,264 @@
+import numpy as np
+import pandas as pd
+
+
+"""
+流式统计
+- 信号/交易结果可以分批 (按分片、按文件) 送入累加器, 不需要一次性全部载入内存
+- OnlineCovariance: 按批合并的 Welford/Chan 协方差, 与 DataFrame.corr() 一样按列对剔除缺失值
+- TDigest: 合并式 t-digest 近似分位数, 压缩一次是一遍排序加向量化分组
+- 两种累加器都可以 merge: 各分片并行计算部分状态, 最后合并, 结果与整体计算一致 (分位数为近似)
+
+用法:
+    cov = OnlineCovariance(['D1_J值', 'D1_WR14', 'D1-D2收益率'])
+    digest = TDigest()
+    for shard in shards:
+        cov.update(shard)
+        digest.update(shard['D1_J值'])
+    cov.correlation()
+    approx_qcut(values, digest, q=5)
+"""
+
+
+class OnlineCovariance:
+    """
+    在线协方差
+    Pairwise-complete covariance/correlation accumulated batch by batch, mergeable across shards
+    """
+    def __init__(self, columns):
+        """
+        columns: column names (the order of the matrices)
+        """
+        self.columns = list(columns)
+        k = len(self.columns)
+        # 每个列对 (i, j) 只统计 i 与 j 都不缺失的行:
+        #   n[i, j]      行数
+        #   mean[i, j]   这些行上第 i 列的均值
+        #   m2[i, j]     这些行上第 i 列的离差平方和
+        #   comoment     这些行上 i, j 的离差乘积和
+        self.n = np.zeros((k, k))
+        self.mean = np.zeros((k, k))
+        self.m2 = np.zeros((k, k))
+        self.comoment = np.zeros((k, k))
+
+    def _batch_state(self, data):
+        if isinstance(data, pd.DataFrame):
+            values = data[self.columns].to_numpy(dtype=np.float64)
+        else:
+            values = np.asarray(data, dtype=np.float64).reshape(-1, len(self.columns))
+        valid = ~np.isnan(values)
+        weights = valid.astype(np.float64)
+        # 先按批内列均值中心化, 减少平方和相减时的精度损失
+        with np.errstate(invalid='ignore', divide='ignore'):
+            shift = np.nansum(values, axis=0) / valid.sum(axis=0)
+        centered = np.where(valid, values - np.nan_to_num(shift), 0.)
+
+        n = weights.T @ weights
+        sums = centered.T @ weights               # sums[i, j]: 列对 (i, j) 行上第 i 列之和
+        squares = (centered ** 2).T @ weights
+        cross = centered.T @ centered
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_c = np.where(n > 0, sums / n, 0.)
+        m2 = squares - sums * mean_c
+        comoment = cross - sums * mean_c.T
+        mean = mean_c + np.nan_to_num(shift)[:, None]
+        return n, mean, m2, comoment
+
+    def _combine(self, n_b, mean_b, m2_b, comoment_b):
+        n_a = self.n
+        n = n_a + n_b
+        delta = mean_b - self.mean
+        with np.errstate(invalid='ignore', divide='ignore'):
+            ratio = np.where(n > 0, n_a * n_b / n, 0.)
+            self.mean = self.mean + delta * np.where(n > 0, n_b / n, 0.)
+        self.m2 = self.m2 + m2_b + delta ** 2 * ratio
+        # comoment 的修正项用两列各自在该列对上的均值差
+        self.comoment = self.comoment + comoment_b + delta * delta.T * ratio
+        self.n = n
+
+    def update(self, data):
+        """
+        Add a batch of rows
+        data: DataFrame with the columns, or an (n x k) array in column order
+        """
+        self._combine(*self._batch_state(data))
+        return self
+
+    def merge(self, other):
+        """Fold another accumulator (e.g. from another shard) into this one"""
+        if other.columns != self.columns:
+            raise ValueError("Accumulators have different columns")
+        self._combine(other.n, other.mean, other.m2, other.comoment)
+        return self
+
+    @property
+    def count(self):
+        return pd.Series(np.diag(self.n), index=self.columns)
+
+    def covariance(self, ddof=1):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cov = np.where(self.n > ddof, self.comoment / (self.n - ddof), np.nan)
+        return pd.DataFrame(cov, index=self.columns, columns=self.columns)
+
+    def correlation(self, min_periods=2):
+        """Pairwise-complete Pearson correlation (same as DataFrame.corr())"""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            corr = self.comoment / np.sqrt(self.m2 * self.m2.T)
+        corr = np.where(self.n >= min_periods, np.clip(corr, -1, 1), np.nan)
+        return pd.DataFrame(corr, index=self.columns, columns=self.columns)
+
+    def correlation_with(self, target):
+        """Correlation of every other column with target, sorted ascending"""
+        return self.correlation()[target].drop(target).sort_values()
+
+    def to_dict(self):
+        return {'columns': self.columns, 'n': self.n.tolist(), 'mean': self.mean.tolist(),
+                'm2': self.m2.tolist(), 'comoment': self.comoment.tolist()}
+
+    @classmethod
+    def from_dict(cls, state):
+        acc = cls(state['columns'])
+        for key in ('n', 'mean', 'm2', 'comoment'):
+            setattr(acc, key, np.asarray(state[key], dtype=np.float64))
+        return acc
+
+
+class TDigest:
+    """
+    t-digest
+    Mergeable approximate quantiles (merging digest with the arcsine scale function)
+    """
+    def __init__(self, compression=200, buffer_size=None):
+        """
+        compression: accuracy parameter (number of centroids is about compression / 2)
+        buffer_size: values collected before a compression pass (default: 10 x compression)
+        """
+        self.compression = compression
+        self.buffer_size = buffer_size or 10 * compression
+        self.means = np.array([])
+        self.weights = np.array([])
+        self._buffer = []
+        self._buffered = 0
+        self.min = np.inf
+        self.max = -np.inf
+
+    @property
+    def count(self):
+        self._flush()
+        return float(self.weights.sum())
+
+    def update(self, values, weights=None):
+        """Add values (NaN ignored)"""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        weights = np.ones(len(values)) if weights is None else np.asarray(weights, dtype=np.float64).ravel()
+        keep = ~np.isnan(values)
+        values, weights = values[keep], weights[keep]
+        if len(values) == 0:
+            return self
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        self._buffer.append((values, weights))
+        self._buffered += len(values)
+        if self._buffered >= self.buffer_size:
+            self._flush()
+        return self
+
+    def merge(self, other):
+        """Fold another digest into this one"""
+        other._flush()
+        if len(other.means):
+            self._buffer.append((other.means, other.weights))
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+        self._flush()
+        return self
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        means = np.concatenate([self.means] + [values for values, _ in self._buffer])
+        weights = np.concatenate([self.weights] + [w for _, w in self._buffer])
+        self._buffer, self._buffered = [], 0
+        order = np.argsort(means, kind='stable')
+        means, weights = means[order], weights[order]
+        total = weights.sum()
+        # 每个质心左边界的累计比例映射到 k 尺度, 同一整数段内的点合并成一个质心;
+        # arcsine 尺度在两端 k 变化快, 尾部质心更小, 极端分位数更准
+        q_left = (np.cumsum(weights) - weights) / total
+        k = self.compression / (2 * np.pi) * np.arcsin(2 * q_left - 1)
+        cluster = np.floor(k - k[0]).astype(np.int64)
+        starts = np.flatnonzero(np.r_[True, cluster[1:] != cluster[:-1]])
+        cluster_weights = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / cluster_weights
+        self.weights = cluster_weights
+
+    def quantile(self, q):
+        """Approximate quantiles (scalar or array of q in [0, 1])"""
+        self._flush()
+        if len(self.means) == 0:
+            return np.full(np.shape(q), np.nan) if np.ndim(q) else np.nan
+        q = np.asarray(q, dtype=np.float64)
+        total = self.weights.sum()
+        # 质心位于其权重的中点; 两端用最小/最大值锚定
+        centers = (np.cumsum(self.weights) - self.weights / 2) / total
+        xs = np.r_[0., centers, 1.]
+        ys = np.r_[self.min, self.means, self.max]
+        result = np.interp(q, xs, ys)
+        return float(result) if result.ndim == 0 else result
+
+    def cdf(self, x):
+        """Approximate share of values <= x"""
+        self._flush()
+        total = self.weights.sum()
+        centers = (np.cumsum(self.weights) - self.weights / 2) / total
+        return np.interp(x, np.r_[self.min, self.means, self.max], np.r_[0., centers, 1.])
+
+    def to_dict(self):
+        self._flush()
+        return {'compression': self.compression, 'means': self.means.tolist(), 'weights': self.weights.tolist(),
+                'min': self.min, 'max': self.max}
+
+    @classmethod
+    def from_dict(cls, state):
+        digest = cls(state['compression'])
+        digest.means = np.asarray(state['means'], dtype=np.float64)
+        digest.weights = np.asarray(state['weights'], dtype=np.float64)
+        digest.min, digest.max = state['min'], state['max']
+        return digest
+
+
+def approx_qcut(values, digest, q=5, labels=None):
+    """
+    pd.qcut with bin edges from a digest, so the edges can come from data that is not in memory
+    values: values to bucket (e.g. one shard)
+    digest: TDigest over all values
+    q: number of equal-frequency buckets
+    """
+    edges = digest.quantile(np.linspace(0, 1, q + 1))
+    if np.isnan(edges).any():
+        raise ValueError("Digest is empty")
+    edges = np.unique(edges)
+    # 与 pd.qcut 一样, 所有分位点重合时无法分组
+    if len(edges) < 2:
+        raise ValueError(f"Bin edges must be unique: the digest holds a single value ({edges[0]})")
+    # 两端放宽, 确保最小/最大值落在首尾桶内
+    edges[0], edges[-1] = -np.inf, np.inf
+    if labels is not None and len(labels) != len(edges) - 1:
+        raise ValueError("Duplicate bucket edges, use fewer buckets or labels=None")
+    return pd.cut(values, edges, labels=labels)
+
+
+def shard_statistics(frames, columns, quantile_column=None, compression=200):
+    """
+    Streaming correlation (and optional digest) over an iterable of frames, one frame in memory at a time
+
+    returns:
+        (OnlineCovariance, TDigest or None)
+    """
+    cov = OnlineCovariance(columns)
+    digest = TDigest(compression) if quantile_column else None
+    for frame in frames:
+        cov.update(frame)
+        if digest is not None:
+            digest.update(frame[quantile_column].values)
+    return cov, digest
@@ -0,0 +1,439 @@
+import argparse
+import itertools
+import inspect
+import json
+import os
+import socket
+import threading
+import time
+import traceback
+
+import pandas as pd
+
+from .data_loader import DataLoader
+from .strategy import TradingStrategyA, TradingStrategyB, TradingStrategyC
+from .technical_analysis import TechnicalAnalysis
+
+
+"""
+多机参数扫描
+- 协调者把 (参数点 x 代码分片) 拆成任务, 写入共享目录的工作队列
+- 任意数量、任意机器上的 worker 从队列领取任务, 跑 prepare_data / find_trading_signals, 写回压缩的结果文件
+- 领取任务用 os.rename 原子移动 (pending -> running), 同一任务只会被一个 worker 拿到
+- running 文件的修改时间就是租约心跳 (领取时立即刷新), 过期的任务重新排队; 失败的任务按次数重试
+- 状态之间的移动都是先改名取得文件再改写, 并发的领取/重新排队中只有一方成功, 同一任务不会同时出现在两个目录
+- 结果文件按任务ID命名、先写临时文件再原子替换, 重复执行同一任务是幂等的
+
+目录结构:
+    sweep.json                          扫描定义 (数据、策略、参数网格、分片)
+    tasks/{pending,running,done,failed}/<task_id>.json
+    results/<task_id>.pkl.gz
+
+用法:
+    python -m helper.sweep worker /shared/sweep       # 在每台机器上启动
+    python -m helper.sweep status /shared/sweep
+    python -m helper.sweep merge /shared/sweep
+"""
+
+
+STRATEGIES = {'A': TradingStrategyA, 'B': TradingStrategyB, 'C': TradingStrategyC}
+KDJ_PARAMS = {'kdj_n': 'n', 'kdj_m1': 'm1', 'kdj_m2': 'm2'}
+STATES = ('pending', 'running', 'done', 'failed')
+# 正在移动的任务文件的临时名后缀, 不会被 _task_ids 列出
+_PRIVATE_SUFFIX = '.moving'
+
+
+def _write_json(path, data):
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=1, default=str)
+    os.replace(tmp, path)
+
+
+def _read_json(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _param_points(strategy, param_grid):
+    """Expand the grid into parameter points, keys split into constructor, KDJ and ma_type parameters"""
+    init_params = set(inspect.signature(STRATEGIES[strategy].__init__).parameters) - {'self'}
+    unknown = set(param_grid) - init_params - set(KDJ_PARAMS) - {'ma_type'}
+    if unknown:
+        raise ValueError(f"Strategy {strategy} does not accept parameters: {sorted(unknown)}")
+    grid = dict(param_grid)
+    grid.setdefault('ma_type', ['ma20'])
+    keys = sorted(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+
+
+def _shard_codes(codes, n_shards):
+    codes = sorted(codes)
+    return [codes[i::n_shards] for i in range(n_shards) if codes[i::n_shards]]
+
+
+class SweepQueue:
+    """
+    参数扫描工作队列
+    Filesystem work queue shared by the coordinator and the workers (a local or network directory)
+    """
+    def __init__(self, root):
+        self.root = root
+        self.spec_path = os.path.join(root, 'sweep.json')
+        self.results_dir = os.path.join(root, 'results')
+
+    @classmethod
+    def create(cls,
+               root,
+               stock_data_path,
+               strategy,
+               param_grid,
+               n_shards=8,
+               holding_days=10,
+               max_attempts=3,
+               hs300_constituents_path=None):
+        """
+        Write the sweep definition and enqueue every (parameter point x code shard) task
+        strategy: 'A', 'B' or 'C'
+        param_grid: dict of parameter lists - 'ma_type', 'kdj_n' / 'kdj_m1' / 'kdj_m2'
+                    and constructor parameters such as 'j_diff_threshold'
+        n_shards: number of code shards per parameter point
+        holding_days: return horizon for strategy A (B/C use D1-D2收益率)
+
+        Calling create again on an existing root only adds tasks that are not already queued.
+        """
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown strategy: {strategy}, expected one of {sorted(STRATEGIES)}")
+        queue = cls(root)
+        for state in STATES:
+            os.makedirs(queue._state_dir(state), exist_ok=True)
+        os.makedirs(queue.results_dir, exist_ok=True)
+
+        loader = DataLoader(stock_data_path, hs300_constituents_path)
+        codes = loader.load_stock_data(usecols=['code'])['code'].unique()
+        if hs300_constituents_path is not None:
+            members = set(loader.load_hs300_constituents()['code'])
+            codes = [code for code in codes if code in members]
+        shards = _shard_codes(codes, n_shards)
+        points = _param_points(strategy, param_grid)
+        _write_json(queue.spec_path, {
+            'stock_data_path': os.path.abspath(stock_data_path),
+            'strategy': strategy,
+            'param_grid': param_grid,
+            'holding_days': holding_days,
+            'max_attempts': max_attempts,
+            'n_points': len(points),
+            'n_shards': len(shards),
+        })
+
+        existing = set(queue._task_ids())
+        for p, point in enumerate(points):
+            for s, shard in enumerate(shards):
+                task_id = f'p{p:04d}-s{s:03d}'
+                if task_id in existing:
+                    continue
+                _write_json(queue._task_path('pending', task_id), {
+                    'task_id': task_id,
+                    'point': point,
+                    'shard': s,
+                    'codes': shard,
+                    'attempts': 0,
+                    'errors': [],
+                })
+        return queue
+
+    @property
+    def spec(self):
+        return _read_json(self.spec_path)
+
+    def _state_dir(self, state):
+        return os.path.join(self.root, 'tasks', state)
+
+    def _task_path(self, state, task_id):
+        return os.path.join(self._state_dir(state), f'{task_id}.json')
+
+    def _result_path(self, task_id):
+        return os.path.join(self.results_dir, f'{task_id}.pkl.gz')
+
+    def _task_ids(self, state=None):
+        states = [state] if state else STATES
+        ids = []
+        for s in states:
+            directory = self._state_dir(s)
+            if os.path.isdir(directory):
+                ids.extend(name[:-5] for name in os.listdir(directory) if name.endswith('.json'))
+        return sorted(ids)
+
+    # ------------------------------------------------------------ task lifecycle
+
+    def claim(self, worker_id):
+        """Atomically move one pending task to running, None when the queue is empty"""
+        for task_id in self._task_ids('pending'):
+            private = self._take('pending', task_id)
+            if private is None:
+                continue  # 被其他 worker 抢先领取
+            # 改名保留 pending 文件原来的修改时间: 先在私有文件上写入领取信息 (重写即刷新心跳),
+            # 再放进 running, running 中不会出现看起来已过期的新任务
+            task = _read_json(private)
+            task['worker'] = worker_id
+            task['claimed_at'] = time.time()
+            self._release(private, task, 'running')
+            return task
+        return None
+
+    def heartbeat(self, task):
+        """Extend the lease of a running task"""
+        try:
+            os.utime(self._task_path('running', task['task_id']))
+        except FileNotFoundError:
+            pass
+
+    def complete(self, task, result):
+        """Store the result (atomic, overwrite-safe) and mark the task done"""
+        path = self._result_path(task['task_id'])
+        tmp = f'{path}.{os.getpid()}.tmp'
+        pd.to_pickle(result, tmp, compression='gzip')
+        os.replace(tmp, path)
+        self._move(task, 'running', 'done')
+
+    def fail(self, task, error):
+        """Record the error and requeue the task, or park it in failed after max_attempts"""
+        return self._move(task, 'running', self._record_failure(task, error))
+
+    def _record_failure(self, task, error):
+        """Count a failed attempt, returns the target state"""
+        task['attempts'] = task.get('attempts', 0) + 1
+        task['errors'] = task.get('errors', []) + [error]
+        task.pop('claimed_at', None)
+        return 'failed' if task['attempts'] >= self.spec['max_attempts'] else 'pending'
+
+    def _take(self, state, task_id):
+        """Rename a task file to a private name, None when another process moved it first"""
+        private = f'{self._task_path(state, task_id)}.{os.getpid()}.{threading.get_ident()}{_PRIVATE_SUFFIX}'
+        try:
+            os.rename(self._task_path(state, task_id), private)
+        except FileNotFoundError:
+            return None
+        return private
+
+    def _release(self, private, task, target):
+        """Rewrite a taken task file and publish it in the target state"""
+        _write_json(private, task)
+        os.replace(private, self._task_path(target, task['task_id']))
+
+    def _move(self, task, source, target):
+        """
+        Move a task between states, False when another process moved it first (lost the race)
+        先改名取得文件再改写内容, 不会重新创建已被别人移走的文件
+        """
+        private = self._take(source, task['task_id'])
+        if private is None:
+            return False
+        self._release(private, task, target)
+        return True
+
+    def _last_seen(self, path, task=None):
+        """Latest heartbeat of a running task: file mtime or claimed_at, whichever is later"""
+        seen = os.path.getmtime(path)
+        if task is not None:
+            seen = max(seen, task.get('claimed_at') or 0)
+        return seen
+
+    def _recover_private(self, lease_seconds):
+        """Put back task files left under a private name by a process that died mid-move"""
+        now = time.time()
+        for state in STATES:
+            directory = self._state_dir(state)
+            if not os.path.isdir(directory):
+                continue
+            for name in os.listdir(directory):
+                if not name.endswith(_PRIVATE_SUFFIX):
+                    continue
+                private = os.path.join(directory, name)
+                public = os.path.join(directory, name[:name.index('.json.') + 5])
+                try:
+                    # 改名会更新 ctime 而不更新 mtime, 用两者中较新的判断文件是否仍在移动中
+                    stat = os.stat(private)
+                    if now - max(stat.st_mtime, stat.st_ctime) >= lease_seconds and not os.path.exists(public):
+                        os.rename(private, public)
+                except FileNotFoundError:
+                    pass
+
+    def requeue_expired(self, lease_seconds=600):
+        """Requeue running tasks whose worker stopped heartbeating, returns their ids"""
+        self._recover_private(lease_seconds)
+        expired = []
+        for task_id in self._task_ids('running'):
+            try:
+                if time.time() - self._last_seen(self._task_path('running', task_id)) < lease_seconds:
+                    continue
+            except FileNotFoundError:
+                continue
+            private = self._take('running', task_id)
+            if private is None:
+                continue
+            # 检查之后领取者可能刚刷新过心跳: 取得文件后再判断一次, 仍然有效就放回
+            if time.time() - self._last_seen(private) < lease_seconds:
+                os.rename(private, self._task_path('running', task_id))
+                continue
+            task = _read_json(private)
+            if time.time() - self._last_seen(private, task) < lease_seconds:
+                os.rename(private, self._task_path('running', task_id))
+                continue
+            # 结果已写出但未标记完成 (worker 在两步之间退出)
+            if os.path.exists(self._result_path(task_id)):
+                self._release(private, task, 'done')
+            else:
+                target = self._record_failure(task, f"lease expired (worker {task.get('worker')})")
+                self._release(private, task, target)
+            expired.append(task_id)
+        return expired
+
+    def retry_failed(self):
+        """Move failed tasks back to pending with a fresh attempt budget"""
+        task_ids = self._task_ids('failed')
+        for task_id in task_ids:
+            task = _read_json(self._task_path('failed', task_id))
+            task['attempts'] = 0
+            self._move(task, 'failed', 'pending')
+        return task_ids
+
+    def status(self):
+        """Number of tasks in each state"""
+        return {state: len(self._task_ids(state)) for state in STATES}
+
+    # ------------------------------------------------------------ results
+
+    def merge(self, allow_partial=False):
+        """
+        Combine result files
+        returns:
+            (all signals tagged with their parameters, per-parameter-point summary)
+        """
+        status = self.status()
+        if not allow_partial and status['done'] < sum(status.values()):
+            raise RuntimeError(f"Sweep not finished: {status}")
+
+        signals = []
+        for task_id in self._task_ids('done'):
+            result = pd.read_pickle(self._result_path(task_id), compression='gzip')
+            if not result.empty:
+                signals.append(result)
+        signals = pd.concat(signals, ignore_index=True) if signals else pd.DataFrame()
+        if signals.empty:
+            return signals, pd.DataFrame()
+
+        param_cols = sorted(_param_points(self.spec['strategy'], self.spec['param_grid'])[0])
+        summary = signals.groupby(param_cols, dropna=False)['return'].agg(
+            trades='count',
+            mean_return='mean',
+            median_return='median',
+            win_rate=lambda r: (r > 0).mean() * 100,
+        ).reset_index()
+        return signals, summary.sort_values('mean_return', ascending=False, ignore_index=True)
+
+
+def run_task(spec, task, cache=None):
+    """
+    Run one task: load the shard, prepare it (cached per shard and KDJ parameters), find signals
+    returns:
+        signal frame with a 'return' column and the parameter columns
+    """
+    point = dict(task['point'])
+    ma_type = point.pop('ma_type')
+    kdj = {KDJ_PARAMS[key]: point.pop(key) for key in list(point) if key in KDJ_PARAMS}
+    strategy = STRATEGIES[spec['strategy']](**point)
+
+    key = (task['shard'], tuple(sorted(kdj.items())))
+    prepared = cache.get(key) if cache is not None else None
+    if prepared is None:
+        raw = DataLoader(spec['stock_data_path'], None).load_stock_data(codes=task['codes'])
+        prepared = strategy.prepare_data(raw)
+        if kdj:
+            prepared = TechnicalAnalysis.calculate_kdj(prepared, **kdj)
+        if cache is not None:
+            cache.clear()  # 每个 worker 只保留最近一个分片, 控制内存
+            cache[key] = prepared
+
+    signals = strategy.find_trading_signals(prepared, ma_type=ma_type)
+    if signals.empty:
+        result = pd.DataFrame()
+    elif 'D1-D2收益率' in signals.columns:
+        result = signals.assign(**{'return': signals['D1-D2收益率']})
+    else:
+        returns = strategy.calculate_returns(prepared, signals, days=spec['holding_days'])
+        result = returns
+    for name, value in task['point'].items():
+        result[name] = value
+    result['task_id'] = task['task_id']
+    return result
+
+
+def run_worker(root, worker_id=None, lease_seconds=600, poll_seconds=5, exit_when_idle=True):
+    """
+    Pull and run tasks until the queue is drained
+    lease_seconds: a running task is requeued when its heartbeat is older than this
+    exit_when_idle: stop once nothing is pending or running (otherwise keep polling)
+    """
+    queue = SweepQueue(root)
+    spec = queue.spec
+    worker_id = worker_id or f'{socket.gethostname()}-{os.getpid()}'
+    cache = {}
+    completed = 0
+    while True:
+        queue.requeue_expired(lease_seconds)
+        task = queue.claim(worker_id)
+        if task is None:
+            status = queue.status()
+            if exit_when_idle and status['pending'] == 0 and status['running'] == 0:
+                return completed
+            time.sleep(poll_seconds)
+            continue
+
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(lease_seconds / 3):
+                queue.heartbeat(task)
+
+        heart = threading.Thread(target=beat, daemon=True)
+        heart.start()
+        try:
+            result = run_task(spec, task, cache)
+            queue.complete(task, result)
+            completed += 1
+        except Exception:
+            queue.fail(task, traceback.format_exc(limit=5))
+        finally:
+            stop.set()
+            heart.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parameter sweep work queue")
+    parser.add_argument('command', choices=['worker', 'status', 'merge', 'requeue', 'retry'])
+    parser.add_argument('root')
+    parser.add_argument('--worker-id')
+    parser.add_argument('--lease', type=float, default=600)
+    parser.add_argument('--output', help="CSV path for the merged summary")
+    args = parser.parse_args()
+
+    queue = SweepQueue(args.root)
+    if args.command == 'worker':
+        print(f"完成任务数: {run_worker(args.root, args.worker_id, args.lease)}")
+    elif args.command == 'status':
+        print(queue.status())
+    elif args.command == 'requeue':
+        print(queue.requeue_expired(args.lease))
+    elif args.command == 'retry':
+        print(queue.retry_failed())
+    else:
+        signals, summary = queue.merge(allow_partial=True)
+        print(f"信号数: {len(signals)}")
+        print(summary.to_string(index=False, float_format=lambda v: f'{v:.2f}'))
+        if args.output:
+            summary.to_csv(args.output, index=False, encoding='utf-8-sig')
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,27 @@
 import numpy as np
+import pandas as pd
+from .profiler import profile_stage
+from . import kernels
+
 
 class TechnicalAnalysis:
+    # 递归指标的计算后端: 'pandas' (参考实现), 'numpy', 'numba' (未安装时回退到numpy)
+    backend = kernels.DEFAULT_BACKEND
+
+    @classmethod
+    def set_backend(cls, name):
+        """Select the compute backend for KDJ, MACD and the D1->D2 scan"""
+        cls.backend = kernels.resolve_backend(name)
+        return cls.backend
+
     @staticmethod
+    @profile_stage()
     def calculate_ma(df, window=20):
         """Calculate Moving Average for each stock"""
         return df.groupby('code')['close'].transform(lambda x: x.rolling(window=window).mean())
     
     @staticmethod
+    @profile_stage()
     def calculate_kdj(df, n=9, m1=3, m2=3):
         """
         Calculate KDJ indicator
@@ -15,6 +30,22 @@ class TechnicalAnalysis:
         m2: D period
         """
         df = df.copy()
+        backend = kernels.resolve_backend(TechnicalAnalysis.backend)
+        if backend != 'pandas':
+            order, starts, lengths = kernels.segment_order(df['code'].values)
+            seg = np.repeat(np.arange(len(starts)), lengths)
+            low = pd.Series(df['low'].values[order]).groupby(seg)
+            high = pd.Series(df['high'].values[order]).groupby(seg)
+            low_list = low.rolling(window=n, min_periods=1).min().values
+            high_list = high.rolling(window=n, min_periods=1).max().values
+            with np.errstate(divide='ignore', invalid='ignore'):
+                rsv = (df['close'].values[order] - low_list) / (high_list - low_list) * 100
+            k, d = kernels.kdj_recursion(rsv, starts, lengths, m1, m2, backend=backend)
+            for col, values in [('kdj_k', k), ('kdj_d', d), ('kdj_j', 3 * k - 2 * d)]:
+                out = np.empty(len(df))
+                out[order] = values
+                df[col] = out
+            return df
         
         # Group by code to calculate KDJ for each stock
         for code in df['code'].unique():
@@ -51,6 +82,7 @@ class TechnicalAnalysis:
         return df
 
     @staticmethod
+    @profile_stage()
     def calculate_wr(df, period=14):
         """
         Calculate Williams %R indicator
@@ -76,6 +108,7 @@ class TechnicalAnalysis:
         return df 
 
     @staticmethod
+    @profile_stage()
     def calculate_macd(df, fast_period=12, slow_period=26, signal_period=9):
         """
         Calculate MACD indicator
@@ -84,6 +117,19 @@ class TechnicalAnalysis:
         signal_period: signal line EMA period (default 9)
         """
         df = df.copy()
+        backend = kernels.resolve_backend(TechnicalAnalysis.backend)
+        if backend != 'pandas':
+            order, starts, lengths = kernels.segment_order(df['code'].values)
+            close = df['close'].values[order]
+            ema_fast = kernels.ewm_mean(close, starts, lengths, span=fast_period, backend=backend)
+            ema_slow = kernels.ewm_mean(close, starts, lengths, span=slow_period, backend=backend)
+            dif = ema_fast - ema_slow
+            dea = kernels.ewm_mean(dif, starts, lengths, span=signal_period, backend=backend)
+            for col, values in [('macd_dif', dif), ('macd_dea', dea), ('macd', 2 * (dif - dea))]:
+                out = np.empty(len(df))
+                out[order] = values
+                df[col] = out
+            return df
         for code in df['code'].unique():
             mask = df['code'] == code
             df_stock = df[mask].copy()
@@ -99,6 +145,7 @@ class TechnicalAnalysis:
         return df
 
     @staticmethod
+    @profile_stage()
     def calculate_boll(df, window=20, num_std=2):
         """
         Calculate Bollinger Bands (BOLL)
@@ -116,4 +163,18 @@ class TechnicalAnalysis:
             df.loc[mask, f'boll_mid_{window}'] = mid.values
             df.loc[mask, f'boll_upper_{window}'] = upper.values
             df.loc[mask, f'boll_lower_{window}'] = lower.values
-        return df 
\ No newline at end of file
+        return df
+
+    @staticmethod
+    def next_event_index(df, events):
+        """
+        Row position (into df) of the first later row of the same code where events is True, -1 if none
+        df: frame with 'code' and 'date'
+        events: boolean mask aligned with df, e.g. J turns positive
+        """
+        order, starts, lengths = kernels.segment_order(df['code'].values, df['date'].values)
+        found = kernels.next_event_index(np.asarray(events, dtype=bool)[order], starts, lengths,
+                                         backend=TechnicalAnalysis.backend)
+        result = np.full(len(df), -1, dtype=np.int64)
+        result[order] = np.where(found >= 0, order[np.maximum(found, 0)], -1)
+        return result
@@ -0,0 +1,136 @@
+import numpy as np
+import pandas as pd
+
+
+"""
+交易日历
+- 由行情数据中出现过的日期 (或本地日历文件) 构建, 每个交易日对应一个整数序号
+- 日期 -> 序号 通过按自然日展开的稠密查找表完成, 每次查询 O(1)
+- "N个交易日之后"、持仓交易日数、交易周边界都变成序号上的整数运算, 停牌不会造成错位
+"""
+
+
+def _day_numbers(dates):
+    """Dates as int64 days since 1970-01-01 (NaT -> min int64)"""
+    values = pd.to_datetime(pd.Series(dates)).values.astype('datetime64[D]')
+    return values.view(np.int64)
+
+
+class TradingCalendar:
+    """
+    交易日历
+    Trading days with O(1) date <-> ordinal lookups and trading-day arithmetic
+    """
+    def __init__(self, dates):
+        """
+        dates: trading dates (any order, duplicates allowed)
+        """
+        days = np.unique(_day_numbers(dates))
+        days = days[days != np.iinfo(np.int64).min]
+        if len(days) == 0:
+            raise ValueError("Trading calendar needs at least one date")
+        self.days = days
+        self.dates = pd.DatetimeIndex(days.astype('datetime64[D]')).as_unit('ns')
+        self._base = days[0]
+        # 稠密查找表: 自然日偏移 -> 该日或之后第一个交易日的序号
+        self._next = np.searchsorted(days, np.arange(days[0], days[-1] + 1), side='left')
+        self._is_trading = np.zeros(len(self._next), dtype=bool)
+        self._is_trading[days - self._base] = True
+        # 交易周: 周一开始的自然周, 按出现顺序编号
+        week_keys = (days + 3) // 7
+        self._week = np.r_[0, np.cumsum(week_keys[1:] != week_keys[:-1])]
+
+    @classmethod
+    def from_data(cls, df, date_col='date'):
+        """Calendar of every date present in a price frame"""
+        return cls(df[date_col].values)
+
+    @classmethod
+    def from_file(cls, path, date_col=None):
+        """
+        Calendar from a local CSV file
+        date_col: column holding the trading dates (default: the first column)
+        """
+        calendar = pd.read_csv(path)
+        return cls(calendar[date_col or calendar.columns[0]].values)
+
+    def to_file(self, path):
+        """Save the calendar as a one-column CSV readable by from_file"""
+        pd.DataFrame({'date': self.dates.strftime('%Y-%m-%d')}).to_csv(path, index=False)
+
+    def __len__(self):
+        return len(self.days)
+
+    def __repr__(self):
+        return f"TradingCalendar({len(self)} days, {self.dates[0].date()} ~ {self.dates[-1].date()})"
+
+    # ------------------------------------------------------------ lookups
+
+    def ordinal(self, dates, how='exact'):
+        """
+        Trading-day ordinals of dates
+        how: 'exact' - -1 for non-trading days
+             'next'  - ordinal of the date or the first trading day after it
+             'prev'  - ordinal of the date or the last trading day before it
+        Dates outside the calendar map to -1.
+        """
+        if how not in ('exact', 'next', 'prev'):
+            raise ValueError(f"Unknown lookup mode: {how}")
+        days = _day_numbers(dates)
+        missing = days == np.iinfo(np.int64).min
+        offsets = np.where(missing, 0, days - self._base)
+        inside = (offsets >= 0) & (offsets < len(self._next))
+        clipped = np.where(inside, offsets, 0)
+        result = self._next[clipped].astype(np.int64)
+        trading = self._is_trading[clipped]
+        if how == 'exact':
+            inside &= trading
+        elif how == 'prev':
+            result = np.where(trading, result, result - 1)
+        # 日历之前的日期: next 映射到第一个交易日; 日历之后的日期: prev 映射到最后一个交易日
+        if how == 'next':
+            result = np.where(offsets < 0, 0, result)
+            inside |= offsets < 0
+        elif how == 'prev':
+            result = np.where(offsets >= len(self._next), len(self) - 1, result)
+            inside |= offsets >= len(self._next)
+        return np.where(inside & ~missing, result, -1)
+
+    def date(self, ordinals):
+        """Dates of trading-day ordinals (NaT outside the calendar)"""
+        ordinals = np.asarray(ordinals, dtype=np.int64)
+        valid = (ordinals >= 0) & (ordinals < len(self))
+        values = np.full(len(ordinals), np.datetime64('NaT'), dtype='datetime64[ns]')
+        values[valid] = self.dates.values[ordinals[valid]]
+        return pd.DatetimeIndex(values)
+
+    def offset(self, dates, n, how='exact'):
+        """Date n trading days after (n < 0: before) each date, NaT when it falls outside the calendar"""
+        ordinals = self.ordinal(dates, how=how)
+        shifted = np.where(ordinals >= 0, ordinals + n, -1)
+        return self.date(shifted)
+
+    def trading_days_between(self, start, end):
+        """Trading days from start to end (-1 when either date is not a trading day)"""
+        start_ord = self.ordinal(start)
+        end_ord = self.ordinal(end)
+        return np.where((start_ord >= 0) & (end_ord >= 0), end_ord - start_ord, -1)
+
+    # ------------------------------------------------------------ weeks
+
+    def week_id(self, dates):
+        """Trading-week number of each date (weeks start on Monday, -1 for non-trading days)"""
+        ordinals = self.ordinal(dates)
+        return np.where(ordinals >= 0, self._week[np.maximum(ordinals, 0)], -1)
+
+    def week_start(self, dates):
+        """First trading day of each date's trading week (NaT for non-trading days)"""
+        weeks = self.week_id(dates)
+        first = np.flatnonzero(np.r_[True, self._week[1:] != self._week[:-1]])
+        return self.date(np.where(weeks >= 0, first[np.maximum(weeks, 0)], -1))
+
+    def is_week_end(self, dates):
+        """True on the last trading day of each week"""
+        ordinals = self.ordinal(dates)
+        last = np.r_[self._week[1:] != self._week[:-1], True]
+        return (ordinals >= 0) & last[np.maximum(ordinals, 0)]
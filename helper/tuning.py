@@ -0,0 +1,370 @@
+import math
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from .exits import ExitEngine
+from .price_index import PriceIndex
+from .technical_analysis import TechnicalAnalysis
+from .walk_forward import _score
+
+
+"""
+自适应参数搜索
+- 逐次减半 (successive halving): 先随机抽取一批参数组合, 在部分代码 (及较短历史) 上评估,
+  每一轮只保留得分前 1/eta 的组合进入下一轮, 预算按 eta 倍增加, 最后一轮为全部代码、全部历史
+- TPE式细化: 以全量预算上已评估的组合为观测, 按得分分为好/差两组, 每个参数按取值估计两组的分布
+  l(x) / g(x), 从 l 中抽样候选, 取 l/g 最大且未评估过的组合继续评估
+- 指标缓存: 同一预算档 (以代码集合、日期范围和数据哈希识别) 上 KDJ (n, m1, m2) 的J值事件与 D2 位置、各窗口的均线只计算一次,
+  只在出场规则或阈值上不同的组合直接复用
+- 评估直接在行位置上构造交易 (与 TradingStrategyA/B/C 的 D1/D2 规则一致), 不生成完整信号表
+
+用法:
+    search = AdaptiveSearch('C', {
+        'kdj_n': [5, 9, 14], 'kdj_m1': [2, 3, 4], 'kdj_m2': [2, 3, 4],
+        'ma_window': [10, 20, 30, 60], 'j_diff_threshold': [10, 20, 30, 40],
+        'stop_loss': [None, 0.05, 0.08],
+    })
+    trials = search.run(df)
+    search.best_
+"""
+
+
+STRATEGIES = ('A', 'B', 'C')
+KDJ_PARAMS = ('kdj_n', 'kdj_m1', 'kdj_m2')
+EXIT_PARAMS = ('stop_loss', 'take_profit', 'trailing_stop', 'max_holding')
+STRATEGY_PARAMS = {
+    'A': ('ma_window', 'holding_days'),
+    'B': ('ma_window',),
+    'C': ('ma_window', 'j_diff_threshold'),
+}
+DEFAULTS = {
+    'kdj_n': 9, 'kdj_m1': 3, 'kdj_m2': 3,
+    'ma_window': 20, 'holding_days': 10, 'j_diff_threshold': 20,
+    'stop_loss': None, 'take_profit': None, 'trailing_stop': None, 'max_holding': None,
+}
+PRICE_COLUMNS = ['code', 'date', 'open', 'high', 'low', 'close']
+
+
+class IndicatorCache:
+    """
+    指标缓存
+    Memoized indicator arrays keyed by (rung fingerprint, indicator, parameters), shared across trials
+    """
+    def __init__(self, max_entries=256):
+        """
+        max_entries: least recently used entries beyond this are dropped (None: unbounded)
+        """
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, key, compute):
+        """Cached value of key, computed with compute() on a miss"""
+        if key in self._entries:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+        self.misses += 1
+        value = compute()
+        self._entries[key] = value
+        if self.max_entries is not None and len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return value
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+class _Rung:
+    """One budget level: the sub-frame and the evaluation window"""
+    def __init__(self, level, budget, frame, eval_start, scale):
+        self.level = level
+        self.budget = budget
+        self.frame = frame
+        self.eval_start = eval_start
+        # 评估区间 (代码 x 交易日) 占全量的比例, 用于缩放最少交易数
+        self.scale = scale
+        self.close = frame['close'].to_numpy(dtype=np.float64)
+        self.in_window = frame['date'].values >= np.datetime64(eval_start)
+        # 缓存键的一部分: 同一缓存跨数据、跨代码抽样共享时不会取到别的子集上的指标
+        self.fingerprint = (
+            level,
+            frame['code'].nunique(),
+            frame['date'].min(),
+            frame['date'].max(),
+            int(pd.util.hash_pandas_object(frame, index=False).sum()),
+        )
+
+
+class AdaptiveSearch:
+    """
+    自适应参数搜索
+    Successive halving on code/history subsets followed by TPE-style refinement on the full universe
+    """
+    def __init__(self,
+                 strategy,
+                 space,
+                 n_configs=27,
+                 eta=3,
+                 min_budget=1 / 9,
+                 refine_trials=20,
+                 objective='mean',
+                 min_trades=20,
+                 shorten_history=True,
+                 warmup_days=60,
+                 gamma=0.25,
+                 n_candidates=64,
+                 random_state=0,
+                 cache=None):
+        """
+        strategy: 'A', 'B' or 'C'
+        space: dict of candidate value lists - 'kdj_n' / 'kdj_m1' / 'kdj_m2', 'ma_window',
+               'j_diff_threshold' (C), 'holding_days' (A) and exit rules 'stop_loss' / 'take_profit' /
+               'trailing_stop' / 'max_holding' (see ExitEngine); unlisted parameters keep DEFAULTS
+        n_configs: configurations sampled for the first rung
+        eta: keep the best 1/eta of each rung, the budget grows by eta per rung
+        min_budget: share of codes (and of trading days with shorten_history) in the first rung
+        refine_trials: TPE-style trials on the full budget after halving
+        objective: 'mean', 'median' or 'win_rate' of trade returns (see walk_forward)
+        min_trades: configurations with fewer full-budget trades score -inf (scaled down on smaller rungs)
+        shorten_history: also cut the evaluated history on small rungs (indicators still see warmup_days before it)
+        gamma: share of full-budget observations counted as good in the refinement
+        n_candidates: candidates drawn from the good distribution per refinement trial
+        cache: IndicatorCache to share between searches (entries are keyed by each rung's data fingerprint)
+        """
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown strategy: {strategy}, expected one of {list(STRATEGIES)}")
+        allowed = set(KDJ_PARAMS) | set(EXIT_PARAMS) | set(STRATEGY_PARAMS[strategy])
+        unknown = set(space) - allowed
+        if unknown:
+            raise ValueError(f"Strategy {strategy} does not accept parameters: {sorted(unknown)}")
+        if not 0 < min_budget <= 1:
+            raise ValueError("min_budget must be in (0, 1]")
+        if eta < 2:
+            raise ValueError("eta must be at least 2")
+        self.strategy = strategy
+        self.space = {name: list(values) for name, values in space.items()}
+        self.names = sorted(self.space)
+        self.n_configs = n_configs
+        self.eta = eta
+        self.min_budget = min_budget
+        self.refine_trials = refine_trials
+        self.objective = objective
+        self.min_trades = min_trades
+        self.shorten_history = shorten_history
+        self.warmup_days = warmup_days
+        self.gamma = gamma
+        self.n_candidates = n_candidates
+        self.rng = np.random.default_rng(random_state)
+        self.cache = cache if cache is not None else IndicatorCache()
+        self.ta = TechnicalAnalysis()
+        self.trials_ = None
+        self.best_ = None
+
+    # ------------------------------------------------------------ configurations
+
+    @property
+    def shape(self):
+        return tuple(len(self.space[name]) for name in self.names)
+
+    def _config(self, key):
+        """Parameter dict of a configuration key (tuple of value indices)"""
+        config = dict(DEFAULTS)
+        config.update({name: self.space[name][i] for name, i in zip(self.names, key)})
+        return config
+
+    def _sample(self, n):
+        """n distinct configuration keys, uniformly at random"""
+        total = math.prod(self.shape)
+        flat = np.arange(total) if total <= n else self.rng.choice(total, n, replace=False)
+        return [tuple(int(i) for i in key) for key in zip(*np.unravel_index(flat, self.shape))]
+
+    def budgets(self):
+        """Budget of every rung, from min_budget up to 1"""
+        n_rungs = max(int(round(math.log(1 / self.min_budget, self.eta))), 0) + 1
+        return [min(self.min_budget * self.eta ** level, 1.0) for level in range(n_rungs - 1)] + [1.0]
+
+    # ------------------------------------------------------------ data
+
+    def _rungs(self, df):
+        df = df[PRICE_COLUMNS].sort_values(['code', 'date']).reset_index(drop=True)
+        dates = np.sort(df['date'].unique())
+        # 代码打乱一次, 各档取前缀, 小预算的代码集合是大预算的子集
+        codes = self.rng.permutation(pd.unique(df['code'].values))
+        rungs = []
+        for level, budget in enumerate(self.budgets()):
+            selected = codes[:max(int(math.ceil(budget * len(codes))), 1)]
+            n_days = len(dates)
+            if self.shorten_history and budget < 1:
+                n_days = max(int(math.ceil(budget * len(dates))), 1)
+            eval_first = len(dates) - n_days
+            first = max(eval_first - self.warmup_days, 0)
+            mask = df['code'].isin(selected).values & (df['date'].values >= dates[first])
+            frame = df[mask].reset_index(drop=True)
+            scale = len(selected) / len(codes) * n_days / len(dates)
+            rungs.append(_Rung(level, budget, frame, pd.Timestamp(dates[eval_first]), scale))
+        return rungs
+
+    def _kdj_events(self, rung, n, m1, m2):
+        """J, J turns negative / positive masks and next-positive-turn positions of one KDJ setting"""
+        frame = self.ta.calculate_kdj(rung.frame, n=n, m1=m1, m2=m2)
+        j = frame['kdj_j'].to_numpy(dtype=np.float64)
+        prev_j = frame.groupby('code')['kdj_j'].shift(1).to_numpy(dtype=np.float64)
+        turns_negative = (j < 0) & (prev_j >= 0)
+        turns_positive = (j >= 0) & (prev_j < 0)
+        d2_index = self.ta.next_event_index(rung.frame, turns_positive)
+        return j, turns_negative, turns_positive, d2_index
+
+    # ------------------------------------------------------------ evaluation
+
+    def trade_returns(self, config, rung):
+        """Returns (in %) of the trades a configuration takes on one rung"""
+        kdj = tuple(config[name] for name in KDJ_PARAMS)
+        j, turns_negative, turns_positive, d2_index = self.cache.get(
+            (rung.fingerprint, 'kdj') + kdj, lambda: self._kdj_events(rung, *kdj)
+        )
+        window = config['ma_window']
+        ma = self.cache.get(
+            (rung.fingerprint, 'ma', window),
+            lambda: self.ta.calculate_ma(rung.frame, window=window).to_numpy(dtype=np.float64),
+        )
+        d1_pos = np.flatnonzero((rung.close > ma) & turns_negative & rung.in_window)
+
+        if self.strategy != 'A':
+            # B/C: 只保留有D2的D1; C 还要求 J(D2) - J(D1) 超过阈值
+            d2_pos = d2_index[d1_pos]
+            keep = d2_pos >= 0
+            if self.strategy == 'C':
+                keep &= j[np.maximum(d2_pos, 0)] - j[d1_pos] > config['j_diff_threshold']
+            d1_pos, d2_pos = d1_pos[keep], d2_pos[keep]
+        if len(d1_pos) == 0:
+            return np.array([])
+
+        if any(config[name] is not None for name in EXIT_PARAMS):
+            max_holding = config['max_holding']
+            if max_holding is None and self.strategy == 'A':
+                max_holding = config['holding_days']
+            engine = ExitEngine(stop_loss=config['stop_loss'], take_profit=config['take_profit'],
+                                trailing_stop=config['trailing_stop'], max_holding=max_holding)
+            events = None if self.strategy == 'A' else turns_positive
+            exits = engine.run(rung.frame, d1_pos, exit_events=events)
+            return exits['出场收益率'].to_numpy()
+
+        if self.strategy == 'A':
+            index = self.cache.get((rung.fingerprint, 'index'), lambda: PriceIndex(rung.frame))
+            frame = rung.frame
+            exit_pos = index.offset(frame['code'].values[d1_pos], frame['date'].values[d1_pos], config['holding_days'])
+            d1_pos, d2_pos = d1_pos[exit_pos >= 0], exit_pos[exit_pos >= 0]
+        return (rung.close[d2_pos] / rung.close[d1_pos] - 1) * 100
+
+    def evaluate(self, config, rung):
+        """
+        Score of a configuration on one rung
+
+        returns:
+            dict with score, trades and mean_return
+        """
+        returns = pd.Series(self.trade_returns(config, rung), dtype=float)
+        min_trades = max(int(math.ceil(self.min_trades * rung.scale)), 1)
+        return {
+            'score': _score(returns, self.objective, min_trades),
+            'trades': len(returns),
+            'mean_return': returns.mean() if len(returns) else np.nan,
+        }
+
+    def _trial(self, key, rung, stage):
+        started = time.perf_counter()
+        result = self.evaluate(self._config(key), rung)
+        row = {'stage': stage, 'rung': rung.level, 'budget': rung.budget}
+        row.update({name: self.space[name][i] for name, i in zip(self.names, key)})
+        row.update(result)
+        row['seconds'] = time.perf_counter() - started
+        return row
+
+    # ------------------------------------------------------------ search
+
+    def _propose(self, observed):
+        """
+        Next full-budget configuration from the good/bad split of observed (key -> score)
+        None when every configuration has been evaluated
+        """
+        total = math.prod(self.shape)
+        if len(observed) >= total:
+            return None
+        keys = list(observed)
+        scores = np.array([observed[key] for key in keys])
+        order = np.argsort(-scores, kind='stable')
+        n_good = max(int(math.ceil(self.gamma * len(keys))), 1)
+        good = np.zeros(len(keys), dtype=bool)
+        good[order[:n_good]] = True
+        good &= np.isfinite(scores)
+        values = np.array(keys, dtype=np.int64).reshape(len(keys), len(self.names))
+
+        # 每个参数按取值计数, 加1平滑, 得到好/差两组的离散分布
+        log_l, log_g, draws = [], [], []
+        for p, size in enumerate(self.shape):
+            l_counts = np.bincount(values[good, p], minlength=size) + 1.0
+            g_counts = np.bincount(values[~good, p], minlength=size) + 1.0
+            l_prob, g_prob = l_counts / l_counts.sum(), g_counts / g_counts.sum()
+            log_l.append(np.log(l_prob))
+            log_g.append(np.log(g_prob))
+            draws.append(self.rng.choice(size, self.n_candidates, p=l_prob))
+        candidates = np.stack(draws, axis=1)
+        ratio = sum(log_l[p][candidates[:, p]] - log_g[p][candidates[:, p]] for p in range(len(self.names)))
+        for row in np.argsort(-ratio, kind='stable'):
+            key = tuple(int(i) for i in candidates[row])
+            if key not in observed:
+                return key
+        # 候选都已评估过: 随机取一个未评估的组合
+        while True:
+            key = self._sample(1)[0]
+            if key not in observed:
+                return key
+
+    def run(self, df):
+        """
+        Run successive halving then the refinement
+        df: raw price frame with 'code', 'date', 'open', 'high', 'low', 'close'
+
+        returns:
+            DataFrame of every trial (stage, rung, budget, parameters, score, trades, mean_return, seconds);
+            best_ holds the best full-budget configuration
+        """
+        rungs = self._rungs(df)
+        trials = []
+        survivors = self._sample(self.n_configs)
+        full = {}
+        for rung in rungs:
+            rows = [self._trial(key, rung, 'halving') for key in survivors]
+            trials.extend(rows)
+            if rung is rungs[-1]:
+                full.update({key: row['score'] for key, row in zip(survivors, rows)})
+                break
+            order = np.argsort([-row['score'] for row in rows], kind='stable')
+            keep = max(int(math.ceil(len(survivors) / self.eta)), 1)
+            survivors = [survivors[i] for i in order[:keep]]
+
+        for _ in range(self.refine_trials):
+            key = self._propose(full)
+            if key is None:
+                break
+            row = self._trial(key, rungs[-1], 'refine')
+            trials.append(row)
+            full[key] = row['score']
+
+        self.trials_ = pd.DataFrame(trials)
+        best_key = max(full, key=lambda key: full[key])
+        self.best_ = {name: self.space[name][i] for name, i in zip(self.names, best_key)}
+        return self.trials_
+
+    def leaderboard(self, top=10):
+        """Best full-budget trials"""
+        full = self.trials_[self.trials_['budget'] == 1.0]
+        return full.sort_values('score', ascending=False).head(top).reset_index(drop=True)
@@ -0,0 +1,223 @@
+import itertools
+import inspect
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+
+"""
+滚动窗口(Walk-forward)样本外评估
+- 指标只在完整历史上计算一次 (prepare_data), 每个窗口只做切片
+- 训练窗口上选择参数 (ma_type, j_diff_threshold ...), 在随后的测试窗口上评估
+- 各折之间互不依赖, 用进程池并行执行; 指标表在每个工作进程初始化时只传一次, 任务只传折的日期边界
+"""
+
+
+def _window_slice(prepared, start, end):
+    """
+    Rows from one trading day before start through end
+    The extra leading day lets find_trading_signals see prev_j on the first day of the window.
+    """
+    dates = prepared['date'].values
+    unique_dates = np.unique(dates)
+    first = max(unique_dates.searchsorted(np.datetime64(start)) - 1, 0)
+    mask = dates >= unique_dates[first]
+    if end is not None:
+        mask &= dates <= np.datetime64(end)
+    return prepared[mask]
+
+
+def _signal_date_col(signals):
+    return 'D1日期' if 'D1日期' in signals.columns else '信号日期'
+
+
+def _evaluate(strategy, ma_type, frame, start, end, holding_days):
+    """Returns (in %) of signals whose entry date lies in [start, end]"""
+    signals = strategy.find_trading_signals(frame, ma_type=ma_type)
+    if signals.empty:
+        return signals, pd.Series(dtype=float)
+    date_col = _signal_date_col(signals)
+    entry = pd.to_datetime(signals[date_col])
+    signals = signals[(entry >= start) & (entry <= end)]
+    if signals.empty:
+        return signals, pd.Series(dtype=float)
+    if 'D1-D2收益率' in signals.columns:
+        return signals, signals['D1-D2收益率']
+    returns = strategy.calculate_returns(frame, signals, days=holding_days)
+    if returns.empty:
+        return signals, pd.Series(dtype=float)
+    return signals, returns['return']
+
+
+def _score(returns, objective, min_trades):
+    if len(returns) < min_trades:
+        return -np.inf
+    if objective == 'mean':
+        return returns.mean()
+    if objective == 'median':
+        return returns.median()
+    if objective == 'win_rate':
+        return (returns > 0).mean() * 100
+    raise ValueError(f"Unknown objective: {objective}")
+
+
+# 工作进程内的指标表, 由进程池的 initializer 设置
+_WORKER_PREPARED = None
+
+
+def _init_worker(prepared):
+    global _WORKER_PREPARED
+    _WORKER_PREPARED = prepared
+
+
+def _run_fold_in_worker(fold, *args):
+    return _run_fold(_WORKER_PREPARED, fold, *args)
+
+
+def _run_fold(prepared, fold, strategy_cls, candidates, objective, min_trades, holding_days):
+    train_frame = _window_slice(prepared, fold['train_start'], fold['train_end'])
+    # 测试窗口内入场的交易允许在窗口之后出场
+    test_frame = _window_slice(prepared, fold['test_start'], None)
+    best = None
+    for init_kwargs, ma_type in candidates:
+        strategy = strategy_cls(**init_kwargs)
+        _, returns = _evaluate(strategy, ma_type, train_frame, fold['train_start'], fold['train_end'], holding_days)
+        score = _score(returns, objective, min_trades)
+        if best is None or score > best[0]:
+            best = (score, len(returns), init_kwargs, ma_type)
+
+    train_score, train_trades, init_kwargs, ma_type = best
+    strategy = strategy_cls(**init_kwargs)
+    test_signals, test_returns = _evaluate(
+        strategy, ma_type, test_frame, fold['test_start'], fold['test_end'], holding_days
+    )
+    result = dict(fold)
+    result.update(init_kwargs)
+    result.update({
+        'ma_type': ma_type,
+        'train_score': train_score,
+        'train_trades': train_trades,
+        'test_trades': len(test_returns),
+        'test_mean_return': test_returns.mean() if len(test_returns) else np.nan,
+        'test_median_return': test_returns.median() if len(test_returns) else np.nan,
+        'test_win_rate': (test_returns > 0).mean() * 100 if len(test_returns) else np.nan,
+    })
+    test_signals = test_signals.assign(fold=fold['fold'])
+    return result, test_signals
+
+
+class WalkForward:
+    """
+    滚动窗口评估
+    Rolling train/test evaluation of a TradingStrategy class over a parameter grid
+    """
+    def __init__(self,
+                 strategy_cls,
+                 param_grid,
+                 train_days=120,
+                 test_days=20,
+                 step_days=None,
+                 objective='mean',
+                 min_trades=5,
+                 holding_days=10,
+                 n_jobs=None):
+        """
+        strategy_cls: TradingStrategyA/B/C
+        param_grid: dict of parameter lists, 'ma_type' goes to find_trading_signals,
+                    other keys (e.g. 'j_diff_threshold') to the strategy constructor
+        train_days / test_days: window lengths in trading days
+        step_days: shift between folds (default: test_days)
+        objective: 'mean', 'median' or 'win_rate' of signal returns
+        min_trades: train windows with fewer trades score -inf
+        holding_days: return horizon for strategies without a D2 exit (strategy A)
+        n_jobs: worker processes (1 runs the folds sequentially)
+        """
+        self.strategy_cls = strategy_cls
+        self.param_grid = param_grid
+        self.train_days = train_days
+        self.test_days = test_days
+        self.step_days = step_days or test_days
+        self.objective = objective
+        self.min_trades = min_trades
+        self.holding_days = holding_days
+        self.n_jobs = n_jobs
+
+    def split(self, dates):
+        """Rolling (train_start, train_end, test_start, test_end) windows over the trading dates"""
+        dates = np.sort(pd.to_datetime(pd.Series(dates)).unique())
+        folds = []
+        start = 0
+        while start + self.train_days + self.test_days <= len(dates):
+            train = dates[start:start + self.train_days]
+            test = dates[start + self.train_days:start + self.train_days + self.test_days]
+            folds.append({
+                'fold': len(folds),
+                'train_start': pd.Timestamp(train[0]),
+                'train_end': pd.Timestamp(train[-1]),
+                'test_start': pd.Timestamp(test[0]),
+                'test_end': pd.Timestamp(test[-1]),
+            })
+            start += self.step_days
+        return folds
+
+    def _candidates(self):
+        init_params = set(inspect.signature(self.strategy_cls.__init__).parameters) - {'self'}
+        grid = dict(self.param_grid)
+        ma_types = grid.pop('ma_type', ['ma20'])
+        unknown = set(grid) - init_params
+        if unknown:
+            raise ValueError(f"{self.strategy_cls.__name__} does not accept parameters: {sorted(unknown)}")
+        keys = sorted(grid)
+        candidates = []
+        for values in itertools.product(*(grid[k] for k in keys)):
+            for ma_type in ma_types:
+                candidates.append((dict(zip(keys, values)), ma_type))
+        return candidates
+
+    def run(self, df, prepared=None):
+        """
+        Run every fold
+        df: raw stock data (ignored when prepared is given)
+        prepared: frame already passed through prepare_data
+
+        returns:
+            (per-fold results, out-of-sample signals tagged with their fold)
+        """
+        candidates = self._candidates()
+        if prepared is None:
+            # 只计算一次指标
+            prepared = self.strategy_cls(**candidates[0][0]).prepare_data(df)
+        folds = self.split(prepared['date'])
+        if not folds:
+            raise ValueError("Not enough trading days for a single train/test split")
+
+        args = (self.strategy_cls, candidates, self.objective, self.min_trades, self.holding_days)
+        if self.n_jobs == 1:
+            outputs = [_run_fold(prepared, fold, *args) for fold in folds]
+        else:
+            # 每个工作进程只接收一次指标表, 各折在进程内切片, 进程间通信量与折数无关
+            with ProcessPoolExecutor(max_workers=self.n_jobs, initializer=_init_worker,
+                                     initargs=(prepared,)) as executor:
+                futures = [executor.submit(_run_fold_in_worker, fold, *args) for fold in folds]
+                outputs = [future.result() for future in futures]
+
+        results = pd.DataFrame([output[0] for output in outputs])
+        test_signals = [output[1] for output in outputs if not output[1].empty]
+        test_signals = pd.concat(test_signals, ignore_index=True) if test_signals else pd.DataFrame()
+        return results, test_signals
+
+    @staticmethod
+    def summarize(results):
+        """Print fold-by-fold choices and the pooled out-of-sample statistics"""
+        print("\n=== 滚动窗口样本外结果 ===")
+        with pd.option_context('display.width', None, 'display.max_columns', None):
+            print(results.to_string(index=False, float_format=lambda v: f'{v:.2f}'))
+        trades = results['test_trades'].sum()
+        if trades > 0:
+            weights = results['test_trades'] / trades
+            print(f"\n样本外交易总数: {trades}")
+            print(f"样本外平均收益率: {(results['test_mean_return'].fillna(0) * weights).sum():.2f}%")
+            print(f"样本外胜率: {(results['test_win_rate'].fillna(0) * weights).sum():.2f}%")
+        else:
+            print("\n样本外无交易")
@@ -1,44 +1,69 @@
+import functools
+import platform
+
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-from data_loader import DataLoader
-from strategy import TradingStrategy
-import matplotlib as mpl
-import platform
+from helper.risk import RiskEngine
+from helper.streaming_stats import OnlineCovariance, approx_qcut, shard_statistics
+from .data_loader import DataLoader
+from .strategy import TradingStrategy
+
+
+@functools.lru_cache(maxsize=None)
+def _plotting():
+    """
+    Import matplotlib/seaborn and apply the chart style on first use
 
-# 设置matplotlib中文字体
-if platform.system() == 'Windows':
-    plt.rcParams['font.sans-serif'] = ['SimHei']  # Windows系统
-elif platform.system() == 'Linux':
-    plt.rcParams['font.sans-serif'] = ['DejaVu Sans']  # Linux系统
-elif platform.system() == 'Darwin':
-    plt.rcParams['font.sans-serif'] = ['Arial Unicode MS']  # macOS系统
-plt.rcParams['axes.unicode_minus'] = False  # 用来正常显示负号
+    returns:
+        (pyplot, seaborn)
+    """
+    import matplotlib.pyplot as plt
+    import seaborn as sns
 
-# 设置seaborn样式
-sns.set_style("whitegrid")
-sns.set_context("paper", font_scale=1.5)
+    # 设置matplotlib中文字体
+    if platform.system() == 'Windows':
+        plt.rcParams['font.sans-serif'] = ['SimHei']  # Windows系统
+    elif platform.system() == 'Linux':
+        plt.rcParams['font.sans-serif'] = ['DejaVu Sans']  # Linux系统
+    elif platform.system() == 'Darwin':
+        plt.rcParams['font.sans-serif'] = ['Arial Unicode MS']  # macOS系统
+    plt.rcParams['axes.unicode_minus'] = False  # 用来正常显示负号
+
+    # 设置seaborn样式
+    sns.set_style("whitegrid")
+    sns.set_context("paper", font_scale=1.5)
+    return plt, sns
 
 class MetricsAnalyzer:
     def __init__(self, signals_df):
         self.signals = signals_df
         
-    def analyze_correlations(self):
-        """分析各指标与收益率的相关性"""
+    def analyze_correlations(self, covariance=None):
+        """
+        分析各指标与收益率的相关性
+        covariance: 全量信号上累加的 OnlineCovariance, 或逐个产出信号分片的可迭代对象
+                    (helper/streaming_stats.py), 不需要全部信号同时在内存中; 不传时直接用 self.signals
+        """
         # 选择需要分析的指标
         metrics = ['D1_J值', 'D2_J值', 'D1_WR14', 'D2_WR14', 'D1_WR28', 'D2_WR28']
+        columns = metrics + ['D1-D2收益率']
         
-        # 计算相关性
-        corr_data = self.signals[metrics + ['D1-D2收益率']]
-        correlation = corr_data.corr()['D1-D2收益率'].sort_values()
+        # 计算相关性, 相关矩阵只算一次, 打印与热图共用
+        if covariance is None:
+            corr_matrix = self.signals[columns].corr()
+        else:
+            if not isinstance(covariance, OnlineCovariance):
+                covariance, _ = shard_statistics(covariance, columns)
+            corr_matrix = covariance.correlation().loc[columns, columns]
+        correlation = corr_matrix['D1-D2收益率'].sort_values()
         
         print("\n=== 指标与收益率的相关性分析 ===")
         print(correlation)
         
         # 绘制相关性热图
+        plt, sns = _plotting()
         plt.figure(figsize=(12, 10))
-        sns.heatmap(corr_data.corr(), annot=True, cmap='coolwarm', center=0, fmt='.2f')
+        sns.heatmap(corr_matrix, annot=True, cmap='coolwarm', center=0, fmt='.2f')
         plt.title('指标相关性热图', pad=20, fontsize=16)
         plt.tight_layout()
         plt.savefig('correlation_heatmap.png', dpi=300, bbox_inches='tight')
@@ -76,6 +101,7 @@ class MetricsAnalyzer:
         print(wr28_analysis)
         
         # 绘制箱线图
+        plt, sns = _plotting()
         plt.figure(figsize=(15, 7))
         
         plt.subplot(1, 2, 1)
@@ -96,12 +122,18 @@ class MetricsAnalyzer:
         plt.savefig('wr_returns_boxplot.png', dpi=300, bbox_inches='tight')
         plt.close()
         
-    def analyze_by_j_value(self):
-        """分析J值与收益率的关系"""
+    def analyze_by_j_value(self, j_digest=None):
+        """
+        分析J值与收益率的关系
+        j_digest: 全量数据的 TDigest (helper/streaming_stats.py), 传入时按其分位点分组,
+                  分片分析时各分片使用同一组边界
+        """
+        labels = ['极低', '较低', '中等', '较高', '极高']
         # 将J值分组
-        self.signals['D1_J值_Range'] = pd.qcut(self.signals['D1_J值'], q=5, labels=[
-            '极低', '较低', '中等', '较高', '极高'
-        ])
+        if j_digest is None:
+            self.signals['D1_J值_Range'] = pd.qcut(self.signals['D1_J值'], q=5, labels=labels)
+        else:
+            self.signals['D1_J值_Range'] = approx_qcut(self.signals['D1_J值'], j_digest, q=5, labels=labels)
         
         # 分析不同J值区间的收益率
         j_analysis = self.signals.groupby('D1_J值_Range').agg({
@@ -114,6 +146,7 @@ class MetricsAnalyzer:
         print(j_analysis)
         
         # 绘制J值与收益率的散点图
+        plt, sns = _plotting()
         plt.figure(figsize=(12, 8))
         plt.scatter(self.signals['D1_J值'], self.signals['D1-D2收益率'], alpha=0.5)
         plt.xlabel('D1日J值', fontsize=12)
@@ -123,6 +156,84 @@ class MetricsAnalyzer:
         plt.savefig('j_value_returns_scatter.png', dpi=300, bbox_inches='tight')
         plt.close()
         
+    def analyze_by_volatility(self, vol_col='D1_年化波动率'):
+        """分析D1日波动率与收益率的关系 (波动率列由helper/risk.py的RiskEngine.attach_to_signals添加)"""
+        if vol_col not in self.signals.columns:
+            print(f"\n缺少波动率列 {vol_col}, 跳过波动率分析")
+            return
+
+        # 将波动率分组
+        self.signals['D1_波动率_Range'] = pd.qcut(self.signals[vol_col], q=5, labels=[
+            '极低', '较低', '中等', '较高', '极高'
+        ])
+
+        vol_analysis = self.signals.groupby('D1_波动率_Range').agg({
+            'D1-D2收益率': ['count', 'mean', 'std', 'median'],
+            '持仓天数': 'mean',
+            vol_col: ['min', 'max']
+        })
+
+        print("\n=== 波动率区间收益率分析 ===")
+        print(vol_analysis)
+
+        # 波动率调整后的收益率
+        self.signals['D1-D2风险调整收益率'] = self.signals['D1-D2收益率'] / (self.signals[vol_col] * 100)
+        print(f"\n平均风险调整收益率: {self.signals['D1-D2风险调整收益率'].mean():.4f}")
+
+        plt, sns = _plotting()
+        plt.figure(figsize=(12, 8))
+        plt.scatter(self.signals[vol_col], self.signals['D1-D2收益率'], alpha=0.5)
+        plt.xlabel('D1日年化波动率', fontsize=12)
+        plt.ylabel('D1-D2收益率 (%)', fontsize=12)
+        plt.title('波动率与收益率的关系', pad=20, fontsize=16)
+        plt.grid(True)
+        plt.savefig('volatility_returns_scatter.png', dpi=300, bbox_inches='tight')
+        plt.close()
+
+    def analyze_excursions(self):
+        """分析持仓期间的MAE/MFE (列由helper/excursion.py的add_excursions或策略的excursions=True添加)"""
+        if 'MAE' not in self.signals.columns:
+            print("\n缺少MAE/MFE列, 跳过偏移分析")
+            return
+
+        returns = self.signals['D1-D2收益率']
+        print("\n=== 持仓期间价格偏移 (MAE/MFE) ===")
+        print(self.signals[['MAE', 'MFE', 'MFE用时', '最大回撤', 'D1-D2收益率']].describe().round(2))
+
+        # MFE兑现比例: 出场收益占最大浮盈的比例 (MFE很小时比例极端, 用中位数)
+        capture = (returns / self.signals['MFE']).where(self.signals['MFE'] > 0)
+        print(f"\nMFE兑现比例中位数: {capture.median():.2%}")
+
+        # 盈利/亏损交易的MAE对比, 用于设定止损距离
+        winners = self.signals[returns > 0]
+        losers = self.signals[returns <= 0]
+        print(f"盈利交易平均MAE: {winners['MAE'].mean():.2f}%  亏损交易平均MAE: {losers['MAE'].mean():.2f}%")
+        for stop in (1, 2, 3, 5):
+            stopped = self.signals['MAE'] <= -stop
+            print(f"止损 {stop}%: 触发 {stopped.mean():.2%}, 其中原本盈利 {(stopped & (returns > 0)).sum()} 笔")
+
+        plt, sns = _plotting()
+        plt.figure(figsize=(15, 7))
+
+        plt.subplot(1, 2, 1)
+        plt.scatter(self.signals['MAE'], returns, alpha=0.5)
+        plt.xlabel('MAE (%)', fontsize=12)
+        plt.ylabel('D1-D2收益率 (%)', fontsize=12)
+        plt.title('最大不利偏移与收益率', pad=20, fontsize=14)
+        plt.grid(True)
+
+        plt.subplot(1, 2, 2)
+        plt.scatter(self.signals['MFE'], returns, alpha=0.5)
+        plt.plot([0, self.signals['MFE'].max()], [0, self.signals['MFE'].max()], 'r--', linewidth=1)
+        plt.xlabel('MFE (%)', fontsize=12)
+        plt.ylabel('D1-D2收益率 (%)', fontsize=12)
+        plt.title('最大有利偏移与收益率', pad=20, fontsize=14)
+        plt.grid(True)
+
+        plt.tight_layout()
+        plt.savefig('excursion_scatter.png', dpi=300, bbox_inches='tight')
+        plt.close()
+
     def analyze_combined_signals(self):
         """分析J值和WR指标组合条件下的收益率"""
         def get_combined_signal(row):
@@ -142,6 +253,7 @@ class MetricsAnalyzer:
         print(combined_analysis)
         
         # 绘制组合信号的箱线图
+        plt, sns = _plotting()
         plt.figure(figsize=(14, 8))
         sns.boxplot(x='Combined_Signal', y='D1-D2收益率', data=self.signals)
         plt.title('组合信号收益率分布', pad=20, fontsize=16)
@@ -171,6 +283,8 @@ def main():
     if len(signals) > 0:
         # 添加股票名称
         signals = pd.merge(signals, hs300_constituents[['code', 'code_name']], on='code', how='left')
+        # D1日的EWMA年化波动率
+        signals = RiskEngine(prepared_data).attach_to_signals(signals)
         
         # 创建分析器并进行分析
         analyzer = MetricsAnalyzer(signals)
@@ -179,13 +293,16 @@ def main():
         analyzer.analyze_correlations()
         analyzer.analyze_by_wr_zones()
         analyzer.analyze_by_j_value()
+        analyzer.analyze_by_volatility()
+        analyzer.analyze_excursions()
         analyzer.analyze_combined_signals()
         
         print("\n分析结果已保存为图表文件：")
         print("1. correlation_heatmap.png - 指标相关性热图")
         print("2. wr_returns_boxplot.png - WR指标区间收益率分布")
         print("3. j_value_returns_scatter.png - J值与收益率散点图")
-        print("4. combined_signals_boxplot.png - 组合信号收益率分布")
+        print("4. volatility_returns_scatter.png - 波动率与收益率散点图")
+        print("5. combined_signals_boxplot.png - 组合信号收益率分布")
     else:
         print("\n未找到交易信号，无法进行分析")
 
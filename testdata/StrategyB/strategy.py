@@ -1,6 +1,6 @@
 import pandas as pd
 import numpy as np
-from technical_analysis import TechnicalAnalysis
+from .technical_analysis import TechnicalAnalysis
 
 class TradingStrategy:
     def __init__(self):
@@ -1,13 +1,17 @@
 import pandas as pd
 import numpy as np
-from technical_analysis import TechnicalAnalysis
+from helper.trading_calendar import TradingCalendar
+from .technical_analysis import TechnicalAnalysis
 
 class TradingStrategy:
     def __init__(self):
         self.ta = TechnicalAnalysis()
+        self.calendar = None
 
     def convert_to_weekly(self, df):
-        df['week'] = pd.to_datetime(df['date']).dt.to_period('W').dt.start_time
+        # 交易周由交易日历划分, 周K线的日期为该周第一个交易日 (节假日顺延), 所有股票边界一致
+        self.calendar = TradingCalendar.from_data(df)
+        df['week'] = self.calendar.week_start(df['date'])
         df_weekly = df.groupby(['code', 'week']).agg({
             'open': 'first',
             'high': 'max',
@@ -56,7 +60,7 @@ class TradingStrategy:
                     'D1_60周均线': signal['ma60'],
                     'D1_J值': signal['kdj_j'],
                     'D2_J值': d2['kdj_j'],
-                    '持仓周数': (d2['date'] - d1_date).days // 7
+                    '持仓周数': int(self.calendar.week_id([d2['date']])[0] - self.calendar.week_id([d1_date])[0])
                 }
                 results.append(result)
 
@@ -1,5 +1,6 @@
 import pandas as pd
 import numpy as np
+from helper.trading_calendar import TradingCalendar
 
 class TechnicalAnalysis:
     @staticmethod
@@ -17,6 +18,8 @@ class TechnicalAnalysis:
         period: 'daily' or 'weekly'
         """
         df = df.copy()
+        # 周线按交易日历的交易周分组, 与 convert_to_weekly 的边界一致
+        calendar = TradingCalendar.from_data(df) if period == 'weekly' else None
         
         # Group by code to calculate KDJ for each stock
         for code in df['code'].unique():
@@ -25,8 +28,8 @@ class TechnicalAnalysis:
             
             if period == 'weekly':
                 # Convert to weekly data
-                df_stock = df_stock.set_index('date')
-                df_weekly = df_stock.resample('W').agg({
+                df_stock['week_start'] = calendar.week_start(df_stock['date'])
+                df_weekly = df_stock.groupby('week_start').agg({
                     'open': 'first',
                     'high': 'max',
                     'low': 'min',
@@ -60,25 +63,15 @@ class TechnicalAnalysis:
                 
                 # Create weekly KDJ DataFrame
                 df_weekly_kdj = pd.DataFrame({
-                    'date': df_weekly['date'],
+                    'week_start': df_weekly['week_start'],
                     'kdj_k': k,
                     'kdj_d': d,
                     'kdj_j': j
                 })
                 
-                # Merge weekly KDJ back to daily data
-                df_stock = df_stock.reset_index()
-                df_stock['week_start'] = df_stock['date'].dt.to_period('W').dt.start_time
-                df_weekly_kdj['week_start'] = df_weekly_kdj['date'].dt.to_period('W').dt.start_time
-                
-                # Merge and fill forward
-                df_stock = pd.merge(df_stock, df_weekly_kdj[['week_start', 'kdj_k', 'kdj_d', 'kdj_j']], 
-                                  on='week_start', how='left')
-                
-                # Fill forward any missing values
-                df_stock['kdj_k'] = df_stock['kdj_k'].fillna(method='ffill')
-                df_stock['kdj_d'] = df_stock['kdj_d'].fillna(method='ffill')
-                df_stock['kdj_j'] = df_stock['kdj_j'].fillna(method='ffill')
+                # Merge weekly KDJ back to daily data (every trading day belongs to one trading week)
+                df_stock = df_stock.drop(columns=['kdj_k', 'kdj_d', 'kdj_j'], errors='ignore').reset_index(drop=True)
+                df_stock = pd.merge(df_stock, df_weekly_kdj, on='week_start', how='left')
                 
                 # Update the original DataFrame
                 df.loc[mask, 'kdj_k'] = df_stock['kdj_k'].values
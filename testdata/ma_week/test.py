@@ -1,6 +1,6 @@
 import pandas as pd
-from data_loader import DataLoader
-from strategy import TradingStrategy
+from .data_loader import DataLoader
+from .strategy import TradingStrategy
 import os
 
 def main():
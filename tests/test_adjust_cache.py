@@ -0,0 +1,38 @@
+import pandas as pd
+
+from helper.data_loader import DataLoader
+
+
+def _write_inputs(root):
+    dates = pd.bdate_range('2025-01-02', periods=20)
+    rows = []
+    for i, code in enumerate(['sh.600000', 'sh.600001', 'sz.000001']):
+        for d, date in enumerate(dates):
+            price = 10.0 + i + d * 0.1
+            rows.append({'date': date.strftime('%Y-%m-%d'), 'code': code, 'open': price, 'high': price + 0.2,
+                         'low': price - 0.2, 'close': price, 'preclose': price - 0.1, 'volume': 1000})
+    prices = root / 'prices.csv'
+    pd.DataFrame(rows).to_csv(prices, index=False)
+    factors = root / 'factors.csv'
+    pd.DataFrame({'code': ['sh.600000', 'sz.000001'], 'date': [dates[10].strftime('%Y-%m-%d')] * 2,
+                  'ratio': [1.1, 1.2]}).to_csv(factors, index=False)
+    return str(prices), str(factors)
+
+
+def test_partial_load_keeps_other_codes_cached(tmp_path):
+    prices, factors = _write_inputs(tmp_path)
+    loader = DataLoader(prices, None, factors, adjust='qfq', cache_dir=str(tmp_path / 'cache'))
+    full = loader.load_stock_data()
+    assert loader.last_adjust_stats['recomputed'] == 3
+
+    loader.load_stock_data(codes=['sh.600001'])
+    assert loader.last_adjust_stats == {'codes': 1, 'reused': 1, 'recomputed': 0}
+
+    # 部分加载后再全量加载: 内存缓存和磁盘缓存都还保留全部股票
+    again = loader.load_stock_data()
+    assert loader.last_adjust_stats['recomputed'] == 0
+    pd.testing.assert_frame_equal(full.reset_index(drop=True), again.reset_index(drop=True))
+
+    reloaded = DataLoader(prices, None, factors, adjust='qfq', cache_dir=str(tmp_path / 'cache'))
+    reloaded.load_stock_data()
+    assert reloaded.last_adjust_stats['recomputed'] == 0
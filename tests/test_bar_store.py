@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from helper.bar_store import BarStore
+
+
+def _bars(n_codes=12, n_days=60, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range('2025-01-02', periods=n_days)
+    frames = [pd.DataFrame({'code': f'sh.6{i:05d}', 'date': dates, 'close': rng.normal(10, 1, n_days),
+                            'volume': rng.integers(0, 1000, n_days)}) for i in range(n_codes)]
+    # 乱序写入, 分片内仍按 (代码, 时间) 排序
+    return pd.concat(frames, ignore_index=True).sample(frac=1, random_state=seed)
+
+
+@pytest.mark.parametrize('compression', ['zlib', None])
+@pytest.mark.parametrize('codes, start, end', [
+    (None, None, None),
+    (['sh.600003'], None, None),
+    (['sh.600001', 'sh.600007', 'sh.699999'], '2025-01-20', '2025-02-14'),
+    (None, '2025-02-03', None),
+    (['sh.600002', 'sh.600010'], None, '2025-01-10'),
+    (['sh.600002'], '2025-06-01', None),
+])
+def test_read_matches_frame_filter(tmp_path, compression, codes, start, end):
+    df = _bars()
+    store = BarStore(str(tmp_path), n_buckets=4, partition='M', compression=compression, time_col='date')
+    store.write(df)
+
+    expected = df
+    if codes is not None:
+        expected = expected[expected['code'].isin(codes)]
+    if start is not None:
+        expected = expected[expected['date'] >= pd.Timestamp(start)]
+    if end is not None:
+        expected = expected[expected['date'] <= pd.Timestamp(end)]
+    result = store.read(codes=codes, start=start, end=end)
+    expected = expected.sort_values(['code', 'date']).reset_index(drop=True)
+    result = result.sort_values(['code', 'date']).reset_index(drop=True)
+    pd.testing.assert_frame_equal(result[expected.columns], expected, check_dtype=False)
@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+
+from helper.bitset import BitmapStore, event_bitmaps
+from helper.rules import RuleSet
+
+
+def _prepared(n_codes=3, n_days=40, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range('2025-01-02', periods=n_days)
+    frames = []
+    for i in range(n_codes):
+        close = 10 * np.cumprod(1 + rng.normal(0, 0.02, n_days))
+        frames.append(pd.DataFrame({
+            'code': f'sh.60000{i}', 'date': dates, 'close': close,
+            'ma5': pd.Series(close).rolling(5).mean().values,
+            'kdj_j': rng.normal(10, 30, n_days),
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+def test_event_bitmaps_fill_the_callers_empty_store():
+    df = _prepared()
+    store = BitmapStore.from_data(df)
+    assert event_bitmaps(df, ma_types=('ma5',), store=store) is store
+    assert sorted(store) == ['D1_ma5', 'above_ma5', 'j_turns_negative', 'j_turns_positive']
+    prev_j = df.groupby('code')['kdj_j'].shift(1).values
+    expected = (df['close'].values > df['ma5'].values) & (df['kdj_j'].values < 0) & (prev_j >= 0)
+    assert (store['D1_ma5'].to_mask(df) == expected).all()
+
+
+def test_rule_bitmaps_fill_the_callers_empty_store():
+    df = _prepared()
+    store = BitmapStore.from_data(df)
+    rules = RuleSet({'above': 'close > ma5'})
+    assert rules.bitmaps(df, store=store) is store
+    assert list(store) == ['above']
+    assert (store['above'].to_mask(df) == (df['close'] > df['ma5']).values).all()
@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+
+from helper.exits import ExitEngine
+
+
+def _frame(n_codes=4, n_days=30, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range('2025-01-02', periods=n_days)
+    frames = []
+    for i in range(n_codes):
+        close = 10 * np.cumprod(1 + rng.normal(0, 0.02, n_days))
+        frames.append(pd.DataFrame({
+            'code': f'sh.60000{i}', 'date': dates, 'open': close, 'high': close * 1.01,
+            'low': close * 0.99, 'close': close,
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+def test_unlimited_holding_never_reports_expiry():
+    df = _frame()
+    entry_pos = np.arange(0, len(df), 3)
+    exits = ExitEngine(max_holding=None).run(df, entry_pos)
+    assert (exits['出场原因'] == '到期').sum() == 0
+    assert (exits['出场原因'] == '数据结束').all()
+    # 没有触发条件时持有到各自股票的最后一根K线
+    last = df.groupby('code').cumcount(ascending=False).values
+    assert (exits['出场持仓交易日'].values == last[entry_pos]).all()
+
+
+def test_holding_limit_reports_expiry():
+    df = _frame()
+    exits = ExitEngine(max_holding=5).run(df, np.array([0, 30, 27]))
+    assert list(exits['出场原因']) == ['到期', '到期', '数据结束']
+    assert list(exits['出场持仓交易日']) == [5, 5, 2]
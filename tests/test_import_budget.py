@@ -0,0 +1,67 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+"""
+导入耗时预算
+- 在全新的子进程中导入每个 CLI / worker 模块, 统计 import 语句的累计耗时 (解释器启动不计入)
+- 预算宽松 (默认 3000ms, 环境变量 IMPORT_BUDGET_MS 可改), 只拦截明显的回退; 超出时多测几次取最快的一次
+- 只应按需加载的重依赖 (绘图库、聚宽SDK、numba) 在导入后不能出现在 sys.modules 中
+"""
+
+MODULES = (
+    'helper.main',
+    'helper.strategy',
+    'helper.sweep',
+    'helper.service',
+    'helper.walk_forward',
+    'helper.lazy',
+    'helper.jq_trading.data_utils',
+)
+LAZY_DEPENDENCIES = ('matplotlib', 'seaborn', 'jqdatasdk', 'numba')
+BUDGET_MS = float(os.environ.get('IMPORT_BUDGET_MS', 3000))
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_PROBE = (
+    "import importlib, json, sys, time; started = time.perf_counter(); importlib.import_module({module!r}); "
+    "print(json.dumps({{'ms': (time.perf_counter() - started) * 1000, "
+    "'lazy': sorted(m for m in {lazy!r} if m in sys.modules)}}))"
+)
+
+
+def _slowest(stderr, module, top=3):
+    """Slowest (module, cumulative_ms) rows of -X importtime output"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, name = line[len('import time:'):].split('|')
+        if name.strip() != module:
+            rows.append((name.strip(), int(cumulative_us) / 1000))
+    return sorted(rows, key=lambda row: -row[1])[:top]
+
+
+def _measure(module):
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', _PROBE.format(module=module, lazy=LAZY_DEPENDENCIES)],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    assert result.returncode == 0, f"{module} failed to import: {result.stderr.strip().splitlines()[-1:]}"
+    probe = json.loads(result.stdout.strip().splitlines()[-1])
+    probe['slowest'] = _slowest(result.stderr, module)
+    return probe
+
+
+@pytest.mark.parametrize('module', MODULES)
+def test_import_budget(module):
+    runs = [_measure(module)]
+    # 冷缓存或机器繁忙时的单次超时不算, 取最快的一次
+    while runs[-1]['ms'] > BUDGET_MS and len(runs) < 3:
+        runs.append(_measure(module))
+    best = min(runs, key=lambda run: run['ms'])
+    slowest = ', '.join(f"{name} {ms:.0f}ms" for name, ms in best['slowest'])
+    assert best['ms'] <= BUDGET_MS, f"{module}: {best['ms']:.0f}ms > budget {BUDGET_MS:.0f}ms (slowest: {slowest})"
+    assert best['lazy'] == [], f"{module} imports {', '.join(best['lazy'])} at import time"
@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+
+from helper.risk import RiskEngine
+
+LAM, WARMUP = 0.94, 20
+
+
+def _prices(n_codes=4, n_days=80, seed=0, gaps=True):
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range('2025-01-02', periods=n_days)
+    frames = []
+    for i in range(n_codes):
+        close = 10 * np.cumprod(1 + rng.normal(0.001 * i, 0.02, n_days))
+        frame = pd.DataFrame({'code': f'sh.60000{i}', 'date': dates, 'close': close})
+        if gaps and i == 1:
+            # 停牌: 缺几天行情 (其中一段在初始化窗口内)
+            frame = frame.drop(index=[5, 6, 40, 41, 42])
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+
+def _reference(returns, lam, warmup):
+    """Zero-mean EWMA covariance per pair from pandas ewm over the cross products"""
+    returns = returns.iloc[1:]
+    out = {}
+    for a in returns.columns:
+        for b in returns.columns:
+            product = returns[a] * returns[b]
+            seed = product.iloc[:warmup].mean()
+            series = pd.concat([pd.Series([seed]), product.iloc[warmup:].reset_index(drop=True)], ignore_index=True)
+            # ignore_na: 有缺失的日子该配对不更新
+            ewm = series.ewm(alpha=1 - lam, adjust=False, ignore_na=True).mean()
+            out[a, b] = ewm.iloc[1:].set_axis(returns.index[warmup:])
+    return out
+
+
+def test_covariance_matches_pandas_ewm_with_missing_returns():
+    engine = RiskEngine(_prices())
+    assert engine.returns.isna().iloc[1:].any().any()
+    reference = _reference(engine.returns, LAM, WARMUP)
+    snapshots = list(engine.iter_covariance(lam=LAM, warmup=WARMUP))
+    assert len(snapshots) == len(engine.returns) - 1 - WARMUP
+    for snap in snapshots:
+        for (a, b), series in reference.items():
+            assert np.isclose(snap.covariance.loc[a, b] / 252, series.loc[snap.date], rtol=1e-10, atol=0)
+
+
+def test_diagonal_matches_ewm_variance_without_gaps():
+    engine = RiskEngine(_prices(gaps=False))
+    returns = engine.returns.iloc[1:]
+    snap = engine.snapshot(returns.index[-1], lam=LAM, warmup=WARMUP)
+    # 零均值种子: 不减样本均值
+    seed = returns.iloc[:WARMUP].pow(2).mean()
+    for code in returns.columns:
+        squares = pd.concat([pd.Series([seed[code]]), returns[code].iloc[WARMUP:] ** 2], ignore_index=True)
+        expected = squares.ewm(alpha=1 - LAM, adjust=False).mean().iloc[-1]
+        assert np.isclose(snap.volatility[code] ** 2 / 252, expected, rtol=1e-10)
+
+
+def test_requested_dates_and_resume_match_daily_recursion():
+    engine = RiskEngine(_prices())
+    daily = {snap.date: snap.covariance for snap in engine.iter_covariance(lam=LAM, warmup=WARMUP)}
+    dates = list(daily)
+    # 跳跃的快照日期 (块更新) 与续算状态都应与逐日递推一致
+    sparse = RiskEngine(_prices())
+    for date in (dates[3], dates[30], dates[-1]):
+        snap = sparse.snapshot(date, lam=LAM, warmup=WARMUP)
+        assert np.allclose(snap.covariance.values, daily[date].values, rtol=1e-12, atol=0)
+
+
+def test_attach_to_signals_uses_signal_date_volatility():
+    engine = RiskEngine(_prices())
+    vol = engine.ewma_volatility()
+    date = vol.index[30]
+    signals = pd.DataFrame({'code': ['sh.600000', 'sh.600002'], 'D1日期': [date.strftime('%Y-%m-%d')] * 2})
+    attached = engine.attach_to_signals(signals)
+    assert np.allclose(attached['D1_年化波动率'].values, vol.loc[date, ['sh.600000', 'sh.600002']].values)
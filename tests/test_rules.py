@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from helper.rules import RuleSet, RuleSyntaxError
+from helper.technical_analysis import TechnicalAnalysis
+
+
+def _prepared(n_codes=10, n_days=150, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range('2025-01-02', periods=n_days)
+    frames = []
+    for i in range(n_codes):
+        close = 10 * np.cumprod(1 + rng.normal(0, 0.03, n_days))
+        frames.append(pd.DataFrame({
+            'code': f'sh.60000{i}', 'date': dates, 'open': close, 'high': close * 1.02,
+            'low': close * 0.98, 'close': close,
+        }))
+    df = pd.concat(frames, ignore_index=True)
+    df['ma20'] = TechnicalAnalysis.calculate_ma(df, window=20)
+    df = TechnicalAnalysis.calculate_kdj(df)
+    df['prev_j'] = df.groupby('code')['kdj_j'].shift(1)
+    return df
+
+
+def _evaluate(df, expression):
+    return RuleSet({'rule': expression}).evaluate(df)['rule'].values
+
+
+def test_d1_rule_matches_strategy_mask():
+    df = _prepared()
+    d1 = ((df['close'] > df['ma20']) & (df['kdj_j'] < 0) & (df['prev_j'] >= 0)).values
+    assert d1.any()
+    assert (_evaluate(df, 'close > ma(20) & cross_below(kdj_j, 0)') == d1).all()
+    assert (_evaluate(df, 'close > ma20 and kdj_j < 0 and prev(kdj_j) >= 0') == d1).all()
+
+
+def test_prev_of_condition_is_a_mask():
+    df = _prepared()
+    above = df['close'] > df['ma20']
+    prev_above = above.groupby(df['code']).shift(1, fill_value=False).astype(bool)
+    expected = (prev_above & (df['kdj_j'] < 0)).values
+    assert (_evaluate(df, 'prev(close > ma20) & kdj_j < 0') == expected).all()
+    # 每只股票第一行没有前值, 条件为 False 而不是 NaN
+    first = df.groupby('code').cumcount().values == 0
+    assert not _evaluate(df, 'prev(close > 0)')[first].any()
+    assert (_evaluate(df, '~prev(close > ma20)') == ~prev_above.values).all()
+
+
+@pytest.mark.parametrize('expression', [
+    '~kdj_j',
+    'kdj_j & close > ma20',
+    'close > ma20 | 1',
+    '(close > ma20) > 0',
+    '(close > ma20) + 1',
+    'abs(close > ma20)',
+    'date > 3',
+    'code == 1',
+])
+def test_type_errors(expression):
+    with pytest.raises(RuleSyntaxError):
+        _evaluate(_prepared(n_codes=2, n_days=30), expression)
@@ -0,0 +1,118 @@
+import os
+import threading
+import time
+
+from helper.sweep import STATES, SweepQueue, _read_json, _write_json
+
+
+def _make_queue(root, n_tasks, max_attempts=3, age=None):
+    """Queue with n_tasks pending tasks, their files aged by `age` seconds"""
+    queue = SweepQueue(str(root))
+    for state in STATES:
+        os.makedirs(queue._state_dir(state), exist_ok=True)
+    os.makedirs(queue.results_dir, exist_ok=True)
+    _write_json(queue.spec_path, {'max_attempts': max_attempts})
+    for i in range(n_tasks):
+        task_id = f'p{i:04d}-s000'
+        path = queue._task_path('pending', task_id)
+        _write_json(path, {'task_id': task_id, 'point': {}, 'shard': 0, 'codes': [], 'attempts': 0, 'errors': []})
+        if age is not None:
+            stamp = time.time() - age
+            os.utime(path, (stamp, stamp))
+    return queue
+
+
+def _expire(queue, task_id, age=3600):
+    """Make a running task look abandoned: old claimed_at and old heartbeat"""
+    path = queue._task_path('running', task_id)
+    task = _read_json(path)
+    stamp = time.time() - age
+    task['claimed_at'] = stamp
+    _write_json(path, task)
+    os.utime(path, (stamp, stamp))
+    return task
+
+
+def _locations(queue, task_id):
+    return [state for state in STATES if os.path.exists(queue._task_path(state, task_id))]
+
+
+def test_concurrent_claims_of_stale_pending_tasks(tmp_path):
+    # pending 文件比租约还旧: 领取后不能被同时运行的 requeue_expired 当成过期
+    queue = _make_queue(tmp_path, 200, age=3600)
+    claims = {0: [], 1: []}
+    requeued = []
+    done = threading.Event()
+
+    def claimer(worker):
+        while True:
+            task = queue.claim(f'w{worker}')
+            if task is None:
+                return
+            claims[worker].append(task['task_id'])
+
+    def requeuer():
+        while not done.is_set():
+            requeued.extend(queue.requeue_expired(lease_seconds=60))
+
+    threads = [threading.Thread(target=claimer, args=(w,)) for w in claims]
+    watcher = threading.Thread(target=requeuer)
+    watcher.start()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    done.set()
+    watcher.join()
+
+    claimed = claims[0] + claims[1]
+    assert requeued == []
+    assert len(claimed) == len(set(claimed)) == 200
+    for task_id in claimed:
+        assert _locations(queue, task_id) == ['running']
+    assert queue.status() == {'pending': 0, 'running': 200, 'done': 0, 'failed': 0}
+
+
+def test_expired_task_requeued_once(tmp_path):
+    queue = _make_queue(tmp_path, 50)
+    for _ in range(50):
+        assert queue.claim('dead') is not None
+    for task_id in queue._task_ids('running'):
+        _expire(queue, task_id)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(queue.requeue_expired(lease_seconds=60)))
+               for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    requeued = [task_id for ids in results for task_id in ids]
+    assert sorted(requeued) == queue._task_ids()
+    assert queue.status() == {'pending': 50, 'running': 0, 'done': 0, 'failed': 0}
+    for task_id in requeued:
+        assert _locations(queue, task_id) == ['pending']
+        assert queue._task_ids('running') == []
+
+
+def test_fresh_claim_not_requeued(tmp_path):
+    queue = _make_queue(tmp_path, 1, age=3600)
+    task = queue.claim('w0')
+    assert queue.requeue_expired(lease_seconds=60) == []
+    assert _locations(queue, task['task_id']) == ['running']
+
+
+def test_move_after_losing_race_does_not_recreate(tmp_path):
+    queue = _make_queue(tmp_path, 1, max_attempts=5)
+    task = queue.claim('w0')
+    _expire(queue, task['task_id'])
+    assert queue.requeue_expired(lease_seconds=60) == [task['task_id']]
+
+    # 原 worker 稍后报告失败: 文件已被移走, 不能在 running 中重新出现
+    assert queue.fail(task, 'late error') is False
+    assert _locations(queue, task['task_id']) == ['pending']
+
+    requeued = queue.claim('w1')
+    assert requeued['attempts'] == 1
+    assert requeued['worker'] == 'w1'
@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+
+from helper.tuning import AdaptiveSearch, IndicatorCache
+
+SPACE = {'kdj_n': [5, 9], 'ma_window': [5, 10], 'j_diff_threshold': [0, 10, 20]}
+
+
+def _frame(n_codes=12, n_days=120, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range('2025-01-02', periods=n_days)
+    frames = []
+    for i in range(n_codes):
+        close = 10 * np.cumprod(1 + rng.normal(0, 0.03, n_days))
+        frames.append(pd.DataFrame({
+            'code': f'sh.6{i:05d}', 'date': dates, 'open': close, 'high': close * 1.02,
+            'low': close * 0.98, 'close': close,
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+def _search(cache=None):
+    return AdaptiveSearch('C', SPACE, n_configs=6, refine_trials=2, min_trades=1, warmup_days=20, cache=cache)
+
+
+def test_empty_cache_is_shared():
+    shared = IndicatorCache()
+    assert _search(shared).cache is shared
+
+
+def test_shared_cache_does_not_leak_between_data():
+    shared = IndicatorCache()
+    _search(shared).run(_frame(seed=0))
+    filled = len(shared)
+    assert filled > 0
+
+    other = _frame(seed=1)
+    reused = _search(shared).run(other)
+    fresh = _search().run(other)
+    pd.testing.assert_frame_equal(reused.drop(columns='seconds'), fresh.drop(columns='seconds'))
+    # 新数据上的缓存项是新增的, 不会命中上一次搜索的条目
+    assert len(shared) > filled
+
+
+def test_repeated_run_matches_fresh_search():
+    df = _frame()
+    search = _search()
+    search.run(df)
+    # 第二次 run 的随机状态已前进, 抽到的代码子集不同, 不能复用第一次的指标
+    fresh = _search()
+    fresh.rng.bit_generator.state = search.rng.bit_generator.state
+    again = search.run(df)
+    expected = fresh.run(df)
+    pd.testing.assert_frame_equal(again.drop(columns='seconds'), expected.drop(columns='seconds'))
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from helper.walk_forward import WalkForward
+
+
+class _FixedReturnStrategy:
+    """Every row is a D1 signal returning `edge` %, or its negative after `flip_date`"""
+    def __init__(self, edge=1.0, flip_date=None):
+        self.edge = edge
+        self.flip_date = flip_date
+
+    def find_trading_signals(self, df, ma_type='ma20'):
+        returns = np.full(len(df), float(self.edge))
+        if self.flip_date is not None:
+            returns[df['date'].values >= np.datetime64(self.flip_date)] *= -1
+        return pd.DataFrame({'code': df['code'].values, 'D1日期': df['date'].values, 'D1-D2收益率': returns})
+
+
+def _prepared(n_codes=2, n_days=30):
+    dates = pd.bdate_range('2025-01-02', periods=n_days)
+    return pd.DataFrame({'code': np.repeat([f'sh.60000{i}' for i in range(n_codes)], n_days),
+                         'date': np.tile(dates, n_codes), 'close': 10.0})
+
+
+def test_split_rolls_by_step():
+    dates = pd.bdate_range('2025-01-02', periods=10)
+    folds = WalkForward(_FixedReturnStrategy, {}, train_days=4, test_days=2).split(np.tile(dates, 3))
+    assert len(folds) == 3
+    assert [f['fold'] for f in folds] == [0, 1, 2]
+    for i, fold in enumerate(folds):
+        # 默认步长等于测试窗口
+        start = 2 * i
+        assert (fold['train_start'], fold['train_end']) == (dates[start], dates[start + 3])
+        assert (fold['test_start'], fold['test_end']) == (dates[start + 4], dates[start + 5])
+
+    folds = WalkForward(_FixedReturnStrategy, {}, train_days=4, test_days=2, step_days=3).split(dates)
+    assert [f['train_start'] for f in folds] == [dates[0], dates[3]]
+
+
+def test_split_too_short_raises():
+    walk = WalkForward(_FixedReturnStrategy, {}, train_days=20, test_days=20)
+    assert walk.split(pd.bdate_range('2025-01-02', periods=30)) == []
+    with pytest.raises(ValueError):
+        walk.run(None, prepared=_prepared())
+
+
+@pytest.mark.parametrize('n_jobs', [1, 2])
+def test_selects_on_train_and_scores_out_of_sample(n_jobs):
+    prepared = _prepared()
+    dates = np.sort(prepared['date'].unique())
+    flip = pd.Timestamp(dates[15])
+    # 收益在翻转日之后变号: 训练窗口在翻转前的折选 edge=3, 训练窗口含翻转后行情的折选 edge=1
+    grid = {'edge': [1.0, 3.0], 'flip_date': [flip]}
+    walk = WalkForward(_FixedReturnStrategy, grid, train_days=10, test_days=5, min_trades=1, n_jobs=n_jobs)
+    results, signals = walk.run(None, prepared=prepared)
+
+    assert list(results['fold']) == [0, 1, 2, 3]
+    # 第2折训练窗口前后各半, 两组得分同为0, 保留先出现的组合
+    assert list(results['edge']) == [3.0, 3.0, 1.0, 1.0]
+    assert list(results['train_trades']) == [20] * 4
+    assert list(results['test_trades']) == [10] * 4
+    # 第0折的测试窗口 (10~14) 在翻转前
+    assert list(results['test_mean_return']) == [3.0, -3.0, -1.0, -1.0]
+    for fold in results.itertuples():
+        entries = pd.to_datetime(signals.loc[signals['fold'] == fold.fold, 'D1日期'])
+        assert entries.min() == fold.test_start and entries.max() == fold.test_end